@@ -0,0 +1,59 @@
+'''
+Compares the speed of parsing.plain_text with wikitextparser's plain_text(), and how closely the word counts that find_frequencies gets from each agree.
+
+Run from the repository root, for example:
+python -m benchmarks.plain_text pages-0.xml --max-pages 10000
+'''
+
+import argparse
+import itertools
+import time
+
+import wikitextparser
+
+import find_frequencies
+import parsing.etree_helpers
+import parsing.plain_text
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('pages_path', help='Path of the pages file to take a sample of pages from.')
+	parser.add_argument('-p', '--max-pages', default=10 ** 4, type=int, help='Only use this many pages of the file. Defaults to 10,000.')
+	args = parser.parse_args()
+
+	texts = [page.text for page in itertools.islice(parsing.etree_helpers.iter_pages(args.pages_path, ('text',)), args.max_pages) if page.text]
+	print(f'{len(texts):,} pages ({sum(len(text) for text in texts):,} characters)')
+
+	start = time.perf_counter()
+	reference = []
+	failures = 0
+	for text in texts:
+		try:
+			reference.append(wikitextparser.parse(text).plain_text())
+		except IndexError:
+			reference.append(None)
+			failures += 1
+	report('wikitextparser', time.perf_counter() - start, texts)
+	if failures:
+		print(f'wikitextparser failed on {failures:,} pages, which are left out of the comparisons below')
+
+	for fidelity in parsing.plain_text.FIDELITIES:
+		start = time.perf_counter()
+		results = [parsing.plain_text.plain_text(text, fidelity) for text in texts]
+		report(f'parsing.plain_text ({fidelity})', time.perf_counter() - start, texts)
+		shared = 0
+		total = 0
+		for expected, result in zip(reference, results):
+			if expected is None:
+				continue
+			expected_words = find_frequencies.count_words(expected)
+			result_words = find_frequencies.count_words(result)
+			shared += (expected_words & result_words).total()
+			total += (expected_words | result_words).total()
+		print(f'  Word agreement with wikitextparser: {shared / total if total else 1:.2%}')
+
+def report(name: str, duration: float, texts: list[str]) -> None:
+	print(f'{name}: {duration:.2f} s ({len(texts) / duration:,.0f} pages/s)')
+
+if __name__ == '__main__':
+	main()
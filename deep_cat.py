@@ -45,10 +45,7 @@ def deep_cat_filter(
 		) -> set[int] | set[str]:
 	if verbose:
 		print('Looking for pages and subcategories in selected categories...')
-	pages: set[int] | set[str] = set()
-	for cat_id in select_cats:
-		pages |= cat_master.descendant_pages(cat_id, titles=return_titles)
-	return pages
+	return cat_master.descendant_pages(select_cats, titles=return_titles, max_depth=max_depth)
 
 def deep_cat_filter_slow(
 		categories_path: str,
@@ -57,34 +54,22 @@ def deep_cat_filter_slow(
 		max_depth: int = -1,
 		verbose: bool = False
 		) -> set[int] | set[str]:
+	'''Like deep_cat_filter, but reads the categories file twice instead of loading it into memory. Only the links between categories and their subcategories are kept in memory.'''
 	if verbose:
-		print('Looking for pages and subcategories in specified categories:')
-	# collect subcats to process in the next round
-	next_cats = set()
-	# avoid reselecting cats we have seen already
-	ever_selected_cats = select_cats.copy()
-	# collect non-cat pages that are in selected cats
-	select_pages = set()
-
-	depth = 0
-	while select_cats and (max_depth < 0 or depth <= max_depth):
-		if verbose:
-			print('', '-' * 10, f'Round {depth}', '-' * 10, sep='\n')
-		for cat_link in parsing.parse_cats.cats_gen(categories_path):
-			if cat_link.cat_id in select_cats:
-				if cat_link.page_ns == parsing.parse_cats.CAT_NAMESPACE_ID:
-					if cat_link.page_id not in ever_selected_cats:
-						next_cats.add(cat_link.page_id)
-						ever_selected_cats.add(cat_link.page_id)
-						print(cat_link.page_title)
-				elif return_titles:
-					select_pages.add(cat_link.page_title)
-				else:
-					select_pages.add(cat_link.page_id)
-		select_cats = next_cats
-		next_cats = set()
-		depth += 1
+		print('Reading subcategories...')
+	subcats: dict[int, list[int]] = collections.defaultdict(list)
+	for cat_link in parsing.parse_cats.cats_gen(categories_path):
+		if cat_link.page_ns == parsing.parse_cats.CAT_NAMESPACE_ID:
+			subcats[cat_link.cat_id].append(cat_link.page_id)
+	cats = parsing.parse_cats.descendants(select_cats, lambda cat_id: subcats.get(cat_id, ()), max_depth)
+	del subcats
 
+	if verbose:
+		print(f'Looking for pages in {len(cats):,} categories...')
+	select_pages: set[int] | set[str] = set()
+	for cat_link in parsing.parse_cats.cats_gen(categories_path):
+		if cat_link.cat_id in cats and cat_link.page_ns != parsing.parse_cats.CAT_NAMESPACE_ID:
+			select_pages.add(cat_link.page_title if return_titles else cat_link.page_id)
 	return select_pages
 
 if __name__ == '__main__':
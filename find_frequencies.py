@@ -1,61 +1,147 @@
 import argparse
 import collections
+import collections.abc
+import contextlib
+import functools
 import json
+import os
 import re
+import shutil
 import string
+import tempfile
+import typing
 
 import wikitextparser
 
+import parsing.checkpoint
 import parsing.etree_helpers
+import parsing.external_sort
+import parsing.page_pool
+import parsing.plain_text
 
 VERBOSE_FACTOR = 10 ** 4
+PAGE_FIELDS = ('id', 'text')
 VALID_CHARS = string.ascii_letters + string.digits + "'"
 WORD_BOUNDARY_PATTERN = '[ ' + string.punctuation.replace("'", '') + ']+'
+STRIPPERS = ('wikitextparser', *parsing.plain_text.FIDELITIES)
 
 def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument('pages_path', help='The pages file to read words from. It is recommended that ns.py be used to get just pages in namespaces 0 and 114 (Translation).')
-	parser.add_argument('-g', '--ids_path', help='A text file containing page IDs, one per line, which should have their words counted. If given all other pages will be ignored.')
+	parser.add_argument('-g', '--ids_path', help='A text file containing page IDs, one per line, which should have their words counted. If given all other pages will be ignored. Otherwise the words of every page are counted.')
 	parser.add_argument('-l', '--lowercase', action='store_true', help='Convert all words to lowercase before counting them, to avoid words at the beginning of sentences or in titles from being counted separately.')
 	parser.add_argument('output_path', help='The JSON file in which to write the word counts.')
+	parser.add_argument('-s', '--stripper', choices=STRIPPERS, default='wikitextparser', help="How to convert wikitext to plain text before counting words. 'wikitextparser' uses its plain_text() method, which is the most faithful but by far the slowest. 'text' and 'markup' use parsing.plain_text at that fidelity, which is several times faster and gives nearly the same counts. Defaults to wikitextparser.")
+	parser.add_argument('-j', '--jobs', default=1, type=int, help='The number of processes to use to count words. Defaults to 1.')
+	parser.add_argument('-m', '--max-words', default=parsing.external_sort.DEFAULT_MAX_ITEMS, type=int, help=f'The number of distinct words each process may hold in memory before writing its counts to a temporary file. Lower this if memory runs out. Defaults to {parsing.external_sort.DEFAULT_MAX_ITEMS:,}.')
+	parser.add_argument('-t', '--temp-dir', help='The directory in which to create the temporary directory holding counts that do not fit in memory. Defaults to the system temporary directory.')
+	parser.add_argument('--checkpoint-path', help='Path of a file in which to periodically save the counts so far, so that counting can be resumed with --resume if it is interrupted. Counts that do not fit in memory are kept in a directory next to it (with ".spill" appended to its name) rather than in a temporary directory.')
+	parser.add_argument('--resume', action='store_true', help='Resume from the checkpoint at --checkpoint-path (if it exists).')
 	parser.add_argument('-v', '--verbose', action='store_true')
 	args = parser.parse_args()
+	if args.resume and not args.checkpoint_path:
+		parser.error('--resume requires --checkpoint-path')
 
-	with open(args.ids_path, encoding='utf-8') as ids_file:
-		good_ids = [int(line) for line in ids_file]
+	good_ids = None
+	if args.ids_path:
+		with open(args.ids_path, encoding='utf-8') as ids_file:
+			good_ids = {int(line) for line in ids_file}
 
-	frequencies = collections.Counter()
-	total_words = 0
-	for count, page in enumerate(parsing.etree_helpers.pages_gen(args.pages_path)):
-		try:
-			page_id = int(parsing.etree_helpers.find_child(page, 'id').text)
-			if page_id not in good_ids:
-				continue
-			raw_text = parsing.etree_helpers.find_child(parsing.etree_helpers.find_child(page, 'revision'), 'text').text
-			if not raw_text:
-				continue
-			try:
-				text = wikitextparser.parse(raw_text).plain_text()
-			# Raised by the 24-10-20 dump
-			except IndexError:
-				continue
-			valid_words = []
-			for word in re.split(WORD_BOUNDARY_PATTERN, text):
-				word = word.strip("'")
-				if word and all(ch in VALID_CHARS for ch in word):
-					valid_words.append(word.casefold() if args.lowercase else word)
-					total_words += 1
-			frequencies.update(valid_words)
-		# Just to catch continues
-		finally:
-			page.clear()
-			if count % VERBOSE_FACTOR == 0:
-				print(f'{count:,}')
+	checkpoint = None
+	if args.checkpoint_path:
+		checkpoint = parsing.checkpoint.Checkpoint(args.checkpoint_path, args.pages_path, args.resume)
+		if args.verbose and checkpoint.resumed:
+			print(f'Resuming from byte {checkpoint.offset:,} of the pages file...')
+		# The spilled counts must survive a crash for the checkpoint to be resumed
+		os.makedirs(args.checkpoint_path + '.spill', exist_ok=True)
+		spill_context = contextlib.nullcontext(args.checkpoint_path + '.spill')
+	else:
+		spill_context = tempfile.TemporaryDirectory(dir=args.temp_dir)
+
+	with spill_context as spill_dir:
+		page_func = functools.partial(count_page_words, good_ids=good_ids, lowercase=args.lowercase, stripper=args.stripper)
+		combine = functools.partial(add_counts, spill_dir=spill_dir, max_words=args.max_words)
+		# Each shard's counts are written to a run before being sent back from its worker, so that the counts of shards waiting to be combined are not held in memory
+		finish_shard = functools.partial(spill_counts, spill_dir=spill_dir, max_words=args.max_words)
+		frequencies = parsing.page_pool.reduce_pages(args.pages_path, page_func, combine, jobs=args.jobs, verbose_factor=VERBOSE_FACTOR if args.verbose else 0, fields=PAGE_FIELDS, checkpoint=checkpoint, finish_shard=finish_shard) or collections.Counter()
+		frequencies = as_spilling_counter(frequencies, spill_dir, args.max_words)
+		if args.verbose:
+			print('Sorting words by frequency:')
+		# Sort by descending frequency, writing the words that do not fit in memory to runs. The runs of the counts are kept if the checkpoint refers to them.
+		by_frequency = parsing.external_sort.external_sort(frequencies.items(delete=not checkpoint), spill_dir, key=frequency_key, max_items=args.max_words)
+		with open(args.output_path, 'w', encoding='utf-8') as out_file:
+			total_words = write_frequencies(by_frequency, out_file)
+	if checkpoint:
+		shutil.rmtree(args.checkpoint_path + '.spill')
+		checkpoint.finish()
 	print(f'Total words counted: {total_words:,}')
 
-	with open(args.output_path, 'w', encoding='utf-8') as out_file:
-		frequencies = {k: v for k, v in sorted(frequencies.items(), key=lambda item: item[1], reverse=True)}
-		json.dump(frequencies, out_file, indent='\t')
+def count_page_words(
+		page: parsing.etree_helpers.Page,
+		good_ids: collections.abc.Container[int] | None = None,
+		lowercase: bool = False,
+		stripper: str = 'wikitextparser'
+		) -> collections.Counter | None:
+	if good_ids is not None and page.id not in good_ids:
+		return None
+	if not page.text:
+		return None
+	return count_words(wikitext_to_plain_text(page.text, stripper), lowercase)
+
+def wikitext_to_plain_text(wikitext: str, stripper: str = 'wikitextparser') -> str:
+	if stripper != 'wikitextparser':
+		return parsing.plain_text.plain_text(wikitext, stripper)
+	try:
+		return wikitextparser.parse(wikitext).plain_text()
+	# Raised by the 24-10-20 dump. Rather than losing the page, fall back on the fast stripper.
+	except IndexError:
+		return parsing.plain_text.plain_text(wikitext)
+
+def count_words(text: str, lowercase: bool = False) -> collections.Counter:
+	valid_words = collections.Counter()
+	for word in re.split(WORD_BOUNDARY_PATTERN, text):
+		word = word.strip("'")
+		if word and all(ch in VALID_CHARS for ch in word):
+			valid_words[word.casefold() if lowercase else word] += 1
+	return valid_words
+
+def as_spilling_counter(counts: collections.Counter | parsing.external_sort.SpillingCounter, spill_dir: str, max_words: int) -> parsing.external_sort.SpillingCounter:
+	if isinstance(counts, parsing.external_sort.SpillingCounter):
+		return counts
+	spilling_counts = parsing.external_sort.SpillingCounter(spill_dir, max_words)
+	spilling_counts.update(counts)
+	return spilling_counts
+
+def add_counts(
+		total: collections.Counter | parsing.external_sort.SpillingCounter,
+		counts: collections.Counter | parsing.external_sort.SpillingCounter,
+		spill_dir: str,
+		max_words: int
+		) -> parsing.external_sort.SpillingCounter:
+	'''Adds the word counts of a page or shard to the total, which spills to spill_dir once it has more than max_words words.'''
+	total = as_spilling_counter(total, spill_dir, max_words)
+	total.update(counts)
+	return total
+
+def spill_counts(counts: collections.Counter | parsing.external_sort.SpillingCounter, spill_dir: str, max_words: int) -> parsing.external_sort.SpillingCounter:
+	'''Writes all of the word counts of a shard to a run, so that only the path of the run needs to be sent between processes.'''
+	counts = as_spilling_counter(counts, spill_dir, max_words)
+	counts.spill()
+	return counts
+
+def frequency_key(item: tuple[str, int]) -> tuple[int, str]:
+	return -item[1], item[0]
+
+def write_frequencies(frequencies: collections.abc.Iterable[tuple[str, int]], out_file: typing.TextIO) -> int:
+	'''Writes (word, count) pairs to out_file as a JSON object (formatted as by json.dump with indent='\\t') without holding them all in memory, and returns the total of the counts.'''
+	total_words = 0
+	separator = '{\n\t'
+	for word, count in frequencies:
+		out_file.write(f'{separator}{json.dumps(word)}: {count}')
+		separator = ',\n\t'
+		total_words += count
+	out_file.write('\n}' if total_words else '{}')
+	return total_words
 
 if __name__ == '__main__':
 	main()
@@ -1,22 +1,55 @@
 import argparse
 import collections
+import collections.abc
+import functools
+import itertools
+import operator
 import re
+import tempfile
+import typing
 
 import wikitextparser
 
+import parsing.checkpoint
 import parsing.etree_helpers
+import parsing.external_sort
+import parsing.extract_cache
+import parsing.page_index
+import parsing.page_pool
 
 VERBOSE_FACTOR = 10 ** 5
+PAGE_FIELDS = ('id', 'title', 'text')
+# Increase this whenever a change to find_page_prons changes its results, to invalidate cached results
+EXTRACT_VERSION = '1'
 HMP_ALIASES = ['hmp', 'homophone', 'homophones']
+# Records from find_page_language_prons are sorted by language, pronunciation and title, keeping the order of records with all three equal
+RECORD_KEY = operator.itemgetter(0, 1, 2)
 
 def main() -> None:
 	parser = argparse.ArgumentParser()
 	parser.add_argument('pages_path')
 	parser.add_argument('output_path')
 	parser.add_argument('-i', '--target-ids-path')
+	parser.add_argument('-k', '--page-index-path', help='Path of an index of the pages file, as produced by parsing.page_index. If given (along with --target-ids-path), only the target pages are read from the pages file, rather than the whole file.')
+	parser.add_argument('-j', '--jobs', default=1, type=int, help='The number of processes to use to parse pages. Defaults to 1.')
+	parser.add_argument('--extract-cache-path', help='Path of an SQLite file in which to cache the pronunciations and listed homophones found in each page, keyed by page ID and revision SHA-1. (It will be created if it does not exist.) When this script is run again, only pages that have changed since are parsed.')
+	parser.add_argument('-a', '--all-languages', action='store_true', help='Find homophones in every language, comparing only pronunciations in the same language section. The pronunciations are sorted through temporary files rather than held in memory, so memory use stays bounded however many languages there are. Cannot be used with --checkpoint-path.')
+	parser.add_argument('-m', '--max-records', default=parsing.external_sort.DEFAULT_MAX_ITEMS, type=int, help=f'With --all-languages, the number of pronunciations that may be held in memory before sorting them and writing them to a temporary file. Lower this if memory runs out. Defaults to {parsing.external_sort.DEFAULT_MAX_ITEMS:,}.')
+	parser.add_argument('-t', '--temp-dir', help='The directory in which to create the temporary directory holding the pronunciations sorted with --all-languages. Defaults to the system temporary directory.')
+	parser.add_argument('--checkpoint-path', help='Path of a file in which to periodically save the pronunciations found so far, so that reading the pages can be resumed with --resume if it is interrupted. Cannot be used with --page-index-path or --all-languages.')
+	parser.add_argument('--resume', action='store_true', help='Resume from the checkpoint at --checkpoint-path (if it exists).')
 	parser.add_argument('-v', '--verbose', action='store_true')
 	args = parser.parse_args()
 
+	if args.page_index_path and not args.target_ids_path:
+		raise ValueError('--page-index-path requires --target-ids-path')
+	if args.checkpoint_path and args.page_index_path:
+		raise ValueError('--checkpoint-path cannot be used with --page-index-path')
+	if args.checkpoint_path and args.all_languages:
+		raise ValueError('--checkpoint-path cannot be used with --all-languages')
+	if args.resume and not args.checkpoint_path:
+		raise ValueError('--resume requires --checkpoint-path')
+	target_ids = None
 	if args.target_ids_path:
 		with open(args.target_ids_path, encoding='utf-8') as target_ids_file:
 			target_ids = {int(line) for line in target_ids_file}
@@ -26,52 +59,103 @@ def main() -> None:
 	# Maps prons to homophone data
 	# Homophone data maps each term with the specified pronunciation to the set of other terms that are already listed as its homophones
 	prons_to_titles: dict[str, dict[str, set[str]]] = collections.defaultdict(dict)
-	for count, page in enumerate(parsing.etree_helpers.pages_gen(args.pages_path)):
-		try:
-			if args.target_ids_path:
-				page_id = int(parsing.etree_helpers.find_child(page, 'id').text)
-				if page_id not in target_ids:
-					continue
-			title = parsing.etree_helpers.find_child(page, 'title').text
-			text = parsing.etree_helpers.find_child(parsing.etree_helpers.find_child(page, 'revision'), 'text').text
-			wikitext = wikitextparser.parse(text)
-			pron_sections = [sec for sec in wikitext.sections if 3 <= sec.level <= 4 and sec.title.strip() == 'Pronunciation']
-			for section in pron_sections:
-				existing_hmps: set[str] = set()
-				for temp in section.templates:
-					if temp.normal_name().casefold() in HMP_ALIASES:
-							for arg in temp.arguments[1:]:
-								if arg.positional:
-									hmp = arg.value
-									if '<' in hmp:
-										hmp = re.sub(r'<.*?>', '', hmp)
-									existing_hmps.add(hmp)
-				for temp in section.templates:
-					if temp.normal_name().casefold() == 'ipa':
-						prons = [arg.value for arg in temp.arguments[1:] if arg.positional]
-						for pron in prons:
-							if not (pron.startswith('/') and pron.endswith('/')):
-								continue
-							pron = pron[1:-1]
-							if pron.startswith('-') or pron.endswith('-'):
-								continue
-							prons_to_titles[pron][title] = existing_hmps
-		finally:
-			page.clear()
-			if args.verbose and count % VERBOSE_FACTOR == 0:
-				print(f'{count:,}')
+	checkpoint = None
+	if args.checkpoint_path:
+		checkpoint = parsing.checkpoint.Checkpoint(args.checkpoint_path, args.pages_path, args.resume)
+		if checkpoint.resumed:
+			if args.verbose:
+				print(f'Resuming from byte {checkpoint.offset:,} of the pages file...')
+			prons_to_titles = checkpoint.state
+		checkpoint.get_state = lambda: prons_to_titles
+	find_func = find_page_language_prons if args.all_languages else find_page_prons
+	page_func = functools.partial(find_func, target_ids=target_ids)
+	verbose_factor = VERBOSE_FACTOR if args.verbose else 0
+	if args.extract_cache_path:
+		page_filter = functools.partial(parsing.extract_cache.page_in, ids=target_ids) if target_ids is not None else None
+		task = 'find_homophones all languages' if args.all_languages else 'find_homophones'
+		results = parsing.extract_cache.map_cached_pages(args.pages_path, find_func, args.extract_cache_path, task, EXTRACT_VERSION, page_filter, args.jobs, verbose_factor, PAGE_FIELDS, args.page_index_path, target_ids, checkpoint)
+	elif args.page_index_path:
+		results = parsing.page_index.map_indexed_pages(args.page_index_path, args.pages_path, target_ids, page_func, fields=PAGE_FIELDS, verbose_factor=verbose_factor)
+	else:
+		results = parsing.page_pool.map_pages(args.pages_path, page_func, jobs=args.jobs, verbose_factor=verbose_factor, fields=PAGE_FIELDS, checkpoint=checkpoint)
+	if args.all_languages:
+		with tempfile.TemporaryDirectory(dir=args.temp_dir) as spill_dir:
+			records = (record for page_prons in results for record in page_prons)
+			sorted_records = parsing.external_sort.external_sort(records, spill_dir, key=RECORD_KEY, max_items=args.max_records)
+			if args.verbose:
+				print('Comparing pronunciations...')
+			with open(args.output_path, 'w', encoding='utf-8') as out_file:
+				# Only the titles with one pronunciation in one language are held in memory at once
+				for (language, pron), group in itertools.groupby(sorted_records, key=operator.itemgetter(0, 1)):
+					write_homophones(language, pron, {title: existing_hmps for _, _, title, existing_hmps in group}, out_file)
+		return
+
+	for page_prons in results:
+		for pron, title, existing_hmps in page_prons:
+			prons_to_titles[pron][title] = existing_hmps
 
 	if args.verbose:
 		print('Comparing pronunciations...')
 	with open(args.output_path, 'w', encoding='utf-8') as out_file:
 		for pron, titles_to_existing_hmps in prons_to_titles.items():
-			all_hmps = set(titles_to_existing_hmps.keys())
-			for title, existing_hmps in titles_to_existing_hmps.items():
-				good_hmps = all_hmps.copy()
-				good_hmps.remove(title)
-				good_hmps -= existing_hmps
-				if good_hmps:
-					print(f'# [[{title}#English|{title}]] ({{{{ic|/{pron}/}}}}): ' + ', '.join(f'[[{hmp}#English|{hmp}]]' for hmp in good_hmps), file=out_file)
+			write_homophones('English', pron, titles_to_existing_hmps, out_file)
+	if checkpoint:
+		checkpoint.finish()
+
+def write_homophones(language: str, pron: str, titles_to_existing_hmps: dict[str, set[str]], out_file: typing.TextIO) -> None:
+	'''Writes a line for each term with a pronunciation that lists the other terms with it that are not already listed as its homophones.'''
+	all_hmps = set(titles_to_existing_hmps.keys())
+	for title, existing_hmps in titles_to_existing_hmps.items():
+		good_hmps = all_hmps.copy()
+		good_hmps.remove(title)
+		good_hmps -= existing_hmps
+		if good_hmps:
+			print(f'# [[{title}#{language}|{title}]] ({{{{ic|/{pron}/}}}}): ' + ', '.join(f'[[{hmp}#{language}|{hmp}]]' for hmp in good_hmps), file=out_file)
+
+def find_page_prons(page: parsing.etree_helpers.Page, target_ids: collections.abc.Container[int] | None = None) -> list[tuple[str, str, set[str]]] | None:
+	'''
+	Returns a (pronunciation, title, existing homophones) tuple for each phonemic pronunciation in a page, or None if the page is not one of target_ids.
+	'''
+	if target_ids is not None:
+		if page.id not in target_ids:
+			return None
+	return section_prons(wikitextparser.parse(page.text), page.title)
+
+def find_page_language_prons(page: parsing.etree_helpers.Page, target_ids: collections.abc.Container[int] | None = None) -> list[tuple[str, str, str, set[str]]] | None:
+	'''
+	Returns a (language, pronunciation, title, existing homophones) tuple for each phonemic pronunciation in each language section of a page, or None if the page is not one of target_ids.
+	'''
+	if target_ids is not None:
+		if page.id not in target_ids:
+			return None
+	wikitext = wikitextparser.parse(page.text)
+	return [(lang_sec.title.strip(), *pron) for lang_sec in wikitext.get_sections(level=2) for pron in section_prons(lang_sec, page.title)]
+
+def section_prons(wikitext: wikitextparser.WikiText, title: str) -> list[tuple[str, str, set[str]]]:
+	'''Returns a (pronunciation, title, existing homophones) tuple for each phonemic pronunciation in the Pronunciation sections of a page or section.'''
+	pron_sections = [sec for sec in wikitext.sections if 3 <= sec.level <= 4 and sec.title.strip() == 'Pronunciation']
+	page_prons = []
+	for section in pron_sections:
+		existing_hmps: set[str] = set()
+		for temp in section.templates:
+			if temp.normal_name().casefold() in HMP_ALIASES:
+					for arg in temp.arguments[1:]:
+						if arg.positional:
+							hmp = arg.value
+							if '<' in hmp:
+								hmp = re.sub(r'<.*?>', '', hmp)
+							existing_hmps.add(hmp)
+		for temp in section.templates:
+			if temp.normal_name().casefold() == 'ipa':
+				prons = [arg.value for arg in temp.arguments[1:] if arg.positional]
+				for pron in prons:
+					if not (pron.startswith('/') and pron.endswith('/')):
+						continue
+					pron = pron[1:-1]
+					if pron.startswith('-') or pron.endswith('-'):
+						continue
+					page_prons.append((pron, title, existing_hmps))
+	return page_prons
 
 if __name__ == '__main__':
 	main()
@@ -6,14 +6,21 @@ This script is to generate such a list for my Canadian accent of English.
 
 import argparse
 import collections.abc
+import functools
 import re
 import xml.etree.ElementTree as xet
 
 import wikitextparser
 
 import parsing.etree_helpers
+import parsing.extract_cache
+import parsing.page_index
+import parsing.page_pool
 
 VERBOSE_FACTOR = 10 ** 5
+PAGE_FIELDS = ('id', 'title', 'text')
+# Increase this whenever a change to find_entry_prons changes its results, to invalidate cached results
+EXTRACT_VERSION = '1'
 
 # I've chosen to hardcode these accents rather than making them command line arguments only because I don't want to bother create appropriate replacements for other accents that I don't plan to use
 TARGET_ACCENTS = {'Canada', 'CA', 'General American', 'GA', 'GenAm', 'United States', 'US'}
@@ -22,6 +29,7 @@ DIPHONEMES = {'aɪ', 'aʊ', 'eɪ', 'oʊ', 'ɔɪ'}
 ACCENT_REPLACEMENTS = {'ʌ': 'ə', 'əʊ': 'oʊ', 'ɒ': 'ɑ', 'ɝ': 'ɚ', 'ɪə': 'ɪɚ', '(ɹ)': 'ɹ'}
 # Based on https://youtu.be/gtnlGH055TA but adjusted to match a North American accent
 LINDSEY_REPLACEMENTS = {'i': 'ij', 'u': 'uw', 'eɪ': 'ej', 'ɔɪ': 'ɔj', 'oʊ': 'ow', 'aɪ': 'aj', 'aʊ': 'aw'}
+LINDSEY_PATTERN = '|'.join(old for old in LINDSEY_REPLACEMENTS)
 # The only ASCII char in NON_RHYME_CHARS is a space, even though others may appear to be ASCII
 EXTRANEOUS_CHARS = {
 	'.', # Full stop for syllable boundaries
@@ -44,56 +52,70 @@ def main():
 	parser.add_argument('pronunciation_path', help='Path of the text file in which to write the valid pronunciations.')
 	parser.add_argument('full_output_path', help='Path of the file in which to list the title of each entry containing pronunciations, with the pronunciations found in that entry. This is useful when determining what entry a valid pronunciation came from, or why a pronunciation you thought would appear did not.')
 	parser.add_argument('-i', '--ids-path', help='Path of a file containing the IDs of entries that should be parsed to find pronunciations. All other pages are ignored. This can be used in with the output of deep_cat or find_terms to avoid parsing pages that do not have any English pronunciations.')
+	parser.add_argument('-k', '--page-index-path', help='Path of an index of the pages file, as produced by parsing.page_index. If given (along with --ids-path), only the entries with the given IDs are read from the pages file, rather than the whole file.')
 	parser.add_argument('-l', '--lindsey-glides', action='store_true', help='Automatically add glides to create more accurate transcriptions, as described in Dr Geoff Lindsey\'s video here: https://youtu.be/gtnlGH055TA')
 	parser.add_argument('-w', '--warnings', action='store_true')
+	parser.add_argument('-j', '--jobs', default=1, type=int, help='The number of processes to use to parse pages. Defaults to 1.')
+	parser.add_argument('--extract-cache-path', help='Path of an SQLite file in which to cache the pronunciations found in each page, keyed by page ID and revision SHA-1. (It will be created if it does not exist.) When this script is run again, only pages that have changed since are parsed.')
 	parser.add_argument('-v', '--verbose', action='store_true')
 	args = parser.parse_args()
 
+	if args.page_index_path and not args.ids_path:
+		raise ValueError('--page-index-path requires --ids-path')
+	target_ids = None
 	if args.ids_path:
 		with open(args.ids_path, encoding='utf-8') as ids_file:
 			target_ids = {int(line) for line in ids_file}
-	if args.lindsey_glides:
-		LINDSEY_PATTERN = '|'.join(old for old in LINDSEY_REPLACEMENTS)
-		LINDSEY_SUB_FUNC: collections.abc.Callable[[re.Match], str] = lambda old: LINDSEY_REPLACEMENTS[old[0]]
 
 	prons: set[str] = set()
+	page_func = functools.partial(find_entry_prons, target_ids=target_ids, lindsey_glides=args.lindsey_glides, warnings=args.warnings)
 	with open(args.full_output_path, 'w', encoding='utf-8') as full_output_file:
-		for count, page in enumerate(parsing.etree_helpers.pages_gen(args.input_path)):
-			try:
-				if args.ids_path:
-					page_id = int(parsing.etree_helpers.find_child(page, 'id').text)
-					if page_id not in target_ids:
-						continue
-				page_title = parsing.etree_helpers.find_child(page, 'title').text
-				text = parsing.etree_helpers.find_child(parsing.etree_helpers.find_child(page, 'revision'), 'text').text
-				wikitext = wikitextparser.parse(text)
-				pron_sections = (sec for sec in wikitext.sections if 3 <= sec.level <= 4 and sec.title == 'Pronunciation')
-				entry_prons: set[str] = set()
-				for section in pron_sections:
-					pron_lists = section.get_lists(pattern=UNORDERED_LIST_PATTERN)
-					for lis in pron_lists:
-						section_prons = prons_from_wikilist(lis,word=page_title if args.warnings else None, accents=TARGET_ACCENTS)
-						if args.lindsey_glides:
-							section_lindsey_prons: set[str] = set()
-							for pron in section_prons:
-								section_lindsey_prons.add(re.sub(LINDSEY_PATTERN, LINDSEY_SUB_FUNC, pron))
-							section_prons = section_lindsey_prons
-						# Lexica does not permit very short or long words
-						section_prons = {pron for pron in section_prons if 3 <= len(pron) <= 9}
-						entry_prons |= section_prons
-				if entry_prons:
-					print(f'{page_title}: {", ".join(entry_prons)}', file=full_output_file)
-					prons |= entry_prons
-			finally:
-				page.clear()
-				if args.verbose and count % VERBOSE_FACTOR == 0:
-					print(f'{count:,}')
+		verbose_factor = VERBOSE_FACTOR if args.verbose else 0
+		if args.extract_cache_path:
+			page_filter = functools.partial(parsing.extract_cache.page_in, ids=target_ids) if target_ids is not None else None
+			page_func = functools.partial(find_entry_prons, lindsey_glides=args.lindsey_glides, warnings=args.warnings)
+			results = parsing.extract_cache.map_cached_pages(args.input_path, page_func, args.extract_cache_path, f'find_prons lindsey_glides={args.lindsey_glides}', EXTRACT_VERSION, page_filter, args.jobs, verbose_factor, PAGE_FIELDS, args.page_index_path, target_ids)
+		elif args.page_index_path:
+			results = parsing.page_index.map_indexed_pages(args.page_index_path, args.input_path, target_ids, page_func, fields=PAGE_FIELDS, verbose_factor=verbose_factor)
+		else:
+			results = parsing.page_pool.map_pages(args.input_path, page_func, jobs=args.jobs, verbose_factor=verbose_factor, fields=PAGE_FIELDS)
+		for page_title, entry_prons in results:
+			print(f'{page_title}: {", ".join(entry_prons)}', file=full_output_file)
+			prons |= entry_prons
 
 	with open(args.pronunciation_path, 'w', encoding='utf-8') as pronunciation_file:
 		sorted_prons = sorted(prons)
 		for pron in sorted_prons:
 			print(pron, file=pronunciation_file)
 
+def find_entry_prons(page: parsing.etree_helpers.Page, target_ids: collections.abc.Container[int] | None = None, lindsey_glides: bool = False, warnings: bool = False) -> tuple[str, set[str]] | None:
+	'''
+	Returns the title of a page and the valid pronunciations found in it, or None if it has none (or is not one of target_ids).
+	'''
+	if target_ids is not None:
+		if page.id not in target_ids:
+			return None
+	page_title = page.title
+	wikitext = wikitextparser.parse(page.text)
+	pron_sections = (sec for sec in wikitext.sections if 3 <= sec.level <= 4 and sec.title == 'Pronunciation')
+	entry_prons: set[str] = set()
+	for section in pron_sections:
+		pron_lists = section.get_lists(pattern=UNORDERED_LIST_PATTERN)
+		for lis in pron_lists:
+			section_prons = prons_from_wikilist(lis,word=page_title if warnings else None, accents=TARGET_ACCENTS)
+			if lindsey_glides:
+				section_lindsey_prons: set[str] = set()
+				for pron in section_prons:
+					section_lindsey_prons.add(re.sub(LINDSEY_PATTERN, lindsey_sub, pron))
+				section_prons = section_lindsey_prons
+			# Lexica does not permit very short or long words
+			section_prons = {pron for pron in section_prons if 3 <= len(pron) <= 9}
+			entry_prons |= section_prons
+	return (page_title, entry_prons) if entry_prons else None
+
+def lindsey_sub(old: re.Match) -> str:
+	return LINDSEY_REPLACEMENTS[old[0]]
+
 def prons_from_wikilist(wikilist: wikitextparser.WikiList, word: str | None = None, accents: collections.abc.Container[str] | None = None) -> set[str]:
 	'''
 	Extracts all the pronunciations in the chosen accents (if specified) from a WikiList.
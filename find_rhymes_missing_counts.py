@@ -3,16 +3,28 @@ import re
 import xml.dom.pulldom
 
 import pulldom_helpers
+import rhyme_db
 
 def main():
 	parser = argparse.ArgumentParser()
-	parser.add_argument('pages_path')
+	parser.add_argument('pages_path', nargs='?')
 	parser.add_argument('output_path')
+	parser.add_argument('-d', '--db-path', help='Path of an English rhyme database built by rhyme_db, to read the rhymes from instead of the pages file. Entries are then listed if none of their rhymes has a syllable count, and rhymes given by {{rhyme}} as well as {{rhymes}} are considered, so an entry with one line of rhymes without counts and another with them is not listed.')
 	args = parser.parse_args()
+	if bool(args.pages_path) == bool(args.db_path):
+		parser.error('exactly one of pages_path and --db-path must be given')
 
-	doc = xml.dom.pulldom.parse(args.pages_path)
 	with open(args.output_path, 'w', encoding='utf-8') as out_file:
 		out_file.write('== List ==\n{{col4|en\n')
+		if args.db_path:
+			with rhyme_db.RhymeDB(args.db_path) as rhymes:
+				if rhymes.language != 'English':
+					raise ValueError(f'{args.db_path} is a rhyme database for {rhymes.language}, not English.')
+				for title in rhymes.words_missing_syllables():
+					out_file.write(f'| {title}\n')
+			out_file.write('|sort=0|collapse=0}}')
+			return
+		doc = xml.dom.pulldom.parse(args.pages_path)
 		for event, node in doc:
 			if event == xml.dom.pulldom.START_ELEMENT and node.tagName == 'page':
 				doc.expandNode(node)
@@ -1,14 +1,22 @@
 import argparse
 import collections
+import collections.abc
 import functools
 import json
 import re
+import typing
 
 import wikitextparser
 
 import parsing.etree_helpers
+import parsing.extract_cache
+import parsing.page_pool
+import parsing.record_files
 
 VERBOSITY_FACTOR = 10 ** 5
+PAGE_FIELDS = ('id', 'title', 'text')
+# Increase this whenever a change to find_page_rhymes changes its results, to invalidate cached results
+EXTRACT_VERSION = '1'
 GOOD_PARTS_OF_SPEECH = ['adjective', 'adverb', 'interjection', 'noun', 'verb']
 PARTS_OF_SPEECH = {
 	'adjective',
@@ -35,6 +43,7 @@ PARTS_OF_SPEECH = {
 }
 RHYME_TEMP_NAMES = ['rhymes', 'rhyme']
 RHYME_CAT_PREFIX = 'Rhymes:English/'
+JSON_LINES_EXTENSION = '.jsonl'
 
 def main():
 	parser = argparse.ArgumentParser()
@@ -43,9 +52,15 @@ def main():
 	parser.add_argument('good_ids_path', help='Path of the file containing entry IDs (one per line) of terms considered acceptable replacements, as produced by find_terms.')
 	parser.add_argument('frequencies_path', help='Path of the JSON file containing word frequencies, as pdocued by find_frequencies.')
 	parser.add_argument('-l', '--language', default='English', help='The name of the language as it appears in the heading of each entry.')
-	parser.add_argument('output_path', help='Path of the file to write the rhyme category data to.')
+	parser.add_argument('output_path', help=f'Path of the file to write the rhyme category data to. If it ends with {JSON_LINES_EXTENSION}, a record is written for each word on its own line (JSON Lines) instead of a single JSON object.')
+	parser.add_argument('-i', '--index-path', help=f'Path of the file to write an index of the records by title to, so that parsing.record_files.RecordReader can look them up. Only allowed for {JSON_LINES_EXTENSION} output.')
+	parser.add_argument('-j', '--jobs', default=1, type=int, help='The number of processes to use to parse entries. Defaults to 1.')
+	parser.add_argument('--extract-cache-path', help='Path of an SQLite file in which to cache the parts of speech and rhymes found in each page, keyed by page ID and revision SHA-1. (It will be created if it does not exist.) When this script is run again, only pages that have changed since are parsed.')
 	parser.add_argument('-v', '--verbose', action='store_true')
 	args = parser.parse_args()
+	json_lines = args.output_path.endswith(JSON_LINES_EXTENSION)
+	if args.index_path and not json_lines:
+		parser.error(f'--index-path can only be given if the output path ends with {JSON_LINES_EXTENSION}.')
 
 	if args.verbose:
 		print('Reading IDs of terms with rhymes...')
@@ -64,46 +79,105 @@ def main():
 
 	if args.verbose:
 		print('Reading entries:')
-	word_rhymes = collections.defaultdict(dict)
-	for page_count, page in enumerate(parsing.etree_helpers.pages_gen(args.pages_path)):
-		try:
-			page_id = int(parsing.etree_helpers.find_child(page, 'id').text)
-			page_title = parsing.etree_helpers.find_child(page, 'title').text
-			# [!-~] matches all printable, non-whitespace ASCII characters
-			if not re.fullmatch(r'[!-~]+', page_title):
-				continue
-			text = parsing.etree_helpers.find_child(parsing.etree_helpers.find_child(page, 'revision'), 'text').text
-			wikitext = wikitextparser.parse(text)
-			lang_sec = next(sec for sec in wikitext.get_sections(level=2) if sec.title == args.language)
-
-			# Find predominant part of speech
-			# If part of speech is not recognized this field is set to None, indicating the word is a function word
-			part_of_speech = next((sec.title.lower() for sec in lang_sec.sections if (sec.level == 3 or sec.level == 4) and sec.title.lower() in PARTS_OF_SPEECH), None)
-			word_rhymes[page_title]['part of speech'] = part_of_speech if part_of_speech in GOOD_PARTS_OF_SPEECH else None
-
-			# Find rhymes
-			if page_id in rhyme_ids:
-				word_rhymes[page_title]['rhymes'] = collections.defaultdict(list)
-				for temp in lang_sec.templates:
-					if temp.normal_name() in RHYME_TEMP_NAMES:
-						# Skip over the first argument since it is the language code
-						temp_rhymes = [arg.value for arg in temp.arguments if arg.positional][1:]
-						for i, rhyme in enumerate(temp_rhymes, start=1):
-							syllable_count_arg = temp.get_arg(f's{i}') or temp.get_arg('s')
-							if syllable_count_arg:
-								for syllable_count in syllable_count_arg.value.split(','):
-									# We could convert syllable_count to an int here, but there's no point since it will get converted back to a string in JSON
-									word_rhymes[page_title]['rhymes'][syllable_count].append(rhyme)
-				if page_id in good_ids and part_of_speech:
-					word_rhymes[page_title]['frequency'] = frequencies.get(page_title, 0)
-
-		finally:
-			if args.verbose and page_count % VERBOSITY_FACTOR == 0:
-				print(f'{page_count:,}')
-			page.clear()
-
-	with open(args.output_path, 'w', encoding='utf-8') as word_rhymes_file:
-		json.dump(word_rhymes, word_rhymes_file, indent='\t')
+	verbose_factor = VERBOSITY_FACTOR if args.verbose else 0
+	if args.extract_cache_path:
+		# Cached results must not depend on rhyme_ids, so rhymes are found in every page and discarded below
+		page_func = functools.partial(find_page_rhymes, language=args.language)
+		results = parsing.extract_cache.map_cached_pages(args.pages_path, page_func, args.extract_cache_path, f'find_song_rhymes language={args.language}', EXTRACT_VERSION, jobs=args.jobs, verbose_factor=verbose_factor, fields=PAGE_FIELDS)
+	else:
+		page_func = functools.partial(find_page_rhymes, language=args.language, rhyme_ids=rhyme_ids)
+		results = parsing.page_pool.map_pages(args.pages_path, page_func, jobs=args.jobs, verbose_factor=verbose_factor, fields=PAGE_FIELDS)
+	# Records are written as each page's results come in, so they are never all held in memory
+	records = word_rhyme_records(results, rhyme_ids, good_ids, frequencies)
+	if json_lines:
+		with parsing.record_files.RecordWriter(args.output_path) as writer:
+			for record in records:
+				writer.write(record)
+		if args.index_path:
+			if args.verbose:
+				print('Writing index...')
+			parsing.record_files.write_index(args.output_path, args.index_path, 'title')
+	else:
+		with open(args.output_path, 'w', encoding='utf-8') as word_rhymes_file:
+			write_word_rhymes(records, word_rhymes_file)
+
+def word_rhyme_records(
+		results: collections.abc.Iterable[tuple[int, str, str | None, dict[str, list[str]] | None]],
+		rhyme_ids: collections.abc.Container[int],
+		good_ids: collections.abc.Container[int],
+		frequencies: dict[str, int]
+		) -> collections.abc.Iterator[dict]:
+	'''Yields a record for each result of find_page_rhymes, giving the title, part of speech (if a good one), and (if the page has rhymes) the rhymes and (if a good word) frequency.'''
+	for page_id, page_title, part_of_speech, rhymes in results:
+		record = {'title': page_title, 'part of speech': part_of_speech if part_of_speech in GOOD_PARTS_OF_SPEECH else None}
+		if page_id in rhyme_ids and rhymes is not None:
+			record['rhymes'] = rhymes
+			if page_id in good_ids and part_of_speech:
+				record['frequency'] = frequencies.get(page_title, 0)
+		yield record
+
+def write_word_rhymes(records: collections.abc.Iterable[dict], out_file: typing.TextIO) -> None:
+	'''Writes records as a single JSON object keyed by title, formatted as json.dump does with an indent of a tab, one record at a time.'''
+	out_file.write('{')
+	first = True
+	for record in records:
+		title = record.pop('title')
+		out_file.write('\n\t' if first else ',\n\t')
+		out_file.write(json.dumps(title) + ': ' + json.dumps(record, indent='\t').replace('\n', '\n\t'))
+		first = False
+	out_file.write('}' if first else '\n}')
+
+def find_page_rhymes(page: parsing.etree_helpers.Page, language: str, rhyme_ids: collections.abc.Container[int] | None = None) -> tuple[int, str, str | None, dict[str, list[str]] | None] | None:
+	'''
+	Returns the ID, title, predominant part of speech and rhymes (by syllable count) of a page, or None if the page is skipped.
+	The part of speech is None if it is not recognized (indicating a function word). The rhymes are None if rhyme_ids is given and the page is not one of them.
+	'''
+	page_id = page.id
+	page_title = page.title
+	# [!-~] matches all printable, non-whitespace ASCII characters
+	if not re.fullmatch(r'[!-~]+', page_title):
+		return None
+	lang_sec = language_section(page, language)
+	if lang_sec is None:
+		return None
+	part_of_speech = predominant_part_of_speech(lang_sec)
+
+	# Find rhymes
+	if rhyme_ids is not None and page_id not in rhyme_ids:
+		return page_id, page_title, part_of_speech, None
+	rhymes = collections.defaultdict(list)
+	for rhyme, syllable_counts in rhyme_syllable_counts(lang_sec):
+		for syllable_count in syllable_counts:
+			# We could convert syllable_count to an int here, but there's no point since it will get converted back to a string in JSON
+			rhymes[syllable_count].append(rhyme)
+	return page_id, page_title, part_of_speech, dict(rhymes)
+
+def find_page_rhyme_data(page: parsing.etree_helpers.Page, language: str) -> tuple[int, str, str | None, list[tuple[str, list[str]]]] | None:
+	'''Returns the ID, title, predominant part of speech and rhymes (each with its syllable counts, as given by rhyme_syllable_counts) of a page, or None if it has no section for the language.'''
+	lang_sec = language_section(page, language)
+	if lang_sec is None:
+		return None
+	return page.id, page.title, predominant_part_of_speech(lang_sec), rhyme_syllable_counts(lang_sec)
+
+def language_section(page: parsing.etree_helpers.Page, language: str) -> wikitextparser.Section | None:
+	wikitext = wikitextparser.parse(page.text)
+	return next((sec for sec in wikitext.get_sections(level=2) if sec.title == language), None)
+
+def predominant_part_of_speech(lang_sec: wikitextparser.Section) -> str | None:
+	'''Returns the first part of speech heading in a language section, or None if there is none (indicating a function word).'''
+	return next((sec.title.lower() for sec in lang_sec.sections if (sec.level == 3 or sec.level == 4) and sec.title.lower() in PARTS_OF_SPEECH), None)
+
+def rhyme_syllable_counts(lang_sec: wikitextparser.Section) -> list[tuple[str, list[str]]]:
+	'''Returns each rhyme given by a rhymes template in a language section, with the syllable counts given for it (which may be none), in order.'''
+	rhymes = []
+	for temp in lang_sec.templates:
+		if temp.normal_name() in RHYME_TEMP_NAMES:
+			# Skip over the first argument since it is the language code
+			temp_rhymes = [arg.value for arg in temp.arguments if arg.positional][1:]
+			for i, rhyme in enumerate(temp_rhymes, start=1):
+				syllable_count_arg = temp.get_arg(f's{i}') or temp.get_arg('s')
+				rhymes.append((rhyme, syllable_count_arg.value.split(',') if syllable_count_arg else []))
+	return rhymes
 
 if __name__ == '__main__':
 	main()
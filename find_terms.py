@@ -1,23 +1,38 @@
 import argparse
+import collections
 import collections.abc
+import functools
 import json
 import os.path
 import re
+import sys
 
 import wikitextparser
 
 import deep_cat
+import parsing.checkpoint
 import parsing.etree_helpers
+import parsing.extract_cache
+import parsing.page_index
+import parsing.page_pool
 import parsing.parse_cats
 import parsing.parse_redirects
 import parsing.parse_stubs
 
 PAGES_VERBOSITY_FACTOR = 10 ** 5
+PAGE_FIELDS = ('id', 'title', 'text')
+# Increase this whenever a change to find_senses changes its results, to invalidate cached results
+EXTRACT_VERSION = '2'
 TEMP_PREFIX = 'Template:'
 # The ID of Category:Form-of templates
 FORM_OF_TEMP_CAT_ID = 3991887
 LABEL_TEMPS = {'label', 'lb', 'lbl'}
 
+# The features of a definition line needed to filter it, extracted from its templates so the templates themselves need not be kept.
+# temps has a (name, main argument) pair for each template, where the main argument is the argument that gives the lemma if the template is a form-of template.
+# labels has a (language code, labels) pair for each label template.
+Sense = collections.namedtuple('Sense', ['temps', 'labels'])
+
 def main() -> None:
 	parser = argparse.ArgumentParser()
 	parser.add_argument('-c', '--config-path', help='The path of a JSON file containing arguments and options to use. All argument and option names are the same as the command-line ones, but spaces may be used in place of underscores and dashes. Command-line arguments can be used in addition to a config to override arguments and options in the config.')
@@ -44,6 +59,11 @@ def main() -> None:
 	parser.add_argument('-n', '--parts-of-speech', nargs='+', default=[], help='If a sense is not one of these parts of speech (think noun, verb, etc) then it will not support the inclusion of a term. Case insensitive.')
 	# u is the first untaken letter in 'output ids'
 	parser.add_argument('-u', '--output-ids', action='store_true', help='Output the MediaWiki entry IDs of the selected entries rather than the titles of the entries.')
+	parser.add_argument('-j', '--jobs', default=1, type=int, help='The number of processes to use to parse pages. Defaults to 1.')
+	parser.add_argument('-k', '--page-index-path', help='Path of an index of the pages file, as produced by parsing.page_index. If given, only the pages of the selected terms (and the lemmas they are forms of) are read from the pages file, rather than the whole file.')
+	parser.add_argument('--extract-cache-path', help='Path of an SQLite file in which to cache the templates and labels of the definitions found in each page, keyed by page ID and revision SHA-1. (It will be created if it does not exist.) When this script is run again, only pages that have changed since are parsed.')
+	parser.add_argument('--checkpoint-path', help='Path of a file in which to periodically save the senses read so far, so that reading the pages file can be resumed with --resume if it is interrupted. Cannot be used with --page-index-path.')
+	parser.add_argument('--resume', action='store_true', help='Resume from the checkpoint at --checkpoint-path (if it exists).')
 	parser.add_argument('-v', '--verbose', action='store_true')
 	args = parser.parse_args()
 
@@ -74,15 +94,21 @@ def main() -> None:
 	dependencies = {
 		'include-cats': 'cats-path',
 		'exclude-cats': 'cats-path',
-		'exclude-labels': 'label-lang'
+		'exclude-labels': 'label-lang',
+		'resume': 'checkpoint-path'
 	}
 	for used, req in dependencies.items():
 		if getattr(config, used.replace('-', '_')) and not getattr(config, req.replace('-', '_')):
 			raise ValueError(f'--{used} requires --{req}')
+	if config.checkpoint_path and config.page_index_path:
+		raise ValueError('--checkpoint-path cannot be used with --page-index-path')
 
 	if config.verbose:
 		print(f'Reading stubs...')
 	stub_master = parsing.parse_stubs.StubMaster(config.stubs_path)
+	if config.verbose:
+		print('Reading redirects...')
+	redirect_master = parsing.parse_redirects.RedirectMaster(config.redirects_path)
 
 	if config.cats_path and not config.small_ram:
 		cat_master = parsing.parse_cats.CategoryMaster(config.cats_path, verbose=config.verbose)
@@ -139,7 +165,7 @@ def main() -> None:
 			form_of_temps = deep_cat.deep_cat_filter_slow(args.cats_path, {FORM_OF_TEMP_CAT_ID}, return_titles=True, verbose=args.verbose)
 		else:
 			form_of_temps = deep_cat.deep_cat_filter(cat_master, {FORM_OF_TEMP_CAT_ID}, return_titles=True, verbose=args.verbose)
-	form_of_temps = {temp.removeprefix(TEMP_PREFIX) for temp in include_redirects(form_of_temps, config.redirects_path)}
+	form_of_temps = template_aliases(redirect_master, form_of_temps)
 	# Attempt to cache form-of templates
 	try:
 		with open(config.temps_cache_path, 'x', encoding='utf-8') as temps_cache_file:
@@ -155,13 +181,18 @@ def main() -> None:
 		stub_master,
 		config.pages_path,
 		config.label_lang,
-		config.redirects_path,
+		redirect_master,
 		form_of_temps=form_of_temps,
 		bad_terms=cat_bad_terms,
 		regex=config.regex,
 		exclude_labels=set(config.exclude_labels),
 		exclude_temps=config.exclude_temps,
 		parts_of_speech=set(config.parts_of_speech),
+		jobs=config.jobs,
+		extract_cache_path=config.extract_cache_path,
+		candidates=good_terms,
+		page_index_path=config.page_index_path,
+		checkpoint=parsing.checkpoint.Checkpoint(config.checkpoint_path, config.pages_path, config.resume) if config.checkpoint_path else None,
 		verbose=config.verbose
 	)
 
@@ -172,6 +203,8 @@ def main() -> None:
 	with open(config.output_path, 'w', encoding='utf-8') as out_file:
 		for entry_id in good_terms:
 				print(entry_id if config.output_ids else stub_master.title(entry_id), file=out_file)
+	if term_filter.checkpoint:
+		term_filter.checkpoint.finish()
 
 
 class TermFilter:
@@ -179,29 +212,35 @@ class TermFilter:
 			stub_master: parsing.parse_stubs.StubMaster,
 			pages_path: str,
 			label_lang: str,
-			redirects_path: str,
+			redirect_master: parsing.parse_redirects.RedirectMaster,
 			form_of_temps: set[str] | None = None,
 			bad_terms: collections.abc.Collection[int] | None = None,
 			regex: str = '',
 			exclude_labels: collections.abc.Container[str] | None = None,
 			exclude_temps: collections.abc.Iterable[str] | None = None,
 			parts_of_speech: collections.abc.Container[str] | None = None,
+			jobs: int = 1,
+			extract_cache_path: str | None = None,
+			candidates: collections.abc.Iterable[int] | None = None,
+			page_index_path: str | None = None,
+			checkpoint: parsing.checkpoint.Checkpoint | None = None,
 			verbose: bool = False):
 
 		self.stub_master = stub_master
-		# Set verbose early so it can be used by find_sense_temps
+		self.redirect_master = redirect_master
+		# Set verbose and form_of_temps early so they can be used by load_senses
 		self.verbose = verbose
-		self.sense_temps = self.find_sense_temps(pages_path, bad_terms, regex, parts_of_speech)
-		self.label_lang = label_lang
 		self.form_of_temps = form_of_temps or set()
+		self.checkpoint = checkpoint
+		self.senses = self.load_senses(pages_path, candidates, bad_terms, regex, parts_of_speech, jobs, extract_cache_path, page_index_path)
+		self.label_lang = label_lang
 		self.exclude_labels = exclude_labels or set()
-		self.exclude_temps: set[str] = set()
-		if exclude_temps:
-			for temp in include_redirects({TEMP_PREFIX + temp for temp in exclude_temps}, redirects_path):
-				self.exclude_temps.add(temp.removeprefix(TEMP_PREFIX))
-		self.cache = {id_: False for id_ in bad_terms} if bad_terms else {}
+		self.exclude_temps = template_aliases(redirect_master, exclude_temps) if exclude_temps else set()
+		self.bad_terms = bad_terms or set()
+		# Whether each entry is accepted, computed for all loaded entries at once by the first call to check_entry
+		self.accepted: dict[int, bool] | None = None
 
-	def check_entry(self, term: int | str, time_to_live: int = 4) -> bool:
+	def check_entry(self, term: int | str) -> bool:
 		if isinstance(term, str):
 			try:
 				term_id = self.stub_master.id(term)
@@ -209,89 +248,284 @@ class TermFilter:
 				return False
 		else:
 			term_id = term
-
-		if term_id not in self.cache:
-			self.cache[term_id] = self.check_uncached_term(term_id, time_to_live)
-		return self.cache[term_id]
-
-	def check_uncached_term(self, term_id: int, time_to_live: int = 4) -> bool:
-		# If after following a few links we still haven't found a lemma, assume we are in a cycle and accept the term
-		if time_to_live <= 0:
-			return True
-		if term_id not in self.sense_temps:
+		# Check the entry a redirect leads to
+		term_id = self.redirect_master.resolve(term_id)
+		if term_id is None:
 			return False
 
-		for temps in self.sense_temps[term_id]:
-			if any(temp.normal_name() in self.exclude_temps for temp in temps):
+		if self.accepted is None:
+			self.accepted = self.find_accepted()
+		return self.accepted.get(term_id, False)
+
+	def find_accepted(self) -> dict[int, bool]:
+		'''
+		Returns whether each loaded entry is accepted. An entry is accepted if it has a sense that is not excluded and is either not a form-of sense, or is a form of an accepted entry.
+		Form-of links form a graph between entries, which may have cycles. Entries whose form-of links only lead around a cycle (never reaching an entry accepted on its own) are rejected.
+		'''
+		accepted_alone: dict[int, bool] = {}
+		lemmas: dict[int, list[int]] = {}
+		for term_id, senses in self.senses.items():
+			accepted_alone[term_id] = False
+			if term_id in self.bad_terms:
 				continue
-			try:
-				label_temp = next(temp for temp in temps if temp.normal_name() in LABEL_TEMPS and temp.get_arg('1').positional and temp.get_arg('1').value == self.label_lang)
-				if any((arg.value in self.exclude_labels) for arg in label_temp.arguments[1:] if arg.positional):
-					continue
-			except StopIteration:
-				pass
-			try:
-				form_of_temp = next(temp for temp in temps if temp.normal_name() in self.form_of_temps)
-				main_form = (form_of_temp.get_arg('2') or form_of_temp.get_arg('1')).value
-				if not self.check_entry(main_form, time_to_live - 1):
+			term_lemmas = []
+			for sense in senses:
+				if not self.check_sense(sense):
 					continue
-			except StopIteration:
-				pass
-			return True
-		return False
+				if self.form_of_target(sense) is None:
+					accepted_alone[term_id] = True
+					break
+				lemma_id = self.lemma_id(sense)
+				if lemma_id is not None:
+					term_lemmas.append(lemma_id)
+			if term_lemmas and not accepted_alone[term_id]:
+				lemmas[term_id] = term_lemmas
+		return accept_over_graph(accepted_alone, lemmas)
+
+	def check_sense(self, sense: Sense) -> bool:
+		'''Returns whether a sense is not excluded by its templates or labels.'''
+		if any(name in self.exclude_temps for name, main_arg in sense.temps):
+			return False
+		lang_labels = next((lang_labels for lang, lang_labels in sense.labels if lang == self.label_lang), ())
+		return not any(label in self.exclude_labels for label in lang_labels)
 
-	def find_sense_temps(self,
+	def load_senses(self,
 			pages_path: str,
+			candidates: collections.abc.Iterable[int] | None = None,
 			bad_terms: collections.abc.Collection[int] | None = None,
 			regex: str | None = None,
-			parts_of_speech: collections.abc.Container[str] | None = None
-			) -> collections.defaultdict[int, list[list[wikitextparser.Template]]]:
-
-		def temps_in_section(section: str) -> list[list[wikitextparser.Template]]:
-			return [wikitextparser.parse(line).templates for line in section.splitlines() if line.startswith('# ')]
-
-		sense_temps = collections.defaultdict(list)
-		if self.verbose:
-			print('\nLoading pages data:')
-
-		for count, page in enumerate(parsing.etree_helpers.pages_gen(pages_path)):
-			page_id = int(parsing.etree_helpers.find_child(page, 'id').text)
-			page_title = parsing.etree_helpers.find_child(page, 'title').text
-			page_text = parsing.etree_helpers.find_child(parsing.etree_helpers.find_child(page, 'revision'), 'text').text
-			if not (bad_terms and page_id in bad_terms) and not (regex and not re.fullmatch(regex, page_title)):
-				if parts_of_speech:
-					# Assume lang has removed all L2 sections except for the relevant one
-					wikitext: wikitextparser.Section = wikitextparser.parse(page_text).get_sections(level=2)[0]
-					for section in wikitext.get_sections(level=3):
-						# Multiple etymologies
-						if re.fullmatch(r'Etymology \d+', section.title):
-							for subsection in section.get_sections(level=4):
-								if subsection.title.casefold() in parts_of_speech:
-									sense_temps[page_id].extend(temps_in_section(subsection.contents))
-						# Single etymology
-						else:
-							if section.title.casefold() in parts_of_speech:
-								sense_temps[page_id].extend(temps_in_section(section.contents))
-					page.clear()
-
-				# No parts of speech specified
-				else:
-					sense_temps[page_id] = temps_in_section(page_text)
-
-			page.clear()
-			if self.verbose and count % PAGES_VERBOSITY_FACTOR == 0:
-				print(f'{count:,}')
-
-		return sense_temps
+			parts_of_speech: collections.abc.Container[str] | None = None,
+			jobs: int = 1,
+			extract_cache_path: str | None = None,
+			page_index_path: str | None = None
+			) -> dict[int, list[Sense]]:
+		'''
+		Returns the senses of the candidate pages and of all the pages their form-of templates lead to (directly or through other form-of templates).
+		The candidates are read first, then the lemmas they refer to, and so on until no new lemmas are found. With a page index, each round only reads the pages it needs; otherwise each round scans the pages file but only parses the pages it needs.
+		If candidates is None, every page is read in a single round.
+		If self.checkpoint is given, the senses read so far and the progress through the rounds are saved in it, and restored from it if it has been resumed.
+		'''
+		senses: dict[int, list[Sense]] = {}
+		# Identical features (such as template names and common labels) are shared, which saves a lot of memory
+		interned = {}
+		ids = None if candidates is None else set(candidates)
+		loaded: set[int] = set()
+		round_ = 0
+		if self.checkpoint:
+			if self.checkpoint.resumed:
+				senses, interned, ids, loaded, round_ = self.checkpoint.state
+				if self.verbose:
+					print(f'Resuming round {round_} from byte {self.checkpoint.offset:,} of the pages file...')
+			self.checkpoint.get_state = lambda: (senses, interned, ids, loaded, round_)
+		if candidates is None:
+			self.find_senses(senses, interned, pages_path, None, bad_terms, regex, parts_of_speech, jobs, extract_cache_path)
+			return senses
+
+		while ids:
+			if self.verbose:
+				print(f'\nLoading {len(ids):,} pages (round {round_}):')
+			self.find_senses(senses, interned, pages_path, ids, bad_terms, regex, parts_of_speech, jobs, extract_cache_path, page_index_path)
+			if self.checkpoint:
+				# The next round reads the pages file from the start
+				self.checkpoint.offset = 0
+			loaded |= ids
+			new_ids = set()
+			for page_id in ids:
+				for sense in senses.get(page_id, ()):
+					lemma_id = self.lemma_id(sense)
+					if lemma_id is not None and lemma_id not in loaded:
+						new_ids.add(lemma_id)
+			ids = new_ids
+			round_ += 1
+		return senses
+
+	def form_of_target(self, sense: Sense) -> str | None:
+		'''Returns the title of the entry that the form-of template (if any) of a sense refers to.'''
+		return next((main_arg for name, main_arg in sense.temps if name in self.form_of_temps), None)
+
+	def lemma_id(self, sense: Sense) -> int | None:
+		'''Returns the ID of the entry that the form-of template (if any) of a sense refers to, following redirects, or None if there is no such entry.'''
+		main_form = self.form_of_target(sense)
+		if main_form is None:
+			return None
+		try:
+			return self.redirect_master.resolve(self.stub_master.id(main_form))
+		except KeyError:
+			return None
+
+	def find_senses(self,
+			senses: dict[int, list[Sense]],
+			interned: dict[tuple, tuple],
+			pages_path: str,
+			ids: collections.abc.Collection[int] | None = None,
+			bad_terms: collections.abc.Collection[int] | None = None,
+			regex: str | None = None,
+			parts_of_speech: collections.abc.Container[str] | None = None,
+			jobs: int = 1,
+			extract_cache_path: str | None = None,
+			page_index_path: str | None = None
+			) -> None:
+		'''Adds the senses of the pages with the given IDs (or all pages, if ids is None) to senses, sharing identical tuples through interned.'''
+
+		def intern(value: tuple) -> tuple:
+			return interned.setdefault(value, value)
+
+		verbose_factor = PAGES_VERBOSITY_FACTOR if self.verbose else 0
+		if not page_index_path:
+			ids_filter = ids
+		else:
+			# The index reads only these pages anyway
+			ids_filter = None
+		if extract_cache_path:
+			page_filter = functools.partial(is_candidate, bad_terms=bad_terms, regex=regex, ids=ids_filter)
+			page_func = functools.partial(find_senses, parts_of_speech=parts_of_speech)
+			extractor = 'find_terms parts_of_speech=' + ','.join(sorted(parts_of_speech or []))
+			results = parsing.extract_cache.map_cached_pages(pages_path, page_func, extract_cache_path, extractor, EXTRACT_VERSION, page_filter, jobs, verbose_factor, PAGE_FIELDS, page_index_path, ids, self.checkpoint)
+		else:
+			page_func = functools.partial(find_senses, bad_terms=bad_terms, regex=regex, parts_of_speech=parts_of_speech, ids=ids_filter)
+			if page_index_path:
+				results = parsing.page_index.map_indexed_pages(page_index_path, pages_path, ids, page_func, PAGE_FIELDS, verbose_factor)
+			else:
+				results = parsing.page_pool.map_pages(pages_path, page_func, jobs=jobs, verbose_factor=verbose_factor, fields=PAGE_FIELDS, checkpoint=self.checkpoint)
+		for page_id, page_senses in results:
+			senses[page_id] = [
+				intern(Sense(
+					intern(tuple(intern((sys.intern(name), main_arg)) for name, main_arg in sense.temps)),
+					intern(tuple(intern((sys.intern(lang), intern(tuple(sys.intern(label) for label in lang_labels)))) for lang, lang_labels in sense.labels))
+				))
+				for sense in page_senses
+			]
 
 # End of TermFilter
 
-def include_redirects(pages: set[str], redirects_path: str) -> set[str]:
-	# Assumes no double redirects
-	for red in parsing.parse_redirects.redirects_gen(redirects_path):
-		if red.dst_title in pages:
-			pages.add(red.src_title)
-	return pages
+def template_aliases(redirect_master: parsing.parse_redirects.RedirectMaster, temps: collections.abc.Iterable[str]) -> set[str]:
+	'''Returns the given templates along with all the redirects that lead to them, all without the namespace prefix (which the titles in the redirects file have).'''
+	return {temp.removeprefix(TEMP_PREFIX) for temp in redirect_master.with_redirects({TEMP_PREFIX + temp.removeprefix(TEMP_PREFIX) for temp in temps})}
+
+def accept_over_graph(accepted_alone: dict[int, bool], lemmas: dict[int, list[int]]) -> dict[int, bool]:
+	'''
+	Returns whether each entry is accepted, given whether it is accepted on its own and the lemmas whose acceptance would make it accepted. Lemmas that are not keys of accepted_alone are rejected.
+	The strongly connected components of the graph of lemmas are found with Tarjan's algorithm (iteratively, to avoid deep recursion on long chains). It finds each component only after all the components it leads to, so each component can be decided as soon as it is found: all of its entries are accepted if any of them is accepted on its own or has an accepted lemma outside the component, and are otherwise rejected.
+	'''
+	accepted: dict[int, bool] = {}
+	index: dict[int, int] = {}
+	low: dict[int, int] = {}
+	stack: list[int] = []
+	on_stack: set[int] = set()
+
+	def visit(node: int) -> None:
+		index[node] = low[node] = len(index)
+		stack.append(node)
+		on_stack.add(node)
+		work.append((node, iter(lemmas.get(node, ()))))
+
+	for root in accepted_alone:
+		if root in index:
+			continue
+		work: list[tuple[int, collections.abc.Iterator[int]]] = []
+		visit(root)
+		while work:
+			node, node_lemmas = work[-1]
+			for lemma in node_lemmas:
+				if lemma not in accepted_alone:
+					continue
+				if lemma not in index:
+					visit(lemma)
+					break
+				elif lemma in on_stack:
+					low[node] = min(low[node], index[lemma])
+			else:
+				work.pop()
+				if work:
+					parent = work[-1][0]
+					low[parent] = min(low[parent], low[node])
+				if low[node] == index[node]:
+					component = []
+					while True:
+						member = stack.pop()
+						on_stack.remove(member)
+						component.append(member)
+						if member == node:
+							break
+					members = set(component)
+					component_accepted = any(accepted_alone[member] or any(accepted.get(lemma, False) for lemma in lemmas.get(member, ()) if lemma not in members) for member in component)
+					for member in component:
+						accepted[member] = component_accepted
+	return accepted
+
+def find_senses(
+		page: parsing.etree_helpers.Page,
+		bad_terms: collections.abc.Container[int] | None = None,
+		regex: str | None = None,
+		parts_of_speech: collections.abc.Container[str] | None = None,
+		ids: collections.abc.Container[int] | None = None
+		) -> tuple[int, list[Sense]] | None:
+	'''Like find_sense_lines, but returns the Sense of each definition line.'''
+	result = find_sense_lines(page, bad_terms, regex, parts_of_speech, ids)
+	if result is None:
+		return None
+	page_id, lines = result
+	return page_id, [line_sense(line) for line in lines]
+
+def line_sense(line: str) -> Sense:
+	temps = []
+	labels = []
+	for temp in wikitextparser.parse(line).templates:
+		name = temp.normal_name()
+		main_arg = temp.get_arg('2') or temp.get_arg('1')
+		temps.append((name, main_arg.value if main_arg else None))
+		if name in LABEL_TEMPS:
+			lang_arg = temp.get_arg('1')
+			if lang_arg and lang_arg.positional:
+				labels.append((lang_arg.value, tuple(arg.value for arg in temp.arguments[1:] if arg.positional)))
+	return Sense(tuple(temps), tuple(labels))
+
+def find_sense_lines(
+		page: parsing.etree_helpers.Page,
+		bad_terms: collections.abc.Container[int] | None = None,
+		regex: str | None = None,
+		parts_of_speech: collections.abc.Container[str] | None = None,
+		ids: collections.abc.Container[int] | None = None
+		) -> tuple[int, list[str]] | None:
+	'''
+	Returns the ID of a page and its definition lines (in the given parts of speech, if any are given), or None if the page is excluded by bad_terms, regex or ids.
+	'''
+
+	def lines_in_section(section: str) -> list[str]:
+		return [line for line in section.splitlines() if line.startswith('# ')]
+
+	page_id = page.id
+	if not is_candidate(page, bad_terms, regex, ids):
+		return None
+	page_text = page.text
+	if not parts_of_speech:
+		return page_id, lines_in_section(page_text)
+
+	lines = []
+	# Assume lang has removed all L2 sections except for the relevant one
+	wikitext: wikitextparser.Section = wikitextparser.parse(page_text).get_sections(level=2)[0]
+	for section in wikitext.get_sections(level=3):
+		# Multiple etymologies
+		if re.fullmatch(r'Etymology \d+', section.title):
+			for subsection in section.get_sections(level=4):
+				if subsection.title.casefold() in parts_of_speech:
+					lines.extend(lines_in_section(subsection.contents))
+		# Single etymology
+		else:
+			if section.title.casefold() in parts_of_speech:
+				lines.extend(lines_in_section(section.contents))
+	return page_id, lines
+
+def is_candidate(
+		page: parsing.etree_helpers.Page,
+		bad_terms: collections.abc.Container[int] | None = None,
+		regex: str | None = None,
+		ids: collections.abc.Container[int] | None = None
+		) -> bool:
+	'''Returns whether a page is one of ids (if given), and is neither one of bad_terms nor excluded by regex.'''
+	if ids is not None and page.id not in ids:
+		return False
+	return not ((bad_terms and page.id in bad_terms) or (regex and not re.fullmatch(regex, page.title)))
 
 if __name__ == '__main__':
 	main()
@@ -1,4 +1,6 @@
 import argparse
+import contextlib
+import sqlite3
 
 import parsing.parse_cats
 import parsing.parse_redirects
@@ -6,31 +8,47 @@ import parsing.parse_stubs
 
 INSUFFICIENT_CATEGORIES = ['Templates and modules needing documentation']
 TEMPLATE_NS = 10
-TEMPLATE_PREFIX = 'Template:'
 
 def main():
 	parser = argparse.ArgumentParser()
-	parser.add_argument('stubs_path', help='The path of the CSV file produced by parse_stubs.')
-	parser.add_argument('cats_path', help='The path of the CSV file produced by parse_cats.')
-	parser.add_argument('redirects_path', help='The path of the CSV file produced by parse_redirects.')
+	parser.add_argument('stubs_path', nargs='?', help='The path of the CSV file produced by parse_stubs. Required unless --db-path is given.')
+	parser.add_argument('cats_path', nargs='?', help='The path of the CSV file produced by parse_cats. Required unless --db-path is given.')
+	parser.add_argument('redirects_path', nargs='?', help='The path of the CSV file produced by parse_redirects. Required unless --db-path is given.')
 	parser.add_argument('output_path')
+	parser.add_argument('-d', '--db-path', help='The path of a database containing stubs, categories and redirects, as built by parsing.build_db. If given, the templates are found with a single query rather than by reading the CSV files.')
 	args = parser.parse_args()
 
-	temp_titles = {title.removeprefix(TEMPLATE_PREFIX) for id_, ns, title in parsing.parse_stubs.stubs_gen(args.stubs_path) if ns == TEMPLATE_NS and '/' not in title}
-
-	for src_id, src_title, dst_id, dst_title in parsing.parse_redirects.redirects_gen(args.redirects_path):
-		if src_title.startswith(TEMPLATE_PREFIX):
-			temp_titles.discard(src_title.removeprefix(TEMPLATE_PREFIX))
-
-	for cat_id, cat_title, page_id, page_title in parsing.parse_cats.cats_gen(args.cats_path):
-		if page_title.startswith(TEMPLATE_PREFIX):
-			temp_title = page_title.removeprefix(TEMPLATE_PREFIX)
-			if temp_title in temp_titles and cat_title not in INSUFFICIENT_CATEGORIES:
-				temp_titles.discard(temp_title)
+	if args.db_path:
+		temp_titles = find_undercategorized_from_db(args.db_path)
+	elif args.stubs_path and args.cats_path and args.redirects_path:
+		temp_titles = find_undercategorized(args.stubs_path, args.cats_path, args.redirects_path)
+	else:
+		parser.error('the stubs, categories and redirects paths are required unless --db-path is given')
 
 	with open(args.output_path, 'w', encoding='utf-8') as out_file:
 		for title in temp_titles:
 			print(f'|{{{{tl|{title}}}}}', file=out_file)
 
+def find_undercategorized(stubs_path: str, cats_path: str, redirects_path: str) -> set[str]:
+	'''Returns the titles (without the namespace prefix) of templates that are neither redirects nor in any category other than INSUFFICIENT_CATEGORIES.'''
+	redirect_master = parsing.parse_redirects.RedirectMaster(redirects_path)
+	temp_titles = {id_: title for id_, ns, title in parsing.parse_stubs.stubs_gen(stubs_path) if ns == TEMPLATE_NS and '/' not in title and not redirect_master.is_redirect(id_)}
+
+	for cat_link in parsing.parse_cats.cats_gen(cats_path):
+		if cat_link.page_ns == TEMPLATE_NS and cat_link.cat_title not in INSUFFICIENT_CATEGORIES:
+			temp_titles.pop(cat_link.page_id, None)
+	return set(temp_titles.values())
+
+def find_undercategorized_from_db(db_path: str) -> set[str]:
+	'''Like find_undercategorized, but reads a database built by parsing.build_db.'''
+	query = f'''
+		SELECT title FROM stubs
+		WHERE ns = ? AND instr(title, '/') = 0
+		AND id NOT IN (SELECT src_id FROM redirects)
+		AND id NOT IN (SELECT page_id FROM cats WHERE cat_title NOT IN ({', '.join('?' for cat in INSUFFICIENT_CATEGORIES)}))
+	'''
+	with contextlib.closing(sqlite3.connect(db_path)) as connection:
+		return {title for title, in connection.execute(query, (TEMPLATE_NS, *INSUFFICIENT_CATEGORIES))}
+
 if __name__ == '__main__':
 	main()
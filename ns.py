@@ -1,21 +1,30 @@
 import argparse
 import xml.etree.ElementTree as xet
 
+import parsing.bz2_helpers
 import parsing.etree_helpers
+import parsing.page_index
 
 VERBOSE_FACTOR = 10 ** 5
+# Output is written in large blocks, since most of the time is spent copying
+WRITE_BUFFER_SIZE = 2 ** 22
 
 def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument('input_path')
 	parser.add_argument('namespaces', nargs='+', help='The index(es) of the namespace(s) to select. If namespaces are separated by spaces then separate files will be created for each namespace. If they are separated by commas, the pages in all of the specified namespaces will be saved in one file. You can also use a combination: "0,1 2" will save namespaces 0 and 1 into one file, and namespace 2 into another.')
 	parser.add_argument('-o', '--output-path-prefix', default='pages-')
+	parser.add_argument('-x', '--parse-xml', action='store_true', help='Parses each page and writes it out again, rather than copying the bytes of the selected pages as they are. This is much slower, and only normalizes the formatting of the XML.')
 	parser.add_argument('-v', '--verbose', action='store_true')
 	args = parser.parse_args()
 	namespace_groups = []
 	for comma_sep in args.namespaces:
 		namespace_groups.append([int(ns) for ns in comma_sep.split(',')])
 
+	if not args.parse_xml:
+		copy_namespaces(args.input_path, namespace_groups, args.output_path_prefix, args.verbose)
+		return
+
 	ns_files = {}
 	for group in namespace_groups:
 		group_str = ','.join(str(ns) for ns in group)
@@ -44,5 +53,31 @@ def main():
 		group_file.write('</mediawiki>\n')
 		group_file.close()
 
+def copy_namespaces(input_path: str, namespace_groups: list[list[int]], output_path_prefix: str, verbose: bool = False) -> None:
+	'''Copies the raw XML of the pages in each group of namespaces to its own file, finding the namespace of each page with a byte search rather than parsing it.'''
+	ns_files = {}
+	group_files = []
+	for group in namespace_groups:
+		group_str = ','.join(str(ns) for ns in group)
+		group_file = open(f'{output_path_prefix}{group_str}.xml', 'wb', buffering=WRITE_BUFFER_SIZE)
+		group_files.append(group_file)
+		for ns in group:
+			ns_files[ns] = group_file
+		group_file.write(b'<mediawiki>\n  ')
+
+	with parsing.bz2_helpers.open_pages(input_path) as pages_file:
+		for count, (_, page_xml) in enumerate(parsing.page_index.raw_pages_gen(pages_file)):
+			# <ns> comes before <revision>, so the first match is the page's own
+			out_file = ns_files.get(int(parsing.page_index.NS_PATTERN.search(page_xml)[1]))
+			if out_file:
+				out_file.write(page_xml)
+				out_file.write(b'\n  ')
+			if verbose and count % VERBOSE_FACTOR == 0:
+				print(f'{count:,}')
+
+	for group_file in group_files:
+		group_file.write(b'</mediawiki>\n')
+		group_file.close()
+
 if __name__ == '__main__':
 	main()
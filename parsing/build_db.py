@@ -0,0 +1,89 @@
+'''
+Loads the CSV files produced by parse_stubs, parse_redirects, parse_cats and parse_temps into an indexed SQLite database, so that small questions (such as which pages are in a category, or which categories a page is in) can be answered without reading the whole files.
+The tables can then be read with the *_from_db functions of those modules, or queried directly with SQL.
+'''
+
+import argparse
+import collections.abc
+import contextlib
+import itertools
+import sqlite3
+
+import parsing.parse_cats
+import parsing.parse_redirects
+import parsing.parse_stubs
+import parsing.parse_temps
+
+BATCH_SIZE = 10 ** 5
+VERBOSE_FACTOR = 10 ** 6
+
+# The column definitions and indexes of each table
+TABLES = {
+	'stubs': ('id INTEGER PRIMARY KEY, ns INTEGER, title TEXT', [('ns', 'title')]),
+	'redirects': ('src_id INTEGER, src_title TEXT, dst_id INTEGER, dst_title TEXT', [('src_id',), ('dst_id',), ('dst_title',)]),
+	'cats': ('cat_id INTEGER, cat_title TEXT, page_id INTEGER, page_ns INTEGER, page_title TEXT', [('cat_id',), ('cat_title',), ('page_id',)]),
+	'temps': ('temp_id INTEGER, temp_title TEXT, page_id INTEGER, page_title TEXT', [('temp_id',), ('temp_title',), ('page_id',)]),
+}
+
+def main():
+	parser = argparse.ArgumentParser(description='Loads CSV files produced by the parse_* scripts into an SQLite database. Each table that is given replaces any existing table of the same name, so the database can be updated one table at a time.')
+	parser.add_argument('db_path', help='Path of the SQLite database to write to. (It will be created if it does not exist.)')
+	parser.add_argument('-s', '--stubs-path', help='Path of the CSV file produced by parse_stubs.')
+	parser.add_argument('-r', '--redirects-path', help='Path of the CSV file produced by parse_redirects.')
+	parser.add_argument('-c', '--cats-path', help='Path of the CSV file produced by parse_cats.')
+	parser.add_argument('-t', '--temps-path', help='Path of the CSV file produced by parse_temps.')
+	parser.add_argument('-v', '--verbose', action='store_true')
+	args = parser.parse_args()
+
+	sources = {
+		'stubs': (args.stubs_path, parsing.parse_stubs.stubs_gen),
+		'redirects': (args.redirects_path, parsing.parse_redirects.redirects_gen),
+		'cats': (args.cats_path, parsing.parse_cats.cats_gen),
+		'temps': (args.temps_path, parsing.parse_temps.temps_gen),
+	}
+	with contextlib.closing(connect_for_loading(args.db_path)) as connection:
+		for table, (path, rows_gen) in sources.items():
+			if path:
+				if args.verbose:
+					print(f'Loading {table}:')
+				load_table(connection, table, rows_gen(path), args.verbose)
+
+def connect_for_loading(db_path: str) -> sqlite3.Connection:
+	connection = sqlite3.connect(db_path)
+	# The database can simply be rebuilt if loading is interrupted, so durability is not needed
+	connection.execute('PRAGMA journal_mode = OFF')
+	connection.execute('PRAGMA synchronous = OFF')
+	connection.execute('PRAGMA temp_store = MEMORY')
+	# In KiB (when negative)
+	connection.execute('PRAGMA cache_size = -1000000')
+	return connection
+
+def load_table(
+		connection: sqlite3.Connection,
+		table: str,
+		rows: collections.abc.Iterable[tuple],
+		verbose: bool = False,
+		tables: dict[str, tuple[str, list[tuple[str, ...]]]] = TABLES
+		) -> None:
+	'''Replaces a table with the given rows, and then indexes it. tables gives the column definitions and indexes of the table (by default those of the tables of this module).'''
+	columns, indexes = tables[table]
+	connection.execute(f'DROP TABLE IF EXISTS {table}')
+	connection.execute(f'CREATE TABLE {table} ({columns})')
+	placeholders = ', '.join('?' for column in columns.split(','))
+	rows = iter(rows)
+	count = 0
+	# Inserting in large batches within one transaction (and indexing afterwards) is much faster than inserting rows one at a time
+	while batch := list(itertools.islice(rows, BATCH_SIZE)):
+		# For tables with a primary key (such as stubs), the last row with each key is kept
+		connection.executemany(f'INSERT OR REPLACE INTO {table} VALUES ({placeholders})', batch)
+		if verbose and (count + len(batch)) // VERBOSE_FACTOR > count // VERBOSE_FACTOR:
+			print(f'{count + len(batch):,}')
+		count += len(batch)
+	if verbose:
+		print(f'Indexing {table}...')
+	for index_columns in indexes:
+		connection.execute(f'CREATE INDEX {table}_{"_".join(index_columns)} ON {table} ({", ".join(index_columns)})')
+	connection.commit()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,106 @@
+'''
+Reading of bz2 multistream pages files (such as pages-articles-multistream.xml.bz2) without first decompressing them to disk.
+
+A multistream file is a concatenation of independent bz2 streams, each holding (apart from the first and last) 100 pages. Its index file (such as pages-articles-multistream-index.txt.bz2) gives the byte offset of the stream containing each page, so the streams can be decompressed in parallel and reassembled in order.
+'''
+
+import bz2
+import collections.abc
+import concurrent.futures
+import io
+import os
+import os.path
+
+import parsing.pool_window
+
+# Number of consecutive bz2 streams decompressed by a single task, to amortize the cost of passing data between processes
+STREAMS_PER_TASK = 16
+READ_BUFFER_SIZE = 2 ** 20
+
+def default_index_path(pages_path: str) -> str | None:
+	'''
+	Returns the path the index of a multistream pages file would have in the dumps, if such a file exists.
+	For example, the index of enwiktionary-20240901-pages-articles-multistream.xml.bz2 is enwiktionary-20240901-pages-articles-multistream-index.txt.bz2.
+	'''
+	if pages_path.endswith('.xml.bz2'):
+		index_path = pages_path.removesuffix('.xml.bz2') + '-index.txt.bz2'
+		if os.path.exists(index_path):
+			return index_path
+	return None
+
+def stream_offsets(index_path: str) -> list[int]:
+	'''Returns the byte offsets of all the streams listed in a multistream index, in order.'''
+	offsets: list[int] = []
+	with bz2.open(index_path, 'rt', encoding='utf-8') as index_file:
+		# Each line is of the form offset:page_id:page_title
+		for line in index_file:
+			offset = int(line.split(':', maxsplit=1)[0])
+			if not offsets or offsets[-1] != offset:
+				offsets.append(offset)
+	return offsets
+
+def stream_ranges(pages_path: str, index_path: str) -> list[tuple[int, int]]:
+	'''
+	Returns the (start, end) byte ranges of every stream in a multistream pages file.
+	The streams containing the opening <mediawiki> and <siteinfo> (before the first indexed stream) and the closing </mediawiki> (after the last) are not in the index, so they are included here by starting at zero and ending at the file size.
+	'''
+	bounds = [0, *stream_offsets(index_path), os.path.getsize(pages_path)]
+	return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+def decompress_range(pages_path: str, start: int, end: int) -> bytes:
+	'''Decompresses the (one or more complete) bz2 streams found between the given byte offsets.'''
+	with open(pages_path, 'rb') as pages_file:
+		pages_file.seek(start)
+		return bz2.decompress(pages_file.read(end - start))
+
+def decompressed_chunks(pages_path: str, index_path: str, processes: int | None = None) -> collections.abc.Iterator[bytes]:
+	'''Yields the decompressed contents of a multistream pages file in order, while decompressing upcoming streams in a pool of processes.'''
+	ranges = stream_ranges(pages_path, index_path)
+	task_ranges = [(ranges[i][0], ranges[min(i + STREAMS_PER_TASK, len(ranges)) - 1][1]) for i in range(0, len(ranges), STREAMS_PER_TASK)]
+	processes = processes or os.cpu_count() or 1
+	with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+		# Keep the pool busy, but bound the number of decompressed chunks waiting in memory
+		yield from parsing.pool_window.windowed_results(executor, decompress_range, ((pages_path, start, end) for start, end in task_ranges), processes * parsing.pool_window.TASKS_PER_JOB)
+
+class MultistreamReader(io.RawIOBase):
+	'''A read-only binary file object over the decompressed contents of a multistream pages file.'''
+
+	def __init__(self, pages_path: str, index_path: str, processes: int | None = None):
+		super().__init__()
+		self._chunks = decompressed_chunks(pages_path, index_path, processes)
+		self._chunk = memoryview(b'')
+		self._pos = 0
+
+	def readable(self) -> bool:
+		return True
+
+	def readinto(self, buffer) -> int:
+		while self._pos >= len(self._chunk):
+			try:
+				self._chunk = memoryview(next(self._chunks))
+			except StopIteration:
+				return 0
+			self._pos = 0
+		size = min(len(buffer), len(self._chunk) - self._pos)
+		buffer[:size] = self._chunk[self._pos:self._pos + size]
+		self._pos += size
+		return size
+
+	def close(self) -> None:
+		# Shuts down the process pool
+		self._chunks.close()
+		super().close()
+
+def open_pages(pages_path: str, index_path: str | None = None, processes: int | None = None) -> io.BufferedIOBase:
+	'''
+	Opens a pages file for reading in binary mode.
+	The file may be uncompressed XML, or compressed with bz2. If it is a multistream file and its index is given (or can be found next to it), its streams are decompressed in parallel, unless processes is 1.
+	'''
+	if pages_path.endswith('.bz2'):
+		index_path = index_path or default_index_path(pages_path)
+		if index_path and processes != 1:
+			return io.BufferedReader(MultistreamReader(pages_path, index_path, processes), buffer_size=READ_BUFFER_SIZE)
+		else:
+			return bz2.open(pages_path, 'rb')
+	else:
+		return open(pages_path, 'rb')
@@ -0,0 +1,81 @@
+'''
+Checkpoints for long scans through an input file (such as a pages file or an SQL dump), so that a scan that is interrupted can be resumed from where it got to rather than from the beginning.
+
+A checkpoint records the byte offset up to which the input has been processed and the state of the script at that point (which must be picklable). It is written to a temporary file that is then renamed over the previous checkpoint, so a crash while saving leaves the previous checkpoint intact.
+
+parsing.page_pool and parsing.sql_helpers split their input into pieces and report the end of each piece to the checkpoint once it has been processed (including by the caller, for functions that yield results). The script sets get_state to a function returning its state, and restores that state from the state attribute when resuming.
+'''
+
+import collections.abc
+import os
+import pickle
+import time
+import typing
+
+# Seconds between checkpoints
+DEFAULT_INTERVAL = 5 * 60
+# The minimum number of pieces an input is split into when checkpointing, which limits how much work is lost when resuming
+MIN_PIECE_COUNT = 256
+
+class Checkpoint:
+	def __init__(self, checkpoint_path: str, input_path: str, resume: bool = False, interval: float = DEFAULT_INTERVAL):
+		'''If resume is true and a checkpoint exists at checkpoint_path, it is loaded. It is a ValueError if the input file has changed since the checkpoint was saved.'''
+		self.checkpoint_path = checkpoint_path
+		self.input_path = input_path
+		self.interval = interval
+		self.input_identity = file_identity(input_path)
+		# The offset in the input up to which it has been processed
+		self.offset = 0
+		self.state = None
+		self.resumed = False
+		self.get_state: collections.abc.Callable[[], object] | None = None
+		if resume and os.path.exists(checkpoint_path):
+			with open(checkpoint_path, 'rb') as checkpoint_file:
+				input_identity, self.offset, self.state = pickle.load(checkpoint_file)
+			if input_identity != self.input_identity:
+				raise ValueError(f'{input_path} has changed since the checkpoint {checkpoint_path} was saved, so it cannot be resumed.')
+			self.resumed = True
+		self.last_save = time.monotonic()
+
+	def reached(self, offset: int) -> None:
+		'''Records that the input has been processed up to offset, and saves a checkpoint if one is due.'''
+		self.offset = offset
+		if time.monotonic() - self.last_save >= self.interval:
+			self.save()
+
+	def save(self) -> None:
+		temp_path = self.checkpoint_path + '.tmp'
+		with open(temp_path, 'wb') as checkpoint_file:
+			pickle.dump((self.input_identity, self.offset, self.get_state() if self.get_state else None), checkpoint_file, pickle.HIGHEST_PROTOCOL)
+			checkpoint_file.flush()
+			os.fsync(checkpoint_file.fileno())
+		os.replace(temp_path, self.checkpoint_path)
+		self.last_save = time.monotonic()
+
+	def finish(self) -> None:
+		'''Deletes the checkpoint, once the script has finished.'''
+		if os.path.exists(self.checkpoint_path):
+			os.remove(self.checkpoint_path)
+
+def file_identity(path: str) -> tuple[int, int]:
+	stat = os.stat(path)
+	return stat.st_size, stat.st_mtime_ns
+
+def clip_pieces(pieces: list[tuple[int, int]], offset: int) -> list[tuple[int, int]]:
+	'''Returns the (start, end) byte ranges of the parts of pieces of an input that come after offset.'''
+	return [(max(start, offset), end) for start, end in pieces if end > offset]
+
+def open_output(path: str, position: int | None = None) -> typing.TextIO:
+	'''Opens a UTF-8 text file for writing. If position is given (when resuming), the existing file is kept, but truncated to position, which should have come from output_position.'''
+	if position is None:
+		return open(path, 'w', encoding='utf-8')
+	out_file = open(path, 'r+', encoding='utf-8')
+	out_file.seek(position)
+	out_file.truncate()
+	return out_file
+
+def output_position(out_file: typing.TextIO) -> int:
+	'''Returns the position of the end of an output file, after making sure that everything written to it is on disk.'''
+	out_file.flush()
+	os.fsync(out_file.fileno())
+	return out_file.tell()
@@ -1,11 +1,49 @@
 import collections.abc
+import functools
+import html
 import re
 import xml.etree.ElementTree as xet
 
+import parsing.bz2_helpers
+
 XML_NS_PATTERN = r'^\{.+?\}'
+READ_SIZE = 2 ** 16
+PAGE_FIELDS = ('id', 'ns', 'title', 'timestamp', 'revision_id', 'sha1', 'text')
+
+class Page:
+	'''The data of one page in a pages file. Fields that were not requested when the page was read are None.'''
+	__slots__ = PAGE_FIELDS
+
+	def __init__(self, **fields):
+		for field in PAGE_FIELDS:
+			setattr(self, field, fields.get(field))
+
+	def __repr__(self) -> str:
+		return f'Page(id={self.id!r}, ns={self.ns!r}, title={self.title!r})'
+
+	def to_xml(self, text: str | None = None) -> str:
+		'''Returns the XML of a <page> element containing those fields that are not None. If text is given, it is used in place of the page's text.'''
+		parts = ['<page>']
+		for field in ['title', 'ns', 'id']:
+			value = getattr(self, field)
+			if value is not None:
+				parts.append(f'<{field}>{html.escape(str(value), quote=False)}</{field}>')
+		parts.append('<revision>')
+		if self.revision_id is not None:
+			parts.append(f'<id>{self.revision_id}</id>')
+		for field in ['timestamp', 'sha1']:
+			value = getattr(self, field)
+			if value is not None:
+				parts.append(f'<{field}>{html.escape(value, quote=False)}</{field}>')
+		if text is None:
+			text = self.text
+		if text is not None:
+			parts.append(f'<text xml:space="preserve">{html.escape(text, quote=False)}</text>')
+		parts.append('</revision></page>')
+		return ''.join(parts)
 
 def tag_without_xml_ns_is(elem: xet.Element, target_tag: str) -> bool:
-	return elem.tag.endswith(target_tag) and bool(re.fullmatch(f'({XML_NS_PATTERN})?{re.escape(target_tag)}', elem.tag))
+	return elem.tag == target_tag or (elem.tag.endswith('}' + target_tag) and elem.tag.startswith('{'))
 
 def rm_xml_nses(elem: xet.Element) -> xet.Element:
 	elem.tag = re.sub(XML_NS_PATTERN, '', elem.tag)
@@ -26,10 +64,74 @@ def find_child(elem: xet.Element, tag: str, xml_nses: bool = True) -> xet.Elemen
 		return None
 	return child
 
-def pages_gen(pages_path: str) -> collections.abc.Iterator[xet.Element]:
-	return (elem for _, elem in xet.iterparse(pages_path) if tag_without_xml_ns_is(elem, 'page'))
+def pages_gen(pages_path: str, index_path: str | None = None, processes: int | None = None) -> collections.abc.Iterator[xet.Element]:
+	'''
+	pages_path may be an uncompressed XML file or a bz2 file. If it is a multistream file (such as pages-articles-multistream.xml.bz2), index_path should be its index (such as pages-articles-multistream-index.txt.bz2), which allows its streams to be decompressed by multiple processes. If index_path is not given it is looked for next to pages_path.
+	'''
+	with parsing.bz2_helpers.open_pages(pages_path, index_path, processes) as pages_file:
+		yield from (elem for _, elem in xet.iterparse(pages_file) if tag_without_xml_ns_is(elem, 'page'))
+
+def iter_pages(
+		pages_path: str,
+		fields: collections.abc.Collection[str] = PAGE_FIELDS,
+		index_path: str | None = None,
+		processes: int | None = None
+		) -> collections.abc.Iterator[Page]:
+	'''
+	Yields a Page for each page in a pages file, with only the given fields filled in. See pages_gen for the meaning of the other arguments.
+	This is much faster than using pages_gen and find_child, and the memory used by each page is freed as soon as it has been read.
+	'''
+	with parsing.bz2_helpers.open_pages(pages_path, index_path, processes) as pages_file:
+		yield from parse_pages(iter(functools.partial(pages_file.read, READ_SIZE), b''), fields)
+
+def parse_pages(chunks: collections.abc.Iterable[bytes], fields: collections.abc.Collection[str] = PAGE_FIELDS) -> collections.abc.Iterator[Page]:
+	'''Yields a Page for each page in an XML document given as a sequence of chunks of bytes.'''
+	fields = set(fields)
+	unknown_fields = fields - set(PAGE_FIELDS)
+	if unknown_fields:
+		raise ValueError(f'Unknown page fields: {", ".join(unknown_fields)}')
+	need_revision = bool(fields & {'timestamp', 'revision_id', 'sha1', 'text'})
+
+	parser = xet.XMLPullParser(events=('start', 'end'))
+	root = None
+	for chunk in chunks:
+		parser.feed(chunk)
+		for event, elem in parser.read_events():
+			if event == 'end':
+				if elem.tag != page_tag:
+					continue
+				page = Page()
+				if 'id' in fields:
+					page.id = int(elem.findtext(id_tag))
+				if 'ns' in fields:
+					page.ns = int(elem.findtext(ns_tag))
+				if 'title' in fields:
+					page.title = elem.findtext(title_tag)
+				if need_revision:
+					revision = elem.find(revision_tag)
+					if revision is not None:
+						if 'revision_id' in fields:
+							page.revision_id = int(revision.findtext(id_tag))
+						if 'timestamp' in fields:
+							page.timestamp = revision.findtext(timestamp_tag)
+						if 'sha1' in fields:
+							page.sha1 = revision.findtext(sha1_tag)
+						if 'text' in fields:
+							page.text = revision.findtext(text_tag)
+				# Free the page (and any previous pages) now that its data has been copied
+				root.clear()
+				yield page
+			elif root is None:
+				root = elem
+				# Work out the XML namespace once rather than comparing tags without it
+				xml_ns = re.match(XML_NS_PATTERN, root.tag)
+				prefix = xml_ns[0] if xml_ns else ''
+				page_tag, id_tag, ns_tag, title_tag, revision_tag, timestamp_tag, sha1_tag, text_tag = (prefix + tag for tag in ['page', 'id', 'ns', 'title', 'revision', 'timestamp', 'sha1', 'text'])
+	parser.close()
 
 def get_mw_namespaces(path: str) -> dict[int, str]:
-	mw_ns_elem = next(elem for _, elem in xet.iterparse(path) if tag_without_xml_ns_is(elem, 'namespaces'))
+	# The namespaces are near the start of the file, so there is no point in decompressing in parallel
+	with parsing.bz2_helpers.open_pages(path, processes=1) as pages_file:
+		mw_ns_elem = next(elem for _, elem in xet.iterparse(pages_file) if tag_without_xml_ns_is(elem, 'namespaces'))
 	rm_xml_nses(mw_ns_elem)
 	return {int(child.get('key')): child.text or '' for child in mw_ns_elem if child.tag == 'namespace'}
@@ -0,0 +1,119 @@
+'''
+Sorting and counting of more items than fit in memory, by writing sorted runs of items to temporary files and merging them.
+
+A run is a file of pickled batches of items in sorted order. Runs are merged with heapq.merge, several at a time if there are too many to have open at once.
+'''
+
+import collections
+import collections.abc
+import heapq
+import itertools
+import operator
+import os
+import pickle
+import tempfile
+import typing
+
+T = typing.TypeVar('T')
+# Number of items pickled together when writing a run
+RUN_BATCH_SIZE = 10 ** 4
+# Maximum number of runs merged at once
+MAX_MERGE_RUNS = 64
+DEFAULT_MAX_ITEMS = 10 ** 7
+
+def write_run(items: collections.abc.Iterable, spill_dir: str) -> str:
+	'''Writes items (which should already be sorted) to a new run file in spill_dir, and returns its path.'''
+	fd, path = tempfile.mkstemp(suffix='.run', dir=spill_dir)
+	with os.fdopen(fd, 'wb') as run_file:
+		items = iter(items)
+		while batch := list(itertools.islice(items, RUN_BATCH_SIZE)):
+			pickle.dump(batch, run_file, pickle.HIGHEST_PROTOCOL)
+	return path
+
+def read_run(path: str, delete: bool = False) -> collections.abc.Iterator:
+	'''Yields the items in a run file, deleting it afterwards if delete is true.'''
+	with open(path, 'rb') as run_file:
+		while True:
+			try:
+				yield from pickle.load(run_file)
+			except EOFError:
+				break
+	if delete:
+		os.remove(path)
+
+def merge_runs(
+		paths: collections.abc.Sequence[str],
+		spill_dir: str,
+		key: collections.abc.Callable | None = None,
+		reduce: collections.abc.Callable[[collections.abc.Iterator], collections.abc.Iterator] | None = None,
+		extra: collections.abc.Iterable = (),
+		delete: bool = True
+		) -> collections.abc.Iterator:
+	'''
+	Yields the items in the given runs and the sorted iterable extra, in sorted order. The runs are deleted once they have been read, unless delete is false (intermediate runs are always deleted).
+	If reduce is given, it is applied to the merged items (such as to combine items with equal keys), both to the final output and to any intermediate runs written while merging.
+	'''
+	runs = [read_run(path, delete) for path in paths]
+	while len(runs) > MAX_MERGE_RUNS:
+		group, runs = runs[:MAX_MERGE_RUNS], runs[MAX_MERGE_RUNS:]
+		merged = heapq.merge(*group, key=key)
+		runs.append(read_run(write_run(reduce(merged) if reduce else merged, spill_dir), delete=True))
+	merged = heapq.merge(*runs, extra, key=key)
+	return reduce(merged) if reduce else merged
+
+def external_sort(
+		items: collections.abc.Iterable[T],
+		spill_dir: str,
+		key: collections.abc.Callable | None = None,
+		max_items: int = DEFAULT_MAX_ITEMS
+		) -> collections.abc.Iterator[T]:
+	'''Yields items in sorted order, holding at most max_items in memory at once (apart from those being merged) and writing the rest to runs in spill_dir.'''
+	runs = []
+	items = iter(items)
+	while chunk := list(itertools.islice(items, max_items)):
+		chunk.sort(key=key)
+		if len(chunk) < max_items and not runs:
+			# Everything fits in memory
+			return iter(chunk)
+		runs.append(write_run(chunk, spill_dir))
+	return merge_runs(runs, spill_dir, key)
+
+def sum_counts(items: collections.abc.Iterator[tuple[T, int]]) -> collections.abc.Iterator[tuple[T, int]]:
+	'''Combines adjacent (key, count) pairs with equal keys by adding their counts.'''
+	for item_key, group in itertools.groupby(items, key=operator.itemgetter(0)):
+		yield item_key, sum(count for _, count in group)
+
+class SpillingCounter:
+	'''
+	A counter whose counts are written to a sorted run in spill_dir whenever it has more than max_keys keys, so that its memory use stays bounded. Keys must be orderable.
+	Since runs are files, a SpillingCounter can be pickled and sent to another process (on the same machine) cheaply.
+	'''
+
+	def __init__(self, spill_dir: str, max_keys: int = DEFAULT_MAX_ITEMS):
+		self.spill_dir = spill_dir
+		self.max_keys = max_keys
+		self.counts = collections.Counter()
+		self.runs: list[str] = []
+
+	def update(self, counts: 'collections.abc.Mapping[T, int] | SpillingCounter') -> None:
+		'''Adds the counts of a mapping or another SpillingCounter (whose runs are taken over) to this one.'''
+		if isinstance(counts, SpillingCounter):
+			self.runs.extend(counts.runs)
+			counts.runs = []
+			counts = counts.counts
+		self.counts.update(counts)
+		if len(self.counts) > self.max_keys:
+			self.spill()
+
+	def spill(self) -> None:
+		'''Writes the counts held in memory to a run.'''
+		if not self.counts:
+			return
+		self.runs.append(write_run(sorted(self.counts.items()), self.spill_dir))
+		self.counts = collections.Counter()
+
+	def items(self, delete: bool = True) -> collections.abc.Iterator[tuple[T, int]]:
+		'''Yields each key and its total count in order of key. This consumes the counter. Its runs are deleted once they have been read, unless delete is false.'''
+		runs, self.runs = self.runs, []
+		counts, self.counts = self.counts, collections.Counter()
+		return merge_runs(runs, self.spill_dir, key=operator.itemgetter(0), reduce=sum_counts, extra=sorted(counts.items()), delete=delete)
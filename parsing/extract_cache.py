@@ -0,0 +1,127 @@
+'''
+A persistent cache of the results of per-page functions (extractors), so that rerunning a script (even on a newer dump) only parses the pages whose text has changed.
+
+Results are stored in an SQLite database, keyed by the name of the extractor and the page ID. A cached result is only used if the page still has the same title and revision SHA-1, and the extractor has the same version. An extractor's name should therefore include any options that change its results, and its version should be increased whenever its code changes.
+
+Worker processes only read from the cache. New results are sent back to the main process, which writes them.
+'''
+
+import collections.abc
+import os
+import pickle
+import sqlite3
+
+import parsing.checkpoint
+import parsing.etree_helpers
+import parsing.page_index
+import parsing.page_pool
+
+# Number of results written between commits
+COMMIT_INTERVAL = 10 ** 4
+
+# Connections opened by CachedPageFunc, which are kept open for the lifetime of each process. They are keyed by process ID as well as path, since connections must not be used by processes forked after they were opened.
+_read_caches: dict[tuple[int, str], 'ExtractCache'] = {}
+
+class ExtractCache:
+	def __init__(self, cache_path: str, read_only: bool = False):
+		if read_only:
+			self.connection = sqlite3.connect(f'file:{cache_path}?mode=ro', uri=True)
+		else:
+			self.connection = sqlite3.connect(cache_path)
+			# Allow worker processes to read while results are being written
+			self.connection.execute('PRAGMA journal_mode = WAL')
+			self.connection.execute('PRAGMA synchronous = NORMAL')
+			self.connection.execute('CREATE TABLE IF NOT EXISTS extracts (extractor TEXT, page_id INTEGER, title TEXT, sha1 TEXT, version TEXT, value BLOB, PRIMARY KEY (extractor, page_id))')
+			self.connection.commit()
+		self.uncommitted = 0
+
+	def __enter__(self) -> 'ExtractCache':
+		return self
+
+	def __exit__(self, *exc_info) -> None:
+		self.close()
+
+	def close(self) -> None:
+		self.connection.commit()
+		self.connection.close()
+
+	def get(self, extractor: str, version: str, page: parsing.etree_helpers.Page) -> tuple[bool, object]:
+		'''Returns whether a result for the page is cached, and the result if it is.'''
+		row = self.connection.execute('SELECT title, sha1, version, value FROM extracts WHERE extractor = ? AND page_id = ?', (extractor, page.id)).fetchone()
+		if row is None or row[:3] != (page.title, page.sha1, version):
+			return False, None
+		return True, pickle.loads(row[3])
+
+	def put(self, extractor: str, version: str, page_id: int, title: str, sha1: str, value: object) -> None:
+		self.connection.execute('INSERT OR REPLACE INTO extracts VALUES (?, ?, ?, ?, ?, ?)', (extractor, page_id, title, sha1, version, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+		self.uncommitted += 1
+		if self.uncommitted >= COMMIT_INTERVAL:
+			self.connection.commit()
+			self.uncommitted = 0
+
+class CachedPageFunc:
+	'''
+	Wraps a per-page function so that cached results are used where possible.
+	For each page it returns a (hit, page ID, title, SHA-1, result) tuple, where hit indicates that the result came from the cache. Pages rejected by page_filter give None.
+	'''
+
+	def __init__(
+			self,
+			page_func: parsing.page_pool.PageFunc,
+			cache_path: str,
+			extractor: str,
+			version: str,
+			page_filter: collections.abc.Callable[[parsing.etree_helpers.Page], bool] | None = None):
+		self.page_func = page_func
+		self.cache_path = cache_path
+		self.extractor = extractor
+		self.version = version
+		self.page_filter = page_filter
+
+	def __call__(self, page: parsing.etree_helpers.Page) -> tuple[bool, int, str, str, object] | None:
+		if self.page_filter and not self.page_filter(page):
+			return None
+		if page.sha1:
+			key = (os.getpid(), self.cache_path)
+			if key not in _read_caches:
+				_read_caches[key] = ExtractCache(self.cache_path, read_only=True)
+			hit, value = _read_caches[key].get(self.extractor, self.version, page)
+			if hit:
+				return True, page.id, page.title, page.sha1, value
+		return False, page.id, page.title, page.sha1, self.page_func(page)
+
+def map_cached_pages(
+		pages_path: str,
+		page_func: parsing.page_pool.PageFunc,
+		cache_path: str,
+		extractor: str,
+		version: str,
+		page_filter: collections.abc.Callable[[parsing.etree_helpers.Page], bool] | None = None,
+		jobs: int = 1,
+		verbose_factor: int = 0,
+		fields: collections.abc.Collection[str] = parsing.etree_helpers.PAGE_FIELDS,
+		page_index_path: str | None = None,
+		ids: collections.abc.Iterable[int] | None = None,
+		checkpoint: parsing.checkpoint.Checkpoint | None = None
+		) -> collections.abc.Iterator:
+	'''
+	Like parsing.page_pool.map_pages, but looks up the result of page_func for each page in the cache at cache_path, and only calls page_func on pages that are not cached. New results (including None) are added to the cache.
+	page_func must not depend on anything other than the page and the options included in extractor, so the pages it should skip must be excluded with page_filter instead.
+	If page_index_path is given, only the pages with the given ids are read, using parsing.page_index. Otherwise checkpoint is passed on to parsing.page_pool.map_pages.
+	'''
+	fields = {*fields, 'id', 'title', 'sha1'}
+	with ExtractCache(cache_path) as cache:
+		cached_func = CachedPageFunc(page_func, cache_path, extractor, version, page_filter)
+		if page_index_path:
+			results = parsing.page_index.map_indexed_pages(page_index_path, pages_path, ids, cached_func, fields, verbose_factor)
+		else:
+			results = parsing.page_pool.map_pages(pages_path, cached_func, jobs=jobs, verbose_factor=verbose_factor, fields=fields, checkpoint=checkpoint)
+		for hit, page_id, title, sha1, value in results:
+			if not hit and sha1:
+				cache.put(extractor, version, page_id, title, sha1, value)
+			if value is not None:
+				yield value
+
+def page_in(page: parsing.etree_helpers.Page, ids: collections.abc.Container[int]) -> bool:
+	'''A page filter selecting the pages with the given IDs (to be bound with functools.partial).'''
+	return page.id in ids
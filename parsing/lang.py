@@ -1,69 +1,99 @@
 '''
-Filter terms in a specific language out of an XML file.
+Filter terms in specific languages out of an XML file.
 '''
 
 import argparse
-import typing
-import xml.etree.ElementTree as xet
-
-import wikitextparser
+import collections.abc
+import contextlib
+import functools
+import re
 
 import parsing.etree_helpers
+import parsing.page_pool
 import parsing.parse_cats
 
 CAT_VERBOSE_FACTOR = 10 ** 6
 PAGE_VERBOSE_FACTOR = 10 ** 5
+# A level 2 heading such as ==English== on a line of its own
+L2_HEADING_PATTERN = re.compile(r'^==[ \t]*([^=\n](?:[^\n]*?[^=\n])?)[ \t]*==[ \t]*$', flags=re.MULTILINE)
+LANGUAGE_PLACEHOLDER = '{language}'
 
 def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument('input_path', help='The XML pages file to parse.')
-	parser.add_argument('output_path', help='The XML pages file to write to.')
-	parser.add_argument('-l', '--language', default='English', help='The full name (*not* ISO code) of the language to select. Defaults to English.')
-	parser.add_argument('-c', '--cats-path', help='The CSV file containing category membership data, as produced by parse_cats. Providing this will cause pages to be selected based on whether they are in the categories of the selected language. Otherwise all pages are parsed to see if they have headings for the selected languages.')
+	parser.add_argument('output_path', help=f'The XML pages file to write to. If more than one language is given, this must contain "{LANGUAGE_PLACEHOLDER}", which is replaced by the name of each language to get the path of the file for that language.')
+	parser.add_argument('-l', '--language', '--languages', dest='languages', nargs='+', default=['English'], help='The full names (*not* ISO codes) of the languages to select. Defaults to English.')
+	parser.add_argument('-c', '--cats-path', help='The CSV file containing category membership data, as produced by parse_cats. Providing this will cause pages to be selected based on whether they are in the categories of the selected languages. Otherwise the headings of all pages are scanned to see if they have sections for the selected languages.')
+	parser.add_argument('-j', '--jobs', default=1, type=int, help='The number of processes to use to filter pages. Defaults to 1.')
 	parser.add_argument('-v', '--verbose', action='store_true', help='Prints occasional progress updates.')
 	args = parser.parse_args()
 
-	target_cats = [f'{args.language} lemmas', f'{args.language} non-lemma forms']
-	target_pages = set()
-	if args.verbose:
-		print('Reading in category data:')
+	if len(args.languages) > 1 and LANGUAGE_PLACEHOLDER not in args.output_path:
+		parser.error(f'output_path must contain "{LANGUAGE_PLACEHOLDER}" when more than one language is given')
+
+	target_pages = None
 	if args.cats_path:
+		target_cats = {}
+		for language in args.languages:
+			target_cats[f'{language} lemmas'] = language
+			target_cats[f'{language} non-lemma forms'] = language
+		target_pages = {language: set() for language in args.languages}
+		if args.verbose:
+			print('Reading in category data:')
 		for cat_count, cat_link in enumerate(parsing.parse_cats.cats_gen(args.cats_path)):
 			if cat_link.cat_title in target_cats:
-				target_pages.add(cat_link.page_id)
+				target_pages[target_cats[cat_link.cat_title]].add(cat_link.page_id)
 			if args.verbose and cat_count % CAT_VERBOSE_FACTOR == 0:
 				print(f'{cat_count:,}')
-	if args.verbose:
-		print(f'Found {len(target_pages):,} {args.language} terms.')
+		if args.verbose:
+			for language, pages in target_pages.items():
+				print(f'Found {len(pages):,} {language} terms.')
 
 	if args.verbose:
 		print('Filtering pages:')
-	with open(args.output_path, 'w', encoding='utf-8') as out_file:
-		out_file.write('<mediawiki>\n  ')
-		for page_count, page in enumerate(parsing.etree_helpers.pages_gen(args.input_path)):
-			is_target = False
-			if args.cats_path:
-				page_id = int(parsing.etree_helpers.find_child(page, 'id').text)
-				if page_id in target_pages:
-					is_target = True
-			else:
-				text_elem = parsing.etree_helpers.find_child(parsing.etree_helpers.find_child(page, 'revision'), 'text')
-				# Perform a fast substring search first to avoid parsing most irrelevant pages
-				if args.language in text_elem.text:
-					parsed = wikitextparser.parse(text_elem.text)
-					if any(True for section in parsed.get_sections(level=2) if section.title == args.language):
-						is_target = True
-
-			if is_target:
-				page_xml = xet.tostring(page, encoding='unicode')
-				out_file.write(page_xml)
-				out_file.write('\n  ')
+	with contextlib.ExitStack() as stack:
+		out_files = {}
+		for language in args.languages:
+			out_files[language] = stack.enter_context(open(args.output_path.replace(LANGUAGE_PLACEHOLDER, language), 'w', encoding='utf-8'))
+			out_files[language].write('<mediawiki>\n  ')
+		page_func = functools.partial(select_sections, languages=args.languages, target_pages=target_pages)
+		for page_sections in parsing.page_pool.map_pages(args.input_path, page_func, jobs=args.jobs, verbose_factor=PAGE_VERBOSE_FACTOR if args.verbose else 0):
+			for language, page_xml in page_sections:
+				out_files[language].write(page_xml)
+				out_files[language].write('\n  ')
+		for out_file in out_files.values():
+			out_file.write('\n</mediawiki>\n')
 
-			page.clear()
-			if args.verbose and page_count % PAGE_VERBOSE_FACTOR == 0:
-				print(f'{page_count:,}')
+def language_sections(text: str) -> dict[str, str]:
+	'''Returns the text of each level 2 (language) section of a page, including its heading, by the name of its language.'''
+	sections = {}
+	headings = list(L2_HEADING_PATTERN.finditer(text))
+	for heading, next_heading in zip(headings, headings[1:] + [None]):
+		end = next_heading.start() if next_heading else len(text)
+		sections.setdefault(heading[1].strip(), text[heading.start():end].rstrip('\n') + '\n')
+	return sections
 
-		out_file.write('\n</mediawiki>\n')
+def select_sections(
+		page: parsing.etree_helpers.Page,
+		languages: collections.abc.Iterable[str],
+		target_pages: dict[str, collections.abc.Container[int]] | None = None
+		) -> list[tuple[str, str]] | None:
+	'''
+	Returns a (language, XML) pair for each of the given languages that the page is a term in, where the XML is that of the page with only the section for that language. Returns None if there are no such languages.
+	If target_pages is given, it is used to determine which pages are terms in each language. Otherwise the page must simply have a section for the language.
+	'''
+	if not page.text:
+		return None
+	if target_pages is not None:
+		languages = [language for language in languages if page.id in target_pages[language]]
+	else:
+		# Perform a fast substring search first to avoid scanning most irrelevant pages
+		languages = [language for language in languages if language in page.text]
+	if not languages:
+		return None
+	sections = language_sections(page.text)
+	selected = [(language, page.to_xml(sections[language])) for language in languages if language in sections]
+	return selected or None
 
 if __name__ == '__main__':
 	main()
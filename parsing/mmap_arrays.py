@@ -0,0 +1,29 @@
+'''
+Helpers for writing arrays of numbers to binary files and reading them back through memory maps, so that large tables can be opened instantly and only the parts that are used are loaded into memory.
+'''
+
+import array
+import mmap
+import typing
+
+# Arrays are padded to a multiple of this many bytes, so that every array in a file is aligned for its type
+ALIGNMENT = 8
+
+def write_array(out_file: typing.BinaryIO, values: array.array | bytes) -> int:
+	'''Writes values to out_file followed by padding, and returns the number of bytes written.'''
+	data = values.tobytes() if isinstance(values, array.array) else values
+	padding = -len(data) % ALIGNMENT
+	out_file.write(data)
+	out_file.write(b'\0' * padding)
+	return len(data) + padding
+
+def open_mmap(path: str) -> mmap.mmap:
+	with open(path, 'rb') as in_file:
+		# The map stays valid after the file is closed
+		return mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+def array_view(buffer: mmap.mmap | memoryview, offset: int, typecode: str, count: int) -> tuple[memoryview, int]:
+	'''Returns a view of count values of the given type starting at offset in buffer, and the offset just after them (including padding).'''
+	size = count * array.array(typecode).itemsize
+	view = memoryview(buffer)[offset:offset + size].cast(typecode)
+	return view, offset + size + (-size % ALIGNMENT)
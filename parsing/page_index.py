@@ -0,0 +1,176 @@
+'''
+Builds and reads a sidecar index of an uncompressed pages file, giving the byte offset and length of each page so that individual pages can be read without scanning the whole file.
+'''
+
+import argparse
+import array
+import bisect
+import collections
+import collections.abc
+import html
+import mmap
+import re
+import typing
+
+import parsing.etree_helpers
+import parsing.page_pool
+
+VERBOSE_FACTOR = 10 ** 5
+READ_SIZE = 2 ** 20
+ID_PATTERN = re.compile(rb'<id>(\d+)</id>')
+NS_PATTERN = re.compile(rb'<ns>(-?\d+)</ns>')
+TITLE_PATTERN = re.compile(rb'<title>(.*?)</title>', flags=re.DOTALL)
+SHA1_PATTERN = re.compile(rb'<sha1>(\w*)</sha1>')
+
+IndexEntry = collections.namedtuple('IndexEntry', ['id', 'ns', 'offset', 'length', 'sha1', 'title'])
+
+def main():
+	parser = argparse.ArgumentParser(description='Creates an index of the byte offsets of the pages in a pages file, which allows other scripts to read only the pages they need.')
+	parser.add_argument('pages_path', help='Path of the uncompressed XML pages file to index.')
+	parser.add_argument('index_path', help='Path of the CSV file to write the index to. Each line gives the ID, namespace, byte offset, length in bytes, revision SHA-1 and title of a page, separated by vertical bars (|).')
+	parser.add_argument('-v', '--verbose', action='store_true')
+	args = parser.parse_args()
+
+	with open(args.pages_path, 'rb') as pages_file, open(args.index_path, 'w', encoding='utf-8') as index_file:
+		for count, entry in enumerate(index_entries_gen(pages_file)):
+			print(f'{entry.id}|{entry.ns}|{entry.offset}|{entry.length}|{entry.sha1}|{entry.title}', file=index_file)
+			if args.verbose and count % VERBOSE_FACTOR == 0:
+				print(f'{count:,}')
+
+def raw_pages_gen(pages_file: typing.BinaryIO, start: int = 0) -> collections.abc.Iterator[tuple[int, bytes]]:
+	'''
+	Yields the byte offset and raw XML of each <page> element in a pages file, without parsing it.
+	start should be the current position of pages_file (it is only used to calculate offsets).
+	'''
+	buffer = b''
+	# The offset in the file of the start of buffer
+	buffer_offset = start
+	pos = 0
+	while True:
+		page_start = buffer.find(parsing.page_pool.PAGE_START, pos)
+		page_end = buffer.find(parsing.page_pool.PAGE_END, page_start) if page_start >= 0 else -1
+		if page_end >= 0:
+			page_end += len(parsing.page_pool.PAGE_END)
+			yield buffer_offset + page_start, buffer[page_start:page_end]
+			pos = page_end
+			continue
+		block = pages_file.read(READ_SIZE)
+		if not block:
+			return
+		# Discard everything before the start of the next page
+		keep_from = page_start if page_start >= 0 else max(pos, len(buffer) - len(parsing.page_pool.PAGE_START) + 1)
+		buffer = buffer[keep_from:] + block
+		buffer_offset += keep_from
+		pos = 0
+
+def index_entries_gen(pages_file: typing.BinaryIO) -> collections.abc.Iterator[IndexEntry]:
+	for offset, page_xml in raw_pages_gen(pages_file):
+		# The first <id> in a page is the page ID (the revision ID comes later)
+		page_id = int(ID_PATTERN.search(page_xml)[1])
+		ns = int(NS_PATTERN.search(page_xml)[1])
+		title = html.unescape(TITLE_PATTERN.search(page_xml)[1].decode('utf-8'))
+		# <sha1> comes after <text>, so look for it from the end
+		sha1_match = SHA1_PATTERN.search(page_xml, max(0, page_xml.rfind(b'<sha1')))
+		yield IndexEntry(page_id, ns, offset, len(page_xml), sha1_match[1].decode() if sha1_match else '', title)
+
+def index_entries_from_file(index_path: str) -> collections.abc.Iterator[IndexEntry]:
+	with open(index_path, encoding='utf-8') as index_file:
+		for line in index_file:
+			id_, ns, offset, length, sha1, title = line[:-1].split('|', maxsplit=5)
+			yield IndexEntry(int(id_), int(ns), int(offset), int(length), sha1, title)
+
+class PageIndex:
+	'''
+	Reads individual pages from an uncompressed pages file using an index created by this module.
+	The pages file is memory-mapped, so only the pages that are read are loaded from disk.
+	'''
+
+	def __init__(self, index_path: str, pages_path: str):
+		self.index_path = index_path
+		ids = array.array('q')
+		offsets = array.array('q')
+		lengths = array.array('q')
+		for entry in index_entries_from_file(index_path):
+			ids.append(entry.id)
+			offsets.append(entry.offset)
+			lengths.append(entry.length)
+		# Pages are normally in order of ID already
+		if any(ids[i] > ids[i + 1] for i in range(len(ids) - 1)):
+			order = sorted(range(len(ids)), key=ids.__getitem__)
+			ids = array.array('q', (ids[i] for i in order))
+			offsets = array.array('q', (offsets[i] for i in order))
+			lengths = array.array('q', (lengths[i] for i in order))
+		self.ids = ids
+		self.offsets = offsets
+		self.lengths = lengths
+		# Built on the first lookup by title
+		self._ns_titles_to_ids: dict[tuple[int, str], int] | None = None
+
+		self._pages_file = open(pages_path, 'rb')
+		self._pages_map = mmap.mmap(self._pages_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+	def __enter__(self) -> 'PageIndex':
+		return self
+
+	def __exit__(self, *exc_info) -> None:
+		self.close()
+
+	def close(self) -> None:
+		self._pages_map.close()
+		self._pages_file.close()
+
+	def __len__(self) -> int:
+		return len(self.ids)
+
+	def __contains__(self, id_: int) -> bool:
+		return self._position(id_) is not None
+
+	def _position(self, id_: int) -> int | None:
+		i = bisect.bisect_left(self.ids, id_)
+		return i if i < len(self.ids) and self.ids[i] == id_ else None
+
+	def id(self, title: str, ns: int = 0) -> int | None:
+		if self._ns_titles_to_ids is None:
+			self._ns_titles_to_ids = {(entry.ns, entry.title): entry.id for entry in index_entries_from_file(self.index_path)}
+		return self._ns_titles_to_ids.get((ns, title))
+
+	def raw_page(self, id_: int) -> bytes | None:
+		i = self._position(id_)
+		if i is None:
+			return None
+		return self._pages_map[self.offsets[i]:self.offsets[i] + self.lengths[i]]
+
+	def page(self, id_: int, fields: collections.abc.Collection[str] = parsing.etree_helpers.PAGE_FIELDS) -> parsing.etree_helpers.Page | None:
+		raw = self.raw_page(id_)
+		return None if raw is None else next(parsing.etree_helpers.parse_pages([raw], fields))
+
+	def page_by_title(self, title: str, ns: int = 0, fields: collections.abc.Collection[str] = parsing.etree_helpers.PAGE_FIELDS) -> parsing.etree_helpers.Page | None:
+		'''title should be the full title of the page, including any namespace prefix, as it appears in the pages file.'''
+		id_ = self.id(title, ns)
+		return None if id_ is None else self.page(id_, fields)
+
+	def pages(self, ids: collections.abc.Iterable[int], fields: collections.abc.Collection[str] = parsing.etree_helpers.PAGE_FIELDS) -> collections.abc.Iterator[parsing.etree_helpers.Page]:
+		'''Yields the pages with the given IDs in the order they appear in the pages file (to minimize seeking). IDs that are not in the index are skipped.'''
+		positions = (self._position(id_) for id_ in set(ids))
+		for i in sorted((i for i in positions if i is not None), key=self.offsets.__getitem__):
+			yield next(parsing.etree_helpers.parse_pages([self._pages_map[self.offsets[i]:self.offsets[i] + self.lengths[i]]], fields))
+
+def map_indexed_pages(
+		index_path: str,
+		pages_path: str,
+		ids: collections.abc.Iterable[int],
+		page_func: parsing.page_pool.PageFunc,
+		fields: collections.abc.Collection[str] = parsing.etree_helpers.PAGE_FIELDS,
+		verbose_factor: int = 0
+		) -> collections.abc.Iterator:
+	'''Like parsing.page_pool.map_pages, but only reads the pages with the given IDs, using an index.'''
+	with PageIndex(index_path, pages_path) as page_index:
+		for count, page in enumerate(page_index.pages(ids, fields)):
+			result = page_func(page)
+			if result is not None:
+				yield result
+			if verbose_factor and count % verbose_factor == 0:
+				print(f'{count:,}')
+
+if __name__ == '__main__':
+	main()
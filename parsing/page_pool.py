@@ -0,0 +1,248 @@
+'''
+Processing of the pages in a pages file by a pool of worker processes.
+
+The pages file is split into shards (byte ranges that begin and end on page boundaries), each of which is parsed by a worker that calls a per-page function on every page in it. The results are then either yielded in the order of the pages (map_pages) or combined with an associative function (reduce_pages).
+
+Per-page functions are sent to the workers by pickling them, so they must be defined at the top level of a module. Any extra arguments they need can be bound with functools.partial.
+'''
+
+import collections.abc
+import concurrent.futures
+import functools
+import itertools
+import os.path
+import typing
+
+import parsing.bz2_helpers
+import parsing.checkpoint
+import parsing.etree_helpers
+import parsing.pool_window
+
+# Each worker is given several shards so that the workers finish at roughly the same time even if some shards are slower to process than others
+SHARDS_PER_JOB = 16
+FEED_SIZE = 2 ** 20
+PAGE_START = b'<page>'
+PAGE_END = b'</page>'
+MEDIAWIKI_END = b'</mediawiki>'
+
+T = typing.TypeVar('T')
+PageFunc = collections.abc.Callable[[parsing.etree_helpers.Page], T | None]
+
+def split_pages(pages_path: str, shard_count: int, index_path: str | None = None) -> list[tuple[int, int]]:
+	'''
+	Splits a pages file into at most shard_count (start, end) byte ranges, which together cover every page in the file.
+	For uncompressed XML each range starts at a <page> tag and ends just after a </page> tag. For bz2 multistream files each range covers a number of whole streams.
+	'''
+	if pages_path.endswith('.bz2'):
+		index_path = index_path or parsing.bz2_helpers.default_index_path(pages_path)
+		if not index_path:
+			raise ValueError('A bz2 pages file can only be split if it is a multistream file and its index is available.')
+		# The first stream contains only <siteinfo>
+		streams = parsing.bz2_helpers.stream_ranges(pages_path, index_path)[1:]
+		if not streams:
+			return []
+		per_shard = -(-len(streams) // shard_count)
+		return [(streams[i][0], streams[min(i + per_shard, len(streams)) - 1][1]) for i in range(0, len(streams), per_shard)]
+
+	size = os.path.getsize(pages_path)
+	with open(pages_path, 'rb') as pages_file:
+		first_page = find_forward(pages_file, 0, PAGE_START)
+		if first_page is None:
+			return []
+		bounds = [first_page]
+		for i in range(1, shard_count):
+			bound = find_forward(pages_file, max(size * i // shard_count, bounds[-1] + 1), PAGE_START)
+			if bound is None:
+				break
+			if bound != bounds[-1]:
+				bounds.append(bound)
+		bounds.append(find_backward(pages_file, size, PAGE_END) + len(PAGE_END))
+	return list(zip(bounds, bounds[1:]))
+
+def find_forward(file: typing.BinaryIO, start: int, target: bytes) -> int | None:
+	'''Returns the offset of the first occurrence of target at or after start.'''
+	file.seek(start)
+	# Keep the end of the previous block in case target straddles two blocks
+	carry = b''
+	block_start = start
+	while block := file.read(FEED_SIZE):
+		data = carry + block
+		index = data.find(target)
+		if index >= 0:
+			return block_start - len(carry) + index
+		carry = data[-(len(target) - 1):]
+		block_start += len(block)
+	return None
+
+def find_backward(file: typing.BinaryIO, end: int, target: bytes) -> int:
+	'''Returns the offset of the last occurrence of target before end.'''
+	block_end = end
+	while block_end > 0:
+		block_start = max(0, block_end - FEED_SIZE)
+		file.seek(block_start)
+		# Read a little past the block in case target straddles two blocks
+		data = file.read(min(end, block_end + len(target) - 1) - block_start)
+		index = data.rfind(target)
+		if index >= 0:
+			return block_start + index
+		block_end = block_start
+	raise ValueError(f'{target.decode()} not found.')
+
+def read_shard(pages_path: str, start: int, end: int) -> bytes:
+	'''Returns the (decompressed) XML of the pages in a shard.'''
+	if pages_path.endswith('.bz2'):
+		data = parsing.bz2_helpers.decompress_range(pages_path, start, end)
+		# The last stream of the file closes the root element
+		return data.rstrip().removesuffix(MEDIAWIKI_END)
+	with open(pages_path, 'rb') as pages_file:
+		pages_file.seek(start)
+		return pages_file.read(end - start)
+
+def shard_pages(pages_path: str, start: int, end: int, fields: collections.abc.Collection[str] = parsing.etree_helpers.PAGE_FIELDS) -> collections.abc.Iterator[parsing.etree_helpers.Page]:
+	'''Yields the pages in one shard of a pages file, with only the given fields filled in.'''
+	data = read_shard(pages_path, start, end)
+	# The pages in a shard are not enclosed in a single element, so wrap them in one
+	chunks = itertools.chain([b'<mediawiki>'], (data[offset:offset + FEED_SIZE] for offset in range(0, len(data), FEED_SIZE)), [b'</mediawiki>'])
+	return parsing.etree_helpers.parse_pages(chunks, fields)
+
+def map_shard(page_func: PageFunc, fields: collections.abc.Collection[str], pages_path: str, start: int, end: int) -> tuple[list, int]:
+	'''Returns the results of page_func (other than None) for each page in a shard, and the number of pages in the shard.'''
+	results = []
+	page_count = 0
+	for page_count, page in enumerate(shard_pages(pages_path, start, end, fields), start=1):
+		result = page_func(page)
+		if result is not None:
+			results.append(result)
+	return results, page_count
+
+def reduce_shard(
+		page_func: PageFunc,
+		combine: collections.abc.Callable[[T, T], T],
+		fields: collections.abc.Collection[str],
+		pages_path: str,
+		start: int,
+		end: int,
+		finish: collections.abc.Callable[[T], T] | None = None
+		) -> tuple[T | None, int]:
+	'''Returns the combination of the results of page_func (other than None) for each page in a shard (passed through finish, if given), and the number of pages in the shard.'''
+	total = None
+	page_count = 0
+	for page_count, page in enumerate(shard_pages(pages_path, start, end, fields), start=1):
+		result = page_func(page)
+		if result is not None:
+			total = result if total is None else combine(total, result)
+	if finish and total is not None:
+		total = finish(total)
+	return total, page_count
+
+def checkpoint_shards(pages_path: str, jobs: int, index_path: str | None, checkpoint: parsing.checkpoint.Checkpoint) -> list[tuple[int, int]]:
+	'''Returns the shards of a pages file that come after the offset of a checkpoint. The file is split into enough shards that little work is lost when resuming.'''
+	shards = split_pages(pages_path, max(jobs * SHARDS_PER_JOB, parsing.checkpoint.MIN_PIECE_COUNT), index_path)
+	return parsing.checkpoint.clip_pieces(shards, checkpoint.offset)
+
+def run_shards(shard_func: collections.abc.Callable[[int, int], T], shards: list[tuple[int, int]], jobs: int) -> collections.abc.Iterator[T]:
+	'''
+	Yields the result of shard_func(start, end) for each shard, in order. If jobs is 1 the shards are processed in this process, otherwise by a pool of jobs processes.
+	Only a few shards per process are submitted ahead of the one whose result is being taken, so the results of finished shards do not pile up in memory.
+	'''
+	if jobs == 1:
+		for start, end in shards:
+			yield shard_func(start, end)
+		return
+	with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+		yield from parsing.pool_window.windowed_results(executor, shard_func, shards, jobs * parsing.pool_window.TASKS_PER_JOB)
+
+def map_pages(
+		pages_path: str,
+		page_func: PageFunc,
+		jobs: int = 1,
+		index_path: str | None = None,
+		verbose_factor: int = 0,
+		fields: collections.abc.Collection[str] = parsing.etree_helpers.PAGE_FIELDS,
+		checkpoint: parsing.checkpoint.Checkpoint | None = None
+		) -> collections.abc.Iterator[T]:
+	'''
+	Yields the result of page_func for each page in a pages file, in the order of the pages. Pages for which page_func returns None are skipped.
+	If jobs is 1, the pages are processed in this process. Otherwise they are split into shards and processed by a pool of jobs processes.
+	If verbose_factor is positive, the number of pages processed is printed roughly every verbose_factor pages.
+	Only the given fields of each page are read, so leaving out unneeded fields (particularly text) saves time.
+	If checkpoint is given, the pages before its offset are skipped, and it is told the end of each shard once the caller has taken all the results from that shard.
+	'''
+	if checkpoint:
+		shards = checkpoint_shards(pages_path, jobs, index_path, checkpoint)
+		page_count = 0
+		for (start, end), (results, shard_page_count) in zip(shards, run_shards(functools.partial(map_shard, page_func, fields, pages_path), shards, jobs)):
+			yield from results
+			page_count = report_progress(page_count, shard_page_count, verbose_factor)
+			checkpoint.reached(end)
+		return
+
+	if jobs == 1:
+		for count, page in enumerate(parsing.etree_helpers.iter_pages(pages_path, fields, index_path)):
+			result = page_func(page)
+			if result is not None:
+				yield result
+			if verbose_factor and count % verbose_factor == 0:
+				print(f'{count:,}')
+		return
+
+	shards = split_pages(pages_path, jobs * SHARDS_PER_JOB, index_path)
+	page_count = 0
+	for results, shard_page_count in run_shards(functools.partial(map_shard, page_func, fields, pages_path), shards, jobs):
+		yield from results
+		page_count = report_progress(page_count, shard_page_count, verbose_factor)
+
+def reduce_pages(
+		pages_path: str,
+		page_func: PageFunc,
+		combine: collections.abc.Callable[[T, T], T],
+		jobs: int = 1,
+		index_path: str | None = None,
+		verbose_factor: int = 0,
+		fields: collections.abc.Collection[str] = parsing.etree_helpers.PAGE_FIELDS,
+		checkpoint: parsing.checkpoint.Checkpoint | None = None,
+		finish_shard: collections.abc.Callable[[T], T] | None = None
+		) -> T | None:
+	'''
+	Returns the combination (using combine) of the results of page_func for each page in a pages file, or None if there are no such results. Pages for which page_func returns None are skipped.
+	combine must be associative, since each worker combines the results of its own shards before they are combined with the results of other shards. It may modify and return its first argument.
+	If checkpoint is given, the combined result so far is its state: the pages before its offset are skipped and their combined result is taken from the checkpoint.
+	If finish_shard is given, it is applied to the combined result of each shard before the result is sent back from the worker, such as to write a large result to a file so that only its path is sent.
+	'''
+	if checkpoint:
+		shards = checkpoint_shards(pages_path, jobs, index_path, checkpoint)
+		total = checkpoint.state
+		checkpoint.get_state = lambda: total
+		page_count = 0
+		for (start, end), (result, shard_page_count) in zip(shards, run_shards(functools.partial(reduce_shard, page_func, combine, fields, pages_path, finish=finish_shard), shards, jobs)):
+			if result is not None:
+				total = result if total is None else combine(total, result)
+			page_count = report_progress(page_count, shard_page_count, verbose_factor)
+			checkpoint.reached(end)
+		return total
+
+	if jobs == 1:
+		total = None
+		for count, page in enumerate(parsing.etree_helpers.iter_pages(pages_path, fields, index_path)):
+			result = page_func(page)
+			if result is not None:
+				total = result if total is None else combine(total, result)
+			if verbose_factor and count % verbose_factor == 0:
+				print(f'{count:,}')
+		return total
+
+	shards = split_pages(pages_path, jobs * SHARDS_PER_JOB, index_path)
+	total = None
+	page_count = 0
+	# Combine in order, so that combine need not be commutative
+	for result, shard_page_count in run_shards(functools.partial(reduce_shard, page_func, combine, fields, pages_path, finish=finish_shard), shards, jobs):
+		if result is not None:
+			total = result if total is None else combine(total, result)
+		page_count = report_progress(page_count, shard_page_count, verbose_factor)
+	return total
+
+def report_progress(page_count: int, shard_page_count: int, verbose_factor: int) -> int:
+	new_count = page_count + shard_page_count
+	if verbose_factor and new_count // verbose_factor > page_count // verbose_factor:
+		print(f'{new_count:,}')
+	return new_count
@@ -1,8 +1,14 @@
 import argparse
+import array
+import bisect
 import collections
 import collections.abc
+import itertools
 import re
+import struct
 
+import parsing.checkpoint
+import parsing.mmap_arrays
 import parsing.parse_stubs
 import parsing.sql_helpers
 
@@ -10,6 +16,13 @@ import parsing.sql_helpers
 CAT_MASTER_VERBOSE_FACTOR = 10 ** 6
 # The MediaWiki category namespace ID
 CAT_NAMESPACE_ID = 14
+# Identifies files in the binary category store format
+STORE_MAGIC = b'WKCATS01'
+# The magic bytes, the number of pages (including categories) in the store, the number of categories with members, the number of category links, and the size of the titles blob
+STORE_HEADER = struct.Struct('<8sqqqq')
+
+# cl_from and cl_to
+CAT_LINK_COLUMNS = (0, 1)
 
 CatLink = collections.namedtuple('CatLink', ['cat_id', 'cat_title', 'page_id', 'page_ns', 'page_title'])
 
@@ -18,25 +31,66 @@ def main() -> None:
 	parser.add_argument('sql_path', help='Path of the SQL file giving all category associations. This file (after it is unzipped) is called "categorylinks.sql" in the database dumps.')
 	parser.add_argument('stubs_path', help='Path of the CSV file containing page ids, namespaces, and titles, generated by parse_stubs.py.')
 	parser.add_argument('output_path', help='Path of the CSV file to write the parsed categories to.')
+	parser.add_argument('-c', '--store-path', help='Path of a binary file to also write the category associations to, in a compact form that CategoryMaster can memory-map instead of loading the CSV file into memory.')
+	parser.add_argument('-j', '--jobs', default=1, type=int, help='The number of processes to use to convert the SQL file. Defaults to 1. Each process loads the stubs, so giving a compact stubs file (see parse_stubs) is recommended, since it is shared between the processes.')
+	parser.add_argument('-u', '--unordered', action='store_true', help='With --jobs, write the output of each chunk of the SQL file as soon as it has been converted, rather than in the order of the SQL file.')
+	parser.add_argument('--checkpoint-path', help='Path of a file in which to periodically save how far through the SQL file the conversion has got, so that it can be resumed with --resume if it is interrupted.')
+	parser.add_argument('--resume', action='store_true', help='Resume from the checkpoint at --checkpoint-path (if it exists), appending to the output file rather than starting again.')
 	parser.add_argument('-v', '--verbose', action='store_true')
 	args = parser.parse_args()
+	if args.resume and not args.checkpoint_path:
+		parser.error('--resume requires --checkpoint-path')
+	if args.checkpoint_path and args.unordered:
+		parser.error('--checkpoint-path cannot be used with --unordered')
+
+	checkpoint = None
+	if args.checkpoint_path:
+		checkpoint = parsing.checkpoint.Checkpoint(args.checkpoint_path, args.sql_path, args.resume)
+		if args.verbose and checkpoint.resumed:
+			print(f'Resuming from byte {checkpoint.offset:,} of the SQL file...')
+	with parsing.checkpoint.open_output(args.output_path, checkpoint.state if checkpoint else None) as out_file:
+		if checkpoint:
+			checkpoint.get_state = lambda: parsing.checkpoint.output_position(out_file)
+		if args.jobs == 1 and not checkpoint:
+			if args.verbose:
+				print('Reading stubs...')
+			stub_master = parsing.parse_stubs.StubMaster(args.stubs_path)
+			if args.verbose:
+				print('Processing categories (SQL):')
+			for line in cat_lines(parsing.sql_helpers.parse_sql(args.sql_path, args.verbose, columns=CAT_LINK_COLUMNS), stub_master):
+				out_file.write(line)
+		else:
+			if args.verbose:
+				print('Processing categories (SQL):')
+			for lines in parsing.sql_helpers.map_sql_chunks(args.sql_path, cat_lines_chunk, args.jobs, not args.unordered, parsing.parse_stubs.init_worker_stub_master, (args.stubs_path,), args.verbose, checkpoint):
+				out_file.write(lines)
+
+	if args.store_path:
+		if args.verbose:
+			print('Writing category store...')
+		store_builder = CatStoreBuilder()
+		for cat_link in cats_gen(args.output_path):
+			store_builder.add(cat_link)
+		store_builder.write(args.store_path)
+	if checkpoint:
+		checkpoint.finish()
 
-	if args.verbose:
-		print('Reading stubs...')
-	stub_master = parsing.parse_stubs.StubMaster(args.stubs_path)
-
-	if args.verbose:
-		print('Processing categories (SQL):')
-	with open(args.output_path, 'w', encoding='utf-8') as out_file:
-		for row in parsing.sql_helpers.parse_sql(args.sql_path, args.verbose):
-			cat_title = row[1].replace('_', ' ')
-			page_id = row[0]
-			try:
-				cat_id = stub_master.id(cat_title, CAT_NAMESPACE_ID)
-				print(f'{cat_id}|{cat_title}|{page_id}|{stub_master.ns(page_id)}|{stub_master.title(page_id)}', file=out_file)
-			except KeyError:
-				# A category may not be found if it is in use but has no page
-				pass
+def cat_lines(rows: collections.abc.Iterable[tuple], stub_master: parsing.parse_stubs.StubMaster) -> collections.abc.Iterator[str]:
+	'''Yields a line of the categories CSV file for each (page ID, category title) row of categorylinks.sql.'''
+	for page_id, cat_title in rows:
+		cat_title = cat_title.replace('_', ' ')
+		try:
+			cat_id = stub_master.id(cat_title, CAT_NAMESPACE_ID)
+			page_ns = stub_master.ns(page_id)
+			page_title = stub_master.title(page_id)
+		except KeyError:
+			# A category may not be found if it is in use but has no page
+			continue
+		yield f'{cat_id}|{cat_title}|{page_id}|{page_ns}|{page_title}\n'
+
+def cat_lines_chunk(sql_path: str, start: int, end: int) -> str:
+	'''Returns the lines of the categories CSV file for a chunk of categorylinks.sql. Must be called in a worker process initialized by parsing.parse_stubs.init_worker_stub_master.'''
+	return ''.join(cat_lines(parsing.sql_helpers.parse_sql_range(sql_path, start, end, CAT_LINK_COLUMNS), parsing.parse_stubs.worker_stub_master()))
 
 def cats_gen(categories_path: str) -> collections.abc.Iterator[CatLink]:
 	with open(categories_path, encoding='utf-8') as cats_file:
@@ -44,6 +98,11 @@ def cats_gen(categories_path: str) -> collections.abc.Iterator[CatLink]:
 			cat_id, cat_title, page_id, page_ns, page_title = (line[:-1].split('|', 4))
 			yield CatLink(int(cat_id), cat_title, int(page_id), int(page_ns), page_title)
 
+def cats_from_db(db_path: str, cat_id: int | None = None, cat_title: str | None = None, page_id: int | None = None) -> collections.abc.Iterator[CatLink]:
+	'''Yields the category links in a database built by parsing.build_db, optionally only those of the given category and/or page.'''
+	for row in parsing.sql_helpers.query_db(db_path, 'cats', CatLink._fields, cat_id=cat_id, cat_title=cat_title, page_id=page_id):
+		yield CatLink(*row)
+
 class Cat():
 	def __init__(self):
 		# Maps page IDs of subcategories to their titles
@@ -53,11 +112,138 @@ class Cat():
 	def __str__(self) -> str:
 		return f'Category ({len(self.subcats)} subcategories and {len(self.pages)} pages)'
 
+class CatStoreBuilder():
+	'''
+	Collects category links and writes them in the format read by CatStore.
+	Each page (or category) is given a node number, its position in the sorted list of all page IDs in the store. Category membership is then stored in compressed sparse row form: for each relation, an array of node numbers grouped by their source node, and an array giving the position in it where the group of each node begins.
+	'''
+
+	def __init__(self):
+		self.cat_ids = array.array('q')
+		self.member_ids = array.array('q')
+		# Maps page IDs to namespaces and titles. Categories that are not members of any category have a title of ''.
+		self.ns_titles: dict[int, tuple[int, str]] = {}
+
+	def add(self, cat_link: CatLink) -> None:
+		self.cat_ids.append(cat_link.cat_id)
+		self.member_ids.append(cat_link.page_id)
+		self.ns_titles[cat_link.page_id] = (cat_link.page_ns, cat_link.page_title)
+		self.ns_titles.setdefault(cat_link.cat_id, (CAT_NAMESPACE_ID, ''))
+
+	def write(self, store_path: str) -> None:
+		node_ids = array.array('q', sorted(self.ns_titles))
+		nodes = {id_: i for i, id_ in enumerate(node_ids)}
+		nses = array.array('i', (self.ns_titles[id_][0] for id_ in node_ids))
+		cat_nodes = array.array('i', (nodes[id_] for id_ in self.cat_ids))
+		member_nodes = array.array('i', (nodes[id_] for id_ in self.member_ids))
+		del nodes
+
+		# The links are split by whether the member is a subcategory in a single pass into arrays, since Python lists of ints would take several times the memory
+		subcat_sources = array.array('i')
+		subcat_targets = array.array('i')
+		page_sources = array.array('i')
+		page_targets = array.array('i')
+		for cat, member in zip(cat_nodes, member_nodes):
+			if nses[member] == CAT_NAMESPACE_ID:
+				subcat_sources.append(cat)
+				subcat_targets.append(member)
+			else:
+				page_sources.append(cat)
+				page_targets.append(member)
+		subcat_indptr, subcats = group_by_node(len(node_ids), subcat_sources, subcat_targets)
+		del subcat_sources, subcat_targets
+		page_indptr, pages = group_by_node(len(node_ids), page_sources, page_targets)
+		del page_sources, page_targets
+		parent_indptr, parents = group_by_node(len(node_ids), member_nodes, cat_nodes)
+		# A node is a category in the store if it has any members
+		cat_count = sum(1 for i in range(len(node_ids)) if subcat_indptr[i + 1] > subcat_indptr[i] or page_indptr[i + 1] > page_indptr[i])
+
+		title_offsets = array.array('q', [0])
+		for id_ in node_ids:
+			title_offsets.append(title_offsets[-1] + len(self.ns_titles[id_][1].encode('utf-8')))
+		blob_size = title_offsets[-1]
+
+		with open(store_path, 'wb') as out_file:
+			out_file.write(STORE_HEADER.pack(STORE_MAGIC, len(node_ids), cat_count, len(cat_nodes), blob_size))
+			for values in [node_ids, nses, title_offsets, subcat_indptr, subcats, page_indptr, pages, parent_indptr, parents]:
+				parsing.mmap_arrays.write_array(out_file, values)
+			# The titles are written one at a time rather than joined into a single blob first
+			for id_ in node_ids:
+				out_file.write(self.ns_titles[id_][1].encode('utf-8'))
+			out_file.write(b'\0' * (-blob_size % parsing.mmap_arrays.ALIGNMENT))
+
+def group_by_node(node_count: int, sources: collections.abc.Sequence[int], targets: collections.abc.Sequence[int]) -> tuple[array.array, array.array]:
+	'''Sorts the targets by their sources with a counting sort, and returns the compressed sparse row arrays (indptr and indices) for the relation.'''
+	indptr = array.array('q', bytes(8 * (node_count + 1)))
+	for source in sources:
+		indptr[source + 1] += 1
+	for i in range(node_count):
+		indptr[i + 1] += indptr[i]
+	# The next free position in each group
+	next_positions = indptr[:-1]
+	indices = array.array('i', bytes(4 * len(targets)))
+	for source, target in zip(sources, targets):
+		indices[next_positions[source]] = target
+		next_positions[source] += 1
+	return indptr, indices
+
+class CatStore():
+	'''Category links stored in a binary file written by CatStoreBuilder, which is memory-mapped so that it can be opened instantly and only the parts that are used are loaded into memory.'''
+
+	def __init__(self, store_path: str):
+		self.buffer = parsing.mmap_arrays.open_mmap(store_path)
+		magic, node_count, self.cat_count, link_count, blob_size = STORE_HEADER.unpack_from(self.buffer)
+		offset = STORE_HEADER.size
+		self.node_ids, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'q', node_count)
+		self.nses, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'i', node_count)
+		self.title_offsets, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'q', node_count + 1)
+		self.subcat_indptr, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'q', node_count + 1)
+		self.subcats, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'i', self.subcat_indptr[-1])
+		self.page_indptr, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'q', node_count + 1)
+		self.pages, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'i', self.page_indptr[-1])
+		self.parent_indptr, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'q', node_count + 1)
+		self.parents, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'i', link_count)
+		self.titles = memoryview(self.buffer)[offset:offset + blob_size]
+
+	def node(self, id_: int) -> int | None:
+		i = bisect.bisect_left(self.node_ids, id_)
+		return i if i < len(self.node_ids) and self.node_ids[i] == id_ else None
+
+	def title(self, node: int) -> str:
+		return self.titles[self.title_offsets[node]:self.title_offsets[node + 1]].tobytes().decode('utf-8')
+
+	def related(self, id_: int, indptr: memoryview, indices: memoryview, titles: bool = False) -> set[int] | set[str]:
+		'''Returns the IDs (or titles) of the pages related to a page by one of the stored relations.'''
+		node = self.node(id_)
+		if node is None:
+			return set()
+		related_nodes = indices[indptr[node]:indptr[node + 1]]
+		if titles:
+			return {self.title(related_node) for related_node in related_nodes}
+		else:
+			return {self.node_ids[related_node] for related_node in related_nodes}
+
+def is_cat_store(path: str) -> bool:
+	with open(path, 'rb') as in_file:
+		return in_file.read(len(STORE_MAGIC)) == STORE_MAGIC
+
 class CategoryMaster():
+	'''
+	Gives the subcategories and pages of categories.
+	categories_path may be either a CSV file produced by this module, which is read into memory, or a binary store (see --store-path), which is memory-mapped instead.
+	'''
+
 	def __init__(self, categories_path: str, verbose: bool = False):
+		# Maps the root categories and maximum depth of each traversal done by descendant_cats to its result
+		self._closures: dict[tuple[frozenset[int], int], frozenset[int]] = {}
+		self.store: CatStore | None = CatStore(categories_path) if is_cat_store(categories_path) else None
+		if self.store is not None:
+			return
 		if verbose:
 			print('Loading all categories:')
 		self.cats: dict[int, Cat] = collections.defaultdict(Cat)
+		# Maps page IDs to the IDs of the categories they are in. Built on the first call to cats_of.
+		self._parents: dict[int, set[int]] | None = None
 		for count, cat_link in enumerate(cats_gen(categories_path)):
 			if cat_link.page_ns == CAT_NAMESPACE_ID:
 				self.cats[cat_link.cat_id].subcats[cat_link.page_id] = cat_link.page_title
@@ -67,33 +253,72 @@ class CategoryMaster():
 				print(f'{count:,}')
 
 	def subcats(self, cat_id: int, titles: bool = False) -> set[int] | set[str]:
+		if self.store is not None:
+			return self.store.related(cat_id, self.store.subcat_indptr, self.store.subcats, titles)
 		if titles:
 			return set(self.cats[cat_id].subcats.values())
 		else:
 			return set(self.cats[cat_id].subcats.keys())
 
 	def pages(self, cat_id: int, titles: bool = False) -> set[int] | set[str]:
+		if self.store is not None:
+			return self.store.related(cat_id, self.store.page_indptr, self.store.pages, titles)
 		if titles:
 			return {stub.title for stub in self.cats[cat_id].pages}
 		else:
 			return {stub.id for stub in self.cats[cat_id].pages}
 
-	def descendant_cats(self, cat_id: int, max_depth: int = -1) -> set[int]:
-		des_cats = {cat_id}
-		# Purposefully continue if max_depth is negative
-		if max_depth != 0:
-			for subcat in self.subcats(cat_id):
-				des_cats |= self.descendant_cats(subcat, max_depth - 1)
-		return des_cats
+	def cats_of(self, page_id: int) -> set[int]:
+		'''Returns the IDs of the categories a page (or category) is directly in.'''
+		if self.store is not None:
+			return self.store.related(page_id, self.store.parent_indptr, self.store.parents)
+		if self._parents is None:
+			self._parents = collections.defaultdict(set)
+			for cat_id, cat in self.cats.items():
+				for member_id in itertools.chain(cat.subcats, (stub.id for stub in cat.pages)):
+					self._parents[member_id].add(cat_id)
+		return set(self._parents.get(page_id, ()))
+
+	def descendant_cats(self, cat_ids: int | collections.abc.Iterable[int], max_depth: int = -1) -> set[int]:
+		'''
+		Returns the given categories and all of their descendant categories, up to max_depth levels of subcategories below them (or without limit if max_depth is negative).
+		The category graph is traversed breadth-first, visiting each category once even if the graph has cycles. Results are cached, so repeated queries are free.
+		'''
+		roots = frozenset([cat_ids] if isinstance(cat_ids, int) else cat_ids)
+		if max_depth < 0:
+			max_depth = -1
+		key = (roots, max_depth)
+		if key not in self._closures:
+			self._closures[key] = frozenset(descendants(roots, self.subcats, max_depth))
+		return set(self._closures[key])
 
-	def descendant_pages(self, cat_id: int, titles: bool = False, max_depth: int = -1) -> set[int] | set[str]:
+	def descendant_pages(self, cat_ids: int | collections.abc.Iterable[int], titles: bool = False, max_depth: int = -1) -> set[int] | set[str]:
+		'''Returns the pages (other than categories) in the given categories and their descendant categories. See descendant_cats.'''
 		des_pages: set[int] | set[str] = set()
-		for cat_id in self.descendant_cats(cat_id, max_depth):
+		for cat_id in self.descendant_cats(cat_ids, max_depth):
 			des_pages |= self.pages(cat_id, titles=titles)
 		return des_pages
 
 	def __len__(self) -> int:
+		if self.store is not None:
+			return self.store.cat_count
 		return len(self.cats)
 
+def descendants(roots: collections.abc.Iterable[int], children: collections.abc.Callable[[int], collections.abc.Iterable[int]], max_depth: int = -1) -> set[int]:
+	'''Returns roots and their descendants in a graph, found by a breadth-first search that goes at most max_depth levels below the roots (or without limit if max_depth is negative).'''
+	found = set(roots)
+	frontier = list(found)
+	depth = 0
+	while frontier and depth != max_depth:
+		next_frontier = []
+		for node in frontier:
+			for child in children(node):
+				if child not in found:
+					found.add(child)
+					next_frontier.append(child)
+		frontier = next_frontier
+		depth += 1
+	return found
+
 if __name__ == '__main__':
 	main()
@@ -1,10 +1,10 @@
 import argparse
 import collections
 import collections.abc
-import re
 
-import parsing.parse_stubs
 import parsing.etree_helpers
+import parsing.parse_stubs
+import parsing.sql_helpers
 
 STUBS_VERBOSE_FACTOR = 10 ** 6
 
@@ -14,7 +14,7 @@ def main():
 	parser = argparse.ArgumentParser(description='Converts a redirect.sql to a more readable, flexible form.')
 	parser.add_argument('sql_path', help='Path of the file giving all redirects. This file (after it is unzipped) is called "redirect.sql" in the database dumps.')
 	parser.add_argument('stubs_path', help='Path of the CSV file containing page ids, namespaces, and titles, genrated by parse_stubs.py. Must contain all pages (in all namespaces) that may be the source or destination of a redirect.')
-	parser.add_argument('pages_path', help='Path of the XML file containing the ids and titles of Wiktionary namespaces. This is used to add the namespace prefixes to the titles of redirect destinations (as the SQL does not have them). Any of the following files in the dumps will work equally well for this: stub-meta-current.xml, pages-articles.xml, pages-meta-current.xml.')
+	parser.add_argument('pages_path', help='Path of the XML file containing the ids and titles of Wiktionary namespaces. This is used to add the namespace prefixes to the titles of redirect sources and destinations (as neither the SQL nor the stubs have them). Any of the following files in the dumps will work equally well for this: stub-meta-current.xml, pages-articles.xml, pages-meta-current.xml.')
 	parser.add_argument('output_path', help='Path of the CSV file to write the parsed redirects to.')
 	parser.add_argument('-v', '--verbose', action='store_true')
 	args = parser.parse_args()
@@ -30,32 +30,111 @@ def main():
 
 	if args.verbose:
 		print('Reading redirect data (SQL) and writing output...')
-	with open(args.sql_path, encoding='utf-8', errors='ignore') as sql_file:
-		with open(args.output_path, 'w', encoding='utf-8') as out_file:
-			for line in sql_file:
-				if line.startswith('INSERT INTO '):
-					try:
-						line_trimmed = re.fullmatch(r'INSERT INTO `\w*` VALUES \((.*)\);', line[:-1])[1]
-					# no match
-					except TypeError:
-						continue
-					rows = [row.split(',', maxsplit=4)[:4] for row in line_trimmed.split('),(')]
-					for row in rows:
-						# if an internal redirect
-						if len(row[3]) == 2:
-							try:
-								dst_ns_id = int(row[1])
-								dst_ns_prefix = (ns_titles[dst_ns_id] + ':' if dst_ns_id in ns_titles else '')
-							except KeyError:
-								# destination namespace does not exist
-								# encountered in 24-04-01 dump, possibly due to deletion of the concordance namespace
-								continue
-							dst_title = row[2].replace('_', ' ').replace("\\'", "'").replace('\\"', '"').removeprefix("'").removesuffix("'")
-							try:
-								print(f'{row[0]}|{stub_master.title(int(row[0]))}|{stub_master.id(dst_title)}|{dst_ns_prefix}{dst_title}', file=out_file)
-							except KeyError:
-								# broken redirect
-								pass
+	with open(args.output_path, 'w', encoding='utf-8') as out_file:
+		# rd_from, rd_namespace, rd_title and rd_interwiki
+		for src_id, dst_ns_id, dst_title, interwiki in parsing.sql_helpers.parse_sql(args.sql_path, columns=(0, 1, 2, 3)):
+			# if an internal redirect
+			if not interwiki:
+				dst_title = dst_title.replace('_', ' ')
+				try:
+					# Both titles are given with their namespace prefixes, so that titles in different namespaces are distinct
+					src_title = ns_prefix(ns_titles, stub_master.ns(src_id)) + stub_master.title(src_id)
+					print(f'{src_id}|{src_title}|{stub_master.id(dst_title, dst_ns_id)}|{ns_prefix(ns_titles, dst_ns_id)}{dst_title}', file=out_file)
+				except KeyError:
+					# broken redirect
+					pass
+
+def ns_prefix(ns_titles: dict[int, str], ns: int) -> str:
+	# The namespace may not exist
+	# encountered in 24-04-01 dump, possibly due to deletion of the concordance namespace
+	# The main namespace has an empty name, and so no prefix
+	return ns_titles[ns] + ':' if ns_titles.get(ns) else ''
+
+class RedirectMaster():
+	'''
+	Maps redirects to their destinations and back, following chains of redirects (double redirects and longer).
+	Pages can be given either by ID or by title, and are returned in the same form. Titles are full titles with their namespace prefixes (such as "Template:en-noun"), as both sources and destinations are given in the redirects file, so titles in different namespaces never collide.
+	Redirects files written before source titles had prefixes must be regenerated with parse_redirects for lookups by title to work.
+	'''
+
+	def __init__(self, redirects_path: str):
+		self.src_to_dst: dict[int, int] = {}
+		self.dst_to_srcs: dict[int, list[int]] = collections.defaultdict(list)
+		self.ids_to_titles: dict[int, str] = {}
+		self.titles_to_ids: dict[str, int] = {}
+		for red in redirects_gen(redirects_path):
+			self.src_to_dst[red.src_id] = red.dst_id
+			self.dst_to_srcs[red.dst_id].append(red.src_id)
+			for id_, title in [(red.src_id, red.src_title), (red.dst_id, red.dst_title)]:
+				self.ids_to_titles[id_] = title
+				self.titles_to_ids[title] = id_
+
+		# Maps each redirect to the page at the end of its chain, or to None if the chain is a cycle
+		self.resolved: dict[int, int | None] = {}
+		for src_id in self.src_to_dst:
+			if src_id in self.resolved:
+				continue
+			chain = []
+			on_chain = set()
+			page_id = src_id
+			while page_id in self.src_to_dst and page_id not in self.resolved and page_id not in on_chain:
+				chain.append(page_id)
+				on_chain.add(page_id)
+				page_id = self.src_to_dst[page_id]
+			if page_id in on_chain:
+				# The chain leads into a cycle
+				target = None
+			elif page_id in self.resolved:
+				target = self.resolved[page_id]
+			else:
+				target = page_id
+			for chain_id in chain:
+				self.resolved[chain_id] = target
+
+	def _id(self, page: int | str) -> int | None:
+		return page if isinstance(page, int) else self.titles_to_ids.get(page)
+
+	def _same_form(self, page_id: int | None, like: int | str) -> int | str | None:
+		if page_id is None or isinstance(like, int):
+			return page_id
+		return self.ids_to_titles[page_id]
+
+	def is_redirect(self, page: int | str) -> bool:
+		return self._id(page) in self.src_to_dst
+
+	def destination(self, page: int | str) -> int | str | None:
+		'''Returns the page a redirect points to directly, or None if the page is not a redirect.'''
+		return self._same_form(self.src_to_dst.get(self._id(page)), page)
+
+	def resolve(self, page: int | str) -> int | str | None:
+		'''Returns the page at the end of the chain of redirects starting at a page (which is the page itself if it is not a redirect), or None if the chain is a cycle.'''
+		page_id = self._id(page)
+		if page_id not in self.resolved:
+			return page
+		return self._same_form(self.resolved[page_id], page)
+
+	def sources(self, page: int | str) -> set[int] | set[str]:
+		'''Returns all the redirects that lead to a page, either directly or through other redirects.'''
+		page_id = self._id(page)
+		found: set[int] = set()
+		frontier = [page_id]
+		while frontier:
+			dst_id = frontier.pop()
+			for src_id in self.dst_to_srcs.get(dst_id, ()):
+				if src_id not in found and src_id != page_id:
+					found.add(src_id)
+					frontier.append(src_id)
+		return {self._same_form(src_id, page) for src_id in found}
+
+	def with_redirects(self, pages: collections.abc.Iterable[int | str]) -> set[int | str]:
+		'''Returns the given pages along with all the redirects that lead to them.'''
+		pages = set(pages)
+		for page in list(pages):
+			pages |= self.sources(page)
+		return pages
+
+	def __len__(self) -> int:
+		return len(self.src_to_dst)
 
 def redirects_gen(path: str) -> collections.abc.Iterator[RedirectData]:
 	with open(path, encoding='utf-8') as in_file:
@@ -63,5 +142,10 @@ def redirects_gen(path: str) -> collections.abc.Iterator[RedirectData]:
 			fields = (line[:-1].split('|'))
 			yield RedirectData(src_id=int(fields[0]), src_title=fields[1], dst_id=int(fields[2]), dst_title=fields[3])
 
+def redirects_from_db(db_path: str, src_id: int | None = None, dst_id: int | None = None, dst_title: str | None = None) -> collections.abc.Iterator[RedirectData]:
+	'''Yields the redirects in a database built by parsing.build_db, optionally only those with the given source and/or destination.'''
+	for row in parsing.sql_helpers.query_db(db_path, 'redirects', RedirectData._fields, src_id=src_id, dst_id=dst_id, dst_title=dst_title):
+		yield RedirectData(*row)
+
 if __name__ == '__main__':
 	main()
@@ -1,54 +1,79 @@
 import argparse
+import array
+import bisect
 import collections
+import itertools
 import re
-import xml.etree.ElementTree as xet
+import struct
 
 import parsing.etree_helpers
+import parsing.mmap_arrays
 import parsing.sql_helpers
 
 VERBOSITY_FACTOR = 10 ** 6
+# Identifies files in the compact binary stubs format
+COMPACT_MAGIC = b'WKSTUBS1'
+# The magic bytes, the number of stubs, and the size of the titles blob
+COMPACT_HEADER = struct.Struct('<8sqq')
+
+# page_id, page_namespace and page_title
+STUB_COLUMNS = (0, 1, 2)
 
 Stub = collections.namedtuple('Stub', ['id', 'ns', 'title'])
 
+# The StubMaster of each worker process, loaded by init_worker_stub_master
+_worker_stub_master: 'StubMaster | None' = None
+
 def main():
 	parser = argparse.ArgumentParser()
-	parser.add_argument('input_path', help='Path of the XML or SQL file containing id / title associations. The best files for this in the dumps are stub-meta-current.xml and page.sql.')
-	parser.add_argument('output_path', help='Path of the CSV file write the parsed id / title associations to. (It will be created if it does not exist.)')
+	parser.add_argument('input_path', help='Path of the XML or SQL file containing id / title associations. The best files for this in the dumps are stub-meta-current.xml and page.sql. A CSV file previously produced by this script can also be given, to convert it to the compact binary format.')
+	parser.add_argument('output_path', help='Path of the CSV file write the parsed id / title associations to. (It will be created if it does not exist.) If it ends with ".bin", the stubs are instead written in a compact binary format that StubMaster can load almost instantly.')
+	parser.add_argument('-j', '--jobs', default=1, type=int, help='The number of processes to use to parse an SQL file. Defaults to 1.')
+	parser.add_argument('-u', '--unordered', action='store_true', help='With --jobs, write the output of each chunk of the SQL file as soon as it has been converted, rather than in the order of the SQL file.')
 	parser.add_argument('-v', '--verbose', action='store_true')
 	args = parser.parse_args()
 
-	if args.input_path.endswith('.xml'):
+	if args.input_path.endswith('.xml') or args.input_path.endswith('.xml.bz2'):
 		stubs = parse_from_xml(args.input_path)
+	elif args.input_path.endswith('.csv'):
+		stubs = stubs_gen(args.input_path)
 	elif args.input_path.endswith('.sql'):
-		stubs = []
-		for row in parsing.sql_helpers.parse_sql(args.input_path, args.verbose):
-			stubs.append(Stub(row[0], row[1], row[2].replace('_', ' ')))
+		if args.jobs == 1:
+			stubs = list(stubs_from_sql(parsing.sql_helpers.parse_sql(args.input_path, args.verbose, columns=STUB_COLUMNS)))
+		else:
+			stubs = list(itertools.chain.from_iterable(parsing.sql_helpers.map_sql_chunks(args.input_path, stubs_from_sql_chunk, args.jobs, not args.unordered, verbose=args.verbose)))
 	else:
-		raise ValueError('The input path must end with either ".xml" or ".sql" to indicate how it should be parsed.')
+		raise ValueError('The input path must end with ".xml", ".sql" or ".csv" to indicate how it should be parsed.')
 
-	with open(args.output_path, 'w', encoding='utf-8') as out_file:
-		for stub in stubs:
-			print(f'{stub.id}|{stub.ns}|{stub.title}', file=out_file)
+	if args.output_path.endswith('.bin'):
+		write_compact_stubs(stubs, args.output_path)
+	else:
+		with open(args.output_path, 'w', encoding='utf-8') as out_file:
+			for stub in stubs:
+				print(f'{stub.id}|{stub.ns}|{stub.title}', file=out_file)
+
+def stubs_from_sql(rows: collections.abc.Iterable[tuple]) -> collections.abc.Iterator[Stub]:
+	for id_, ns, title in rows:
+		yield Stub(id_, ns, title.replace('_', ' '))
+
+def stubs_from_sql_chunk(sql_path: str, start: int, end: int) -> list[Stub]:
+	return list(stubs_from_sql(parsing.sql_helpers.parse_sql_range(sql_path, start, end, STUB_COLUMNS)))
 
 def parse_from_xml(xml_path: str) -> collections.abc.Iterator[Stub]:
-	for page in parsing.etree_helpers.pages_gen(xml_path):
-		parts = []
-		for child_tag in ['id', 'ns', 'title']:
-			child = parsing.etree_helpers.find_child(page, child_tag)
-			if child:
-				parts.append(child.text)
-			else:
-				print('Warning: Skipping a page that is missing <{child_tag}>.')
-				break
-		# Else branch of for loop
-		else:
-			ns_prefix, colon, parts[2] = parts[2].rpartition(':')
-			stub = Stub(*parts)
-			yield stub
-		page.clear()
+	for page in parsing.etree_helpers.iter_pages(xml_path, fields=('id', 'ns', 'title')):
+		ns_prefix, colon, title = page.title.rpartition(':')
+		yield Stub(page.id, page.ns, title)
 
 class StubMaster():
+	'''
+	Maps between the IDs and titles of pages.
+	stubs_path may be either a CSV file or a compact binary file produced by this module. The latter is memory-mapped rather than read into dicts, so it loads almost instantly and uses far less memory.
+	'''
+
 	def __init__(self, stubs_path: str):
+		self.compact: CompactStubs | None = CompactStubs(stubs_path) if is_compact_stubs(stubs_path) else None
+		if self.compact is not None:
+			return
 		self.ids_to_ns_titles: dict[int, tuple[int, str]] = {}
 		self.ns_titles_to_ids: dict[int, dict[str, int]] = collections.defaultdict(dict)
 		for stub in stubs_gen(stubs_path):
@@ -58,19 +83,120 @@ class StubMaster():
 	def id(self, title: str, ns: int = 0) -> int:
 		# Remove namespace prefix if it is present
 		ns_prefix, colon, title = title.rpartition(':')
+		if self.compact is not None:
+			return self.compact.id(title, ns)
 		return self.ns_titles_to_ids[ns][title]
 
 	def title(self, id_: int) -> str:
+		if self.compact is not None:
+			return self.compact.title(id_)
 		return self.ids_to_ns_titles[id_][1]
 
 	def ns(self, id_: int) -> int:
+		if self.compact is not None:
+			return self.compact.ns(id_)
 		return self.ids_to_ns_titles[id_][0]
 
+class CompactStubs():
+	'''
+	Stubs stored in a binary file consisting of a header followed by:
+	* the IDs of all pages, in ascending order;
+	* the namespace of each page;
+	* the offset of the title of each page in the titles blob (with an extra offset marking the end of the blob);
+	* the positions of all pages, sorted by namespace and then title, for looking up titles by binary search;
+	* the titles blob, containing all titles encoded in UTF-8.
+	'''
+
+	def __init__(self, path: str):
+		self.buffer = parsing.mmap_arrays.open_mmap(path)
+		magic, count, blob_size = COMPACT_HEADER.unpack_from(self.buffer)
+		offset = COMPACT_HEADER.size
+		self.ids, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'q', count)
+		self.nses, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'i', count)
+		self.title_offsets, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'q', count + 1)
+		self.title_order, offset = parsing.mmap_arrays.array_view(self.buffer, offset, 'q', count)
+		self.titles = memoryview(self.buffer)[offset:offset + blob_size]
+
+	def __len__(self) -> int:
+		return len(self.ids)
+
+	def _position(self, id_: int) -> int:
+		i = bisect.bisect_left(self.ids, id_)
+		if i == len(self.ids) or self.ids[i] != id_:
+			raise KeyError(id_)
+		return i
+
+	def _title_bytes(self, i: int) -> bytes:
+		return self.titles[self.title_offsets[i]:self.title_offsets[i + 1]].tobytes()
+
+	def id(self, title: str, ns: int = 0) -> int:
+		key = (ns, title.encode('utf-8'))
+		j = bisect.bisect_left(self.title_order, key, key=lambda i: (self.nses[i], self._title_bytes(i)))
+		if j == len(self.title_order):
+			raise KeyError(title)
+		i = self.title_order[j]
+		if (self.nses[i], self._title_bytes(i)) != key:
+			raise KeyError(title)
+		return self.ids[i]
+
+	def title(self, id_: int) -> str:
+		return self._title_bytes(self._position(id_)).decode('utf-8')
+
+	def ns(self, id_: int) -> int:
+		return self.nses[self._position(id_)]
+
+def init_worker_stub_master(stubs_path: str) -> None:
+	'''
+	Loads a StubMaster for use by worker_stub_master. Intended to be used as the initializer of a pool of worker processes.
+	If stubs_path is a compact stubs file, the workers share the memory-mapped file rather than each loading their own copy of the stubs.
+	'''
+	global _worker_stub_master
+	_worker_stub_master = StubMaster(stubs_path)
+
+def worker_stub_master() -> StubMaster:
+	return _worker_stub_master
+
+def is_compact_stubs(path: str) -> bool:
+	with open(path, 'rb') as stubs_file:
+		return stubs_file.read(len(COMPACT_MAGIC)) == COMPACT_MAGIC
+
+def write_compact_stubs(stubs: collections.abc.Iterable[Stub], path: str) -> None:
+	'''Writes stubs in the format read by CompactStubs.'''
+	unsorted_ids = array.array('q')
+	unsorted_nses = array.array('i')
+	unsorted_titles: list[bytes] = []
+	for stub in stubs:
+		unsorted_ids.append(stub.id)
+		unsorted_nses.append(stub.ns)
+		unsorted_titles.append(stub.title.encode('utf-8'))
+
+	id_order = sorted(range(len(unsorted_ids)), key=unsorted_ids.__getitem__)
+	ids = array.array('q', (unsorted_ids[i] for i in id_order))
+	nses = array.array('i', (unsorted_nses[i] for i in id_order))
+	titles = [unsorted_titles[i] for i in id_order]
+	del unsorted_ids, unsorted_nses, unsorted_titles, id_order
+
+	title_offsets = array.array('q', [0])
+	for title in titles:
+		title_offsets.append(title_offsets[-1] + len(title))
+	title_order = array.array('q', sorted(range(len(ids)), key=lambda i: (nses[i], titles[i])))
+	blob = b''.join(titles)
+
+	with open(path, 'wb') as out_file:
+		out_file.write(COMPACT_HEADER.pack(COMPACT_MAGIC, len(ids), len(blob)))
+		for values in [ids, nses, title_offsets, title_order, blob]:
+			parsing.mmap_arrays.write_array(out_file, values)
+
 def stubs_gen(stubs_path: str) -> collections.abc.Iterator[Stub]:
 	with open(stubs_path, encoding='utf-8') as stubs_file:
 		for line in stubs_file:
 			id_, ns, title = line[:-1].split('|', maxsplit=2)
 			yield Stub(int(id_), int(ns), title)
 
+def stubs_from_db(db_path: str, id_: int | None = None, ns: int | None = None, title: str | None = None) -> collections.abc.Iterator[Stub]:
+	'''Yields the stubs in a database built by parsing.build_db, optionally only those with the given ID, namespace and/or title.'''
+	for row in parsing.sql_helpers.query_db(db_path, 'stubs', Stub._fields, id=id_, ns=ns, title=title):
+		yield Stub(*row)
+
 if __name__ == '__main__':
 	main()
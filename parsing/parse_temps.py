@@ -10,56 +10,94 @@ SQL_VERBOSE_FACTOR = 10 ** 7
 TEMP_NAMESPACE_ID = 10
 TEMP_NAMESPACE_PREFIX = 'Template:'
 
+# tl_from and tl_target_id
+TEMP_LINK_COLUMNS = (0, 2)
+
 TempData = collections.namedtuple('TempData', ['temp_id', 'temp_title', 'page_id', 'page_title'])
 
+# Maps link target IDs to template titles in each worker process, loaded by init_worker
+_worker_link_targets_to_temp_titles: dict[int, str] = {}
+
 def main():
 	parser = argparse.ArgumentParser(description='Converts a templatelinks.sql file to a more readable, flexible form.')
 	parser.add_argument('template_links_path', help='Path of the file giving all template links. This file (after decompression) is called "templatelinks.sql" in the database dumps.')
 	parser.add_argument('link_targets_path', help='Path of the additional SQL file needed to parse template links. This file (after decompression) is called "linktarget.sql" in the database dumps.')
 	parser.add_argument('stubs_path', help='Path of the CSV file containing stubs, as generated by parse_stubs.')
 	parser.add_argument('output_path', help='Path of the CSV file to write the parsed templates to.')
+	parser.add_argument('-j', '--jobs', default=1, type=int, help='The number of processes to use to convert the template links. Defaults to 1. Each process loads the stubs, so giving a compact stubs file (see parse_stubs) is recommended, since it is shared between the processes.')
+	parser.add_argument('-u', '--unordered', action='store_true', help='With --jobs, write the output of each chunk of the SQL file as soon as it has been converted, rather than in the order of the SQL file.')
 	parser.add_argument('-v', '--verbose', action='store_true')
 	args = parser.parse_args()
 
-	if args.verbose:
-		print('Reading stubs ...')
-	stub_master = parsing.parse_stubs.StubMaster(args.stubs_path)
-
 	if args.verbose:
 		print(f'Reading link targets:')
 	link_targets_to_temp_titles = {}
-	for link_target in parsing.sql_helpers.parse_sql(args.link_targets_path, args.verbose):
-		if link_target[1] == TEMP_NAMESPACE_ID:
-			link_targets_to_temp_titles[link_target[0]] = link_target[2].replace('_', ' ')
+	# lt_id, lt_namespace and lt_title
+	for target_id, target_ns, target_title in parsing.sql_helpers.parse_sql(args.link_targets_path, args.verbose, columns=(0, 1, 2)):
+		if target_ns == TEMP_NAMESPACE_ID:
+			link_targets_to_temp_titles[target_id] = target_title.replace('_', ' ')
 
 	if args.verbose:
 		print(f'Loaded {len(link_targets_to_temp_titles)} temp titles.')
-		print('Processing template links:')
-	missing_temps = set()
+	missing_temps: set[str] = set()
 	with open(args.output_path, 'w', encoding='utf-8') as out_file:
-		for link in parsing.sql_helpers.parse_sql(args.template_links_path, args.verbose):
-			page_id = link[0]
-			target_id = link[2]
-			try:
-				temp_title = link_targets_to_temp_titles[target_id]
-			except KeyError:
-				# Not a template
-				continue
-			if temp_title.startswith('tracking/'):
-				continue
-			try:
-				temp_id = stub_master.id(temp_title, TEMP_NAMESPACE_ID)
-			except KeyError:
-				if temp_title not in missing_temps:
-					print(f'Warning: {TEMP_NAMESPACE_PREFIX}{temp_title} is transcluded but does not exist ({template_links_count:,}).')
-					missing_temps.add(temp_title)
-				continue
-			try:
-				page_title = stub_master.title(page_id)
-			except KeyError:
-				# I found this occurred many times in the 24-07-01 dump.
-				continue
-			print(f'{temp_id}|{temp_title}|{page_id}|{page_title}', file=out_file)
+		if args.jobs == 1:
+			if args.verbose:
+				print('Reading stubs ...')
+			stub_master = parsing.parse_stubs.StubMaster(args.stubs_path)
+			if args.verbose:
+				print('Processing template links:')
+			rows = parsing.sql_helpers.parse_sql(args.template_links_path, args.verbose, columns=TEMP_LINK_COLUMNS)
+			for line in temp_lines(rows, link_targets_to_temp_titles, stub_master, missing_temps):
+				out_file.write(line)
+		else:
+			if args.verbose:
+				print('Processing template links:')
+			chunks = parsing.sql_helpers.map_sql_chunks(args.template_links_path, temp_lines_chunk, args.jobs, not args.unordered, init_worker, (args.stubs_path, link_targets_to_temp_titles), args.verbose)
+			for lines, chunk_missing_temps in chunks:
+				out_file.write(lines)
+				missing_temps |= chunk_missing_temps
+	for temp_title in missing_temps:
+		print(f'Warning: {TEMP_NAMESPACE_PREFIX}{temp_title} is transcluded but does not exist.')
+
+def temp_lines(
+		rows: collections.abc.Iterable[tuple],
+		link_targets_to_temp_titles: dict[int, str],
+		stub_master: parsing.parse_stubs.StubMaster,
+		missing_temps: set[str]
+		) -> collections.abc.Iterator[str]:
+	'''Yields a line of the templates CSV file for each (page ID, link target ID) row of templatelinks.sql. The titles of templates that do not exist are added to missing_temps.'''
+	for page_id, target_id in rows:
+		try:
+			temp_title = link_targets_to_temp_titles[target_id]
+		except KeyError:
+			# Not a template
+			continue
+		if temp_title.startswith('tracking/'):
+			continue
+		try:
+			temp_id = stub_master.id(temp_title, TEMP_NAMESPACE_ID)
+		except KeyError:
+			missing_temps.add(temp_title)
+			continue
+		try:
+			page_title = stub_master.title(page_id)
+		except KeyError:
+			# I found this occurred many times in the 24-07-01 dump.
+			continue
+		yield f'{temp_id}|{temp_title}|{page_id}|{page_title}\n'
+
+def init_worker(stubs_path: str, link_targets_to_temp_titles: dict[int, str]) -> None:
+	global _worker_link_targets_to_temp_titles
+	parsing.parse_stubs.init_worker_stub_master(stubs_path)
+	_worker_link_targets_to_temp_titles = link_targets_to_temp_titles
+
+def temp_lines_chunk(sql_path: str, start: int, end: int) -> tuple[str, set[str]]:
+	'''Returns the lines of the templates CSV file for a chunk of templatelinks.sql, and the titles of templates in it that do not exist. Must be called in a worker process initialized by init_worker.'''
+	missing_temps: set[str] = set()
+	rows = parsing.sql_helpers.parse_sql_range(sql_path, start, end, TEMP_LINK_COLUMNS)
+	lines = ''.join(temp_lines(rows, _worker_link_targets_to_temp_titles, parsing.parse_stubs.worker_stub_master(), missing_temps))
+	return lines, missing_temps
 
 def temps_gen(templates_path: str) -> collections.abc.Iterator[TempData]:
 	with open(templates_path, encoding='utf-8') as temps_file:
@@ -67,5 +105,10 @@ def temps_gen(templates_path: str) -> collections.abc.Iterator[TempData]:
 			fields = (line[:-1].split('|', maxsplit=3))
 			yield TempData(temp_id=int(fields[0]), temp_title=fields[1], page_id=int(fields[2]), page_title=fields[3])
 
+def temps_from_db(db_path: str, temp_id: int | None = None, temp_title: str | None = None, page_id: int | None = None) -> collections.abc.Iterator[TempData]:
+	'''Yields the template links in a database built by parsing.build_db, optionally only those of the given template and/or page.'''
+	for row in parsing.sql_helpers.query_db(db_path, 'temps', TempData._fields, temp_id=temp_id, temp_title=temp_title, page_id=page_id):
+		yield TempData(*row)
+
 if __name__ == '__main__':
 	main()
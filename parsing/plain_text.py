@@ -0,0 +1,102 @@
+'''
+A fast conversion of wikitext to plain text, for uses such as counting words where the exact output of wikitextparser's plain_text() does not matter.
+
+Block constructs that do not contain prose (comments, references, templates, parser functions, template parameters and tables) are removed in a single pass that tracks their nesting. The remaining text then has its inline markup stripped in a second pass over it, the amount depending on the fidelity:
+- 'markup' only replaces internal links with their labels (or targets).
+- 'text' also replaces external links with their labels, removes HTML tags (keeping their contents), bold and italic quotes and heading markers, and unescapes HTML entities.
+'''
+
+import html
+import re
+
+FIDELITIES = ('markup', 'text')
+BLOCK_PATTERN = re.compile(r'<!--|<nowiki\s*>|<ref\b[^<>]*?/>|<ref\b[^<>]*>|\{\{\{|\{\{|\}\}\}|\}\}|^[ \t]*\{\||^[ \t]*\|\}', flags=re.IGNORECASE | re.MULTILINE)
+COMMENT_END = '-->'
+NOWIKI_END_PATTERN = re.compile(r'</nowiki\s*>', flags=re.IGNORECASE)
+REF_END_PATTERN = re.compile(r'</ref\s*>', flags=re.IGNORECASE)
+LINK_PATTERN = r'\[\[(?P<target>[^\[\]|]*)(?:\|(?P<label>[^\[\]]*))?\]\]'
+MARKUP_PATTERN = re.compile(LINK_PATTERN)
+TEXT_PATTERN = re.compile('|'.join([
+	LINK_PATTERN,
+	r'\[(?:https?:)?//[^\s\[\]]+(?:[ \t]+(?P<ext_label>[^\]]*))?\]',
+	r'^(?P<level>=+)[ \t]*(?P<heading>.*?)[ \t]*(?P=level)[ \t]*$',
+	r'<[^<>]+>',
+	r"''+",
+	r'&(?P<entity>#?\w+);',
+]), flags=re.MULTILINE)
+# Links to pages in these namespaces put the page in a category or display a file, rather than linking to it with text
+NON_TEXT_LINK_PREFIXES = frozenset({'category', 'file', 'image'})
+
+def plain_text(text: str, fidelity: str = 'text') -> str:
+	if fidelity not in FIDELITIES:
+		raise ValueError(f'Unknown fidelity {fidelity!r}. It must be one of: {", ".join(FIDELITIES)}.')
+	pattern = TEXT_PATTERN if fidelity == 'text' else MARKUP_PATTERN
+	return pattern.sub(replace_inline, strip_blocks(text))
+
+def strip_blocks(text: str) -> str:
+	'''Removes comments, references, templates, parser functions, template parameters and tables from wikitext. The contents of <nowiki> tags are kept as they are.'''
+	pieces = []
+	# Open templates ({{), parameters ({{{) and tables ({|), innermost last
+	stack = []
+	# The start of the text that has not yet been kept or removed
+	keep_from = 0
+	pos = 0
+	while match := BLOCK_PATTERN.search(text, pos):
+		token = match[0].lstrip(' \t').lower()
+		start, end = match.start(), match.end()
+		outside = not stack
+		if token == '<!--':
+			close = text.find(COMMENT_END, end)
+			end = len(text) if close < 0 else close + len(COMMENT_END)
+		elif token.startswith('<nowiki'):
+			close = NOWIKI_END_PATTERN.search(text, end)
+			if outside:
+				pieces.append(text[keep_from:start])
+				pieces.append(text[end:close.start() if close else len(text)])
+				keep_from = close.end() if close else len(text)
+			pos = close.end() if close else len(text)
+			continue
+		elif token.startswith('<ref'):
+			if not token.endswith('/>'):
+				close = REF_END_PATTERN.search(text, end)
+				end = close.end() if close else len(text)
+		elif token in ('{{{', '{{', '{|'):
+			stack.append(token)
+		elif token == '}}}' and stack and stack[-1] == '{{{':
+			stack.pop()
+		elif token.startswith('}}'):
+			if outside:
+				# An unmatched closing brace is just text
+				pos = start + 2
+				continue
+			# Closes a template (this may be the first two braces of '}}}')
+			end = start + 2
+			stack.pop()
+		elif token == '|}':
+			if '{|' not in stack:
+				pos = end
+				continue
+			while stack.pop() != '{|':
+				pass
+		if outside:
+			pieces.append(text[keep_from:start])
+		if not stack:
+			keep_from = end
+		pos = end
+	if not stack:
+		pieces.append(text[keep_from:])
+	return ''.join(pieces)
+
+def replace_inline(match: re.Match) -> str:
+	if match['target'] is not None:
+		target = match['target']
+		if target.partition(':')[0].strip().lower() in NON_TEXT_LINK_PREFIXES:
+			return ''
+		return target.lstrip(':') if match['label'] is None else match['label']
+	if match.lastgroup == 'ext_label':
+		return match['ext_label']
+	if match['level'] is not None:
+		return match['heading']
+	if match['entity'] is not None:
+		return html.unescape(match[0])
+	return ''
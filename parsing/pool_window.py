@@ -0,0 +1,48 @@
+'''
+Submission of tasks to a pool of worker processes a few at a time, so that results that are finished before the caller is ready for them do not pile up in memory.
+'''
+
+import collections
+import collections.abc
+import concurrent.futures
+import typing
+
+T = typing.TypeVar('T')
+# The number of tasks per worker that may be submitted but not yet taken by the caller. This keeps every worker busy while the caller handles a result.
+TASKS_PER_JOB = 2
+
+def windowed_results(
+		executor: concurrent.futures.Executor,
+		func: collections.abc.Callable[..., T],
+		task_args: collections.abc.Iterable[tuple],
+		window: int,
+		ordered: bool = True
+		) -> collections.abc.Iterator[T]:
+	'''
+	Yields the result of func(*args) for each tuple of args in task_args, keeping at most window tasks submitted to executor but not yet yielded.
+	If ordered is false, results are yielded as soon as they are ready rather than in the order of task_args.
+	If the caller stops early (closing the generator), the tasks that have not yet started are cancelled.
+	'''
+	task_args = iter(task_args)
+	pending = collections.deque()
+
+	def top_up() -> None:
+		while len(pending) < window and (args := next(task_args, None)) is not None:
+			pending.append(executor.submit(func, *args))
+
+	try:
+		top_up()
+		while pending:
+			if ordered:
+				future = pending.popleft()
+				future.result()
+			else:
+				done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+				future = next(iter(done))
+				pending.remove(future)
+			# Submit the next task before yielding, so that the workers are not left idle while the caller handles the result
+			top_up()
+			yield future.result()
+	finally:
+		for future in pending:
+			future.cancel()
@@ -0,0 +1,103 @@
+'''
+Writing and reading of JSON Lines files of records (JSON objects, one per line), with an optional index for looking up records by key.
+
+The index is a text file with a line for each record giving its key and the byte offset of the record, separated by a tab, sorted by the UTF-8 bytes of the key. It is searched with a binary search through a memory map, so neither the records nor the index are loaded into memory. Keys must not contain tabs or newlines.
+'''
+
+import collections.abc
+import json
+import os
+import tempfile
+
+import parsing.external_sort
+import parsing.mmap_arrays
+
+class RecordWriter:
+	'''Writes records to a JSON Lines file as they are given, so that they need not all be held in memory.'''
+
+	def __init__(self, path: str):
+		self.path = path
+		self.out_file = open(path, 'wb')
+
+	def __enter__(self) -> 'RecordWriter':
+		return self
+
+	def __exit__(self, *exc_info) -> None:
+		self.close()
+
+	def close(self) -> None:
+		self.out_file.close()
+
+	def write(self, record: dict) -> None:
+		self.out_file.write(json.dumps(record).encode('utf-8'))
+		self.out_file.write(b'\n')
+
+def record_keys(path: str, key_field: str) -> collections.abc.Iterator[tuple[bytes, int]]:
+	'''Yields the key (as UTF-8) and byte offset of each record in a JSON Lines file.'''
+	with open(path, 'rb') as records_file:
+		offset = 0
+		for line in records_file:
+			yield json.loads(line)[key_field].encode('utf-8'), offset
+			offset += len(line)
+
+def write_index(path: str, index_path: str, key_field: str, temp_dir: str | None = None, max_keys: int = parsing.external_sort.DEFAULT_MAX_ITEMS) -> None:
+	'''Writes an index of a JSON Lines file by the given field of its records. Keys that do not fit in memory are sorted through temporary files in temp_dir.'''
+	with tempfile.TemporaryDirectory(dir=temp_dir) as spill_dir, open(index_path, 'wb') as index_file:
+		for key, offset in parsing.external_sort.external_sort(record_keys(path, key_field), spill_dir, max_items=max_keys):
+			index_file.write(key + b'\t' + str(offset).encode() + b'\n')
+
+class RecordReader:
+	'''Reads the records of a JSON Lines file, either in order or (if index_path is given) by key.'''
+
+	def __init__(self, path: str, index_path: str | None = None):
+		self.records_file = open(path, 'rb')
+		self.index = None
+		if index_path:
+			# The index of a file with no records is empty, and an empty file cannot be memory-mapped. Every lookup then misses.
+			self.index = parsing.mmap_arrays.open_mmap(index_path) if os.path.getsize(index_path) else b''
+
+	def __enter__(self) -> 'RecordReader':
+		return self
+
+	def __exit__(self, *exc_info) -> None:
+		self.close()
+
+	def close(self) -> None:
+		self.records_file.close()
+		if self.index:
+			self.index.close()
+
+	def __iter__(self) -> collections.abc.Iterator[dict]:
+		self.records_file.seek(0)
+		for line in self.records_file:
+			yield json.loads(line)
+
+	def offset(self, key: str) -> int | None:
+		'''Returns the byte offset of the record with the given key, or None if there is no such record.'''
+		if self.index is None:
+			raise ValueError('Records can only be looked up by key if an index is given.')
+		target = key.encode('utf-8')
+		# Find the first line whose key is not less than the target
+		low = 0
+		high = len(self.index)
+		while low < high:
+			middle = (low + high) // 2
+			line_start = self.index.rfind(b'\n', 0, middle) + 1
+			line_end = self.index.find(b'\n', line_start)
+			if self.index[line_start:self.index.find(b'\t', line_start, line_end)] < target:
+				low = line_end + 1
+			else:
+				high = line_start
+		if low >= len(self.index):
+			return None
+		line_end = self.index.find(b'\n', low)
+		line_key, _, offset = self.index[low:line_end].partition(b'\t')
+		return int(offset) if line_key == target else None
+
+	def get(self, key: str) -> dict | None:
+		'''Returns the record with the given key, or None if there is no such record.'''
+		offset = self.offset(key)
+		if offset is None:
+			return None
+		self.records_file.seek(offset)
+		return json.loads(self.records_file.readline())
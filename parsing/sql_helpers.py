@@ -1,18 +1,159 @@
 import collections.abc
+import concurrent.futures
+import contextlib
+import os.path
 import re
+import sqlite3
+import typing
+
+import parsing.checkpoint
+import parsing.pool_window
 
 VERBOSE_FACTOR = 500
+T = typing.TypeVar('T')
+# Each worker is given several chunks so that the workers finish at roughly the same time
+CHUNKS_PER_JOB = 16
+INSERT_PREFIX = b'INSERT INTO '
+VALUES_MARKER = b' VALUES '
+# A parenthesized row of values. Quoted strings may contain parentheses and escaped quotes.
+# The quantifiers are possessive, since there is only ever one way to match a row. Otherwise a row without a closing parenthesis (as at the end of a truncated chunk) would take exponential time to fail.
+ROW_PATTERN = re.compile(rb"\(((?:[^'()]++|'[^'\\]*+(?:\\.[^'\\]*+)*+')*+)\)", flags=re.DOTALL)
+# A quoted string (whose contents are captured by the first group) or an unquoted value such as a number or NULL (captured by the second)
+VALUE_PATTERN = re.compile(rb"'([^'\\]*(?:\\.[^'\\]*)*)'|([^,']+)", flags=re.DOTALL)
+ESCAPE_PATTERN = re.compile(rb'\\(.)', flags=re.DOTALL)
+# All other escaped characters (such as quotes and backslashes) stand for themselves
+ESCAPES = {b'0': b'\0', b'b': b'\b', b'n': b'\n', b'r': b'\r', b't': b'\t', b'Z': b'\x1a'}
 
-def parse_sql(path: str, verbose: bool = False) -> collections.abc.Iterator[tuple]:
-	with open(path, encoding='utf-8', errors='ignore') as sql_file:
+def parse_sql(
+		path: str,
+		verbose: bool = False,
+		columns: collections.abc.Sequence[int] | None = None,
+		binary_columns: collections.abc.Container[int] = ()
+		) -> collections.abc.Iterator[tuple]:
+	'''
+	Yields the rows inserted by the INSERT statements of a MySQL dump, as tuples of ints, floats, strs and Nones.
+	If columns is given, each tuple only contains the values of those columns (in the given order), and the other values are never converted.
+	Quoted values in binary_columns (such as sort keys) are given as bytes rather than being decoded.
+	'''
+	with open(path, 'rb') as sql_file:
 		for count, line in enumerate(sql_file):
 			if verbose and count % VERBOSE_FACTOR == 0:
 				print(f'{count:,}')
-			if line.startswith('INSERT INTO '):
-				line_match = re.fullmatch(r'INSERT INTO `\w*` VALUES (.*?);', line[:-1])
-				if not line_match:
-					continue
-				values = line_match[1].replace('NULL', 'None')
-				rows = eval(f'[{values}]')
-				for row in rows:
-					yield row
+			if line.startswith(INSERT_PREFIX):
+				yield from parse_insert(line, columns, binary_columns)
+
+def split_sql(path: str, chunk_count: int) -> list[tuple[int, int]]:
+	'''Splits a MySQL dump into at most chunk_count (start, end) byte ranges, each beginning at an INSERT statement, which together cover every INSERT statement in the file.'''
+	size = os.path.getsize(path)
+	bounds = []
+	with open(path, 'rb') as sql_file:
+		for i in range(chunk_count):
+			sql_file.seek(size * i // chunk_count)
+			if i > 0:
+				# Skip the rest of the current line
+				sql_file.readline()
+			# mysqldump writes each statement on its own line
+			while line := sql_file.readline():
+				if line.startswith(INSERT_PREFIX):
+					bound = sql_file.tell() - len(line)
+					if not bounds or bound > bounds[-1]:
+						bounds.append(bound)
+					break
+	return list(zip(bounds, bounds[1:] + [size]))
+
+def parse_sql_range(
+		path: str,
+		start: int,
+		end: int,
+		columns: collections.abc.Sequence[int] | None = None,
+		binary_columns: collections.abc.Container[int] = ()
+		) -> collections.abc.Iterator[tuple]:
+	'''Yields the rows inserted by the INSERT statements that begin between the given byte offsets of a MySQL dump. See parse_sql.'''
+	with open(path, 'rb') as sql_file:
+		sql_file.seek(start)
+		while sql_file.tell() < end and (line := sql_file.readline()):
+			if line.startswith(INSERT_PREFIX):
+				yield from parse_insert(line, columns, binary_columns)
+
+def map_sql_chunks(
+		path: str,
+		chunk_func: collections.abc.Callable[[str, int, int], T],
+		jobs: int,
+		ordered: bool = True,
+		initializer: collections.abc.Callable | None = None,
+		initargs: tuple = (),
+		verbose: bool = False,
+		checkpoint: parsing.checkpoint.Checkpoint | None = None
+		) -> collections.abc.Iterator[T]:
+	'''
+	Splits a MySQL dump into chunks at INSERT statements, and yields the result of calling chunk_func(path, start, end) on each chunk in a pool of jobs processes.
+	If ordered is false, results are yielded as soon as they are ready rather than in the order of the chunks. Either way, only a few chunks per process are submitted ahead of those whose results have been taken, so finished results do not pile up in memory behind a slow chunk.
+	initializer is called with initargs in each worker before any chunks are processed, so that it can load data needed by chunk_func into global variables (which avoids sending the data with every chunk).
+	If checkpoint is given, the chunks before its offset are skipped, and it is told the end of each chunk once the caller has taken its result. This requires ordered results. If jobs is 1, the chunks are then processed in this process (after calling initializer in it).
+	'''
+	if checkpoint:
+		if not ordered:
+			raise ValueError('Checkpoints require the results of chunks to be ordered.')
+		chunks = parsing.checkpoint.clip_pieces(split_sql(path, max(jobs * CHUNKS_PER_JOB, parsing.checkpoint.MIN_PIECE_COUNT)), checkpoint.offset)
+		if jobs == 1:
+			if initializer:
+				initializer(*initargs)
+			for count, (start, end) in enumerate(chunks, start=1):
+				yield chunk_func(path, start, end)
+				checkpoint.reached(end)
+				if verbose:
+					print(f'{count:,} / {len(chunks):,} chunks')
+			return
+	else:
+		chunks = split_sql(path, jobs * CHUNKS_PER_JOB)
+	with concurrent.futures.ProcessPoolExecutor(jobs, initializer=initializer, initargs=initargs) as executor:
+		results = parsing.pool_window.windowed_results(executor, chunk_func, ((path, start, end) for start, end in chunks), jobs * parsing.pool_window.TASKS_PER_JOB, ordered)
+		for count, result in enumerate(results, start=1):
+			yield result
+			if checkpoint:
+				checkpoint.reached(chunks[count - 1][1])
+			if verbose:
+				print(f'{count:,} / {len(chunks):,} chunks')
+
+def parse_insert(
+		line: bytes,
+		columns: collections.abc.Sequence[int] | None = None,
+		binary_columns: collections.abc.Container[int] = ()
+		) -> collections.abc.Iterator[tuple]:
+	'''Yields the rows of a single INSERT statement. See parse_sql.'''
+	values_start = line.find(VALUES_MARKER)
+	if values_start < 0:
+		return
+	for row_match in ROW_PATTERN.finditer(line, values_start + len(VALUES_MARKER)):
+		values = VALUE_PATTERN.findall(row_match[1])
+		if columns is None:
+			yield tuple(convert_value(*value, i in binary_columns) for i, value in enumerate(values))
+		else:
+			yield tuple(convert_value(*values[i], i in binary_columns) for i in columns)
+
+def convert_value(quoted: bytes, unquoted: bytes, binary: bool = False) -> int | float | str | bytes | None:
+	if unquoted:
+		if unquoted == b'NULL':
+			return None
+		try:
+			return int(unquoted)
+		except ValueError:
+			return float(unquoted)
+	if b'\\' in quoted:
+		quoted = ESCAPE_PATTERN.sub(unescape, quoted)
+	return quoted if binary else quoted.decode('utf-8', errors='ignore')
+
+def unescape(escape: re.Match) -> bytes:
+	return ESCAPES.get(escape[1], escape[1])
+
+def query_db(db_path: str, table: str, columns: collections.abc.Sequence[str], **conditions) -> collections.abc.Iterator[tuple]:
+	'''
+	Yields the given columns of the rows of a table in an SQLite database (such as one built by parsing.build_db).
+	Each keyword argument that is not None restricts the rows to those in which the column of that name has the given value.
+	'''
+	conditions = {column: value for column, value in conditions.items() if value is not None}
+	query = f'SELECT {", ".join(columns)} FROM {table}'
+	if conditions:
+		query += ' WHERE ' + ' AND '.join(f'{column} = ?' for column in conditions)
+	with contextlib.closing(sqlite3.connect(db_path)) as connection:
+		yield from connection.execute(query, tuple(conditions.values()))
@@ -3,7 +3,6 @@ import collections
 import importlib
 import itertools
 import re
-import subprocess
 import xml.dom
 import xml.dom.pulldom
 
@@ -41,19 +40,25 @@ def main():
 	if not args.categories_path and not args.word_cache_path:
 		raise ValueError('At least one of --category-path (-c) and --word-cache-path (-w) must be provided.')
 
-	words = find_rhymeless_words(args)
+	rhyme_index = RhymeIndex(args.prons_path)
+	word_rhymes = []
+	for word, prons in find_rhymeless_words(args):
+		try:
+			word_rhymes.append((word, prons_to_rhymes(prons)))
+		except ValueError:
+			word_rhymes.append((word, None))
+	# Look up every rhyme once, however many words have it
+	all_siblings = rhyme_index.find_siblings(itertools.chain.from_iterable(rhymes for _, rhymes in word_rhymes if rhymes))
 
 	with open(args.output_path, 'w', encoding='utf-8') as out_file:
 		print('{|class="wikitable"', '!Word', '!Suggested template', '!Rhymes', '!Rhyming pronunciation count', '!Rhyming pronunciation examples', '|-', sep='\n', file=out_file)
-		for word, prons in words:
+		for word, rhymes in word_rhymes:
 			rhyme_siblings = {}
-			try:
-				rhymes = prons_to_rhymes(prons)
-			except ValueError:
+			if rhymes is None:
 				write_table_row(word, {}, out_file)
 				continue
 			for rhyme in rhymes:
-				siblings = find_siblings(rhyme, args)
+				siblings = all_siblings[rhyme]
 				if len(siblings) > 1:
 					rhyme_siblings[rhyme] = (len(siblings), siblings[:args.example_count])
 			if rhyme_siblings:
@@ -81,9 +86,53 @@ def find_rhymeless_words(args):
 					prons.extend(pron_set.split('|'))
 				yield (title, prons)
 
-def find_siblings(rhyme, args):
-	process = subprocess.run(['grep', '-P', f'(ˈ|/[ˈ{CONSONANTS}]*){rhyme}/', args.prons_path], capture_output=True)
-	return process.stdout.decode().splitlines()
+class RhymeIndex:
+	'''
+	An index of the lines of a pronunciations file by the tails of the pronunciations in them, which finds the pronunciations with a given rhyme without scanning the file.
+	A line has a rhyme if the rhyme ends a pronunciation and either follows a primary stress mark or is preceded only by consonants and stress marks (the same lines that the regex (ˈ|/[ˈ<consonants>]*)<rhyme>/ matches).
+	'''
+
+	def __init__(self, prons_path):
+		self.lines = []
+		# The indices of the lines containing each tail, in order
+		self.tail_lines = collections.defaultdict(list)
+		with open(prons_path, encoding='utf-8') as prons_file:
+			for i, line in enumerate(prons_file):
+				self.lines.append(line.rstrip('\n'))
+				for tail in pron_tails(self.lines[-1]):
+					self.tail_lines[tail].append(i)
+
+	def siblings(self, rhyme):
+		'''Returns the lines containing a pronunciation with the given rhyme, in the order they appear in the file.'''
+		# In the regex that this replaces, the parentheses of (ɹ) form a group, so only the 'ɹ' is matched
+		return [self.lines[i] for i in self.tail_lines.get(rhyme.replace('(', '').replace(')', ''), [])]
+
+	def find_siblings(self, rhymes):
+		'''Returns the siblings of each of the given rhymes, by rhyme.'''
+		return {rhyme: self.siblings(rhyme) for rhyme in set(rhymes)}
+
+def pron_tails(line):
+	'''Returns the set of tails in a line that could be rhymes, as described in RhymeIndex.'''
+	tails = set()
+	for slash in re.finditer('/', line):
+		end = slash.start()
+		# A rhyme contains neither stress marks nor slashes
+		start = max(line.rfind('/', 0, end), line.rfind('ˈ', 0, end)) + 1
+		if start == 0 or start == end:
+			continue
+		tails.add(line[start:end])
+		if line[start - 1] == '/' or only_consonants_before(line, start - 1):
+			while start < end - 1 and line[start] in CONSONANTS:
+				start += 1
+				tails.add(line[start:end])
+	return tails
+
+def only_consonants_before(line, stress):
+	'''Returns whether the stress mark at index stress is preceded only by consonants and stress marks back to the start of the pronunciation.'''
+	i = stress - 1
+	while i >= 0 and (line[i] == 'ˈ' or line[i] in CONSONANTS):
+		i -= 1
+	return i >= 0 and line[i] == '/'
 
 def write_table_row(word, rhyme_siblings, out_file):
 	def print_row(*strs, **kwargs):
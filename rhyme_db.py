@@ -0,0 +1,169 @@
+'''
+Builds and queries an SQLite database of the rhymes of the entries in one language, so that rhyme reports can look up words and rhymes without rescanning the pages file.
+
+The database has two tables:
+- words, giving the ID, title, predominant part of speech and frequency of each entry with a section for the language.
+- rhymes, giving each rhyme listed by an entry's {{rhymes}} templates, with each syllable count given for it (or NULL if none is given).
+Both are indexed, so looking up the rhymes of a word or the words with a rhyme only reads the rows needed.
+'''
+
+import argparse
+import collections
+import collections.abc
+import contextlib
+import functools
+import json
+import sqlite3
+
+import find_song_rhymes
+import parsing.build_db
+import parsing.extract_cache
+import parsing.page_pool
+
+VERBOSE_FACTOR = 10 ** 5
+PAGE_FIELDS = ('id', 'title', 'text')
+# Increase this whenever a change to find_song_rhymes.find_page_rhyme_data changes its results, to invalidate cached results
+EXTRACT_VERSION = '1'
+TABLES = {
+	'words': ('id INTEGER PRIMARY KEY, title TEXT, part_of_speech TEXT, frequency INTEGER', [('title',)]),
+	'rhymes': ('rhyme TEXT, word_id INTEGER, syllables INTEGER', [('rhyme', 'syllables'), ('word_id',)]),
+	'info': ('key TEXT PRIMARY KEY, value TEXT', []),
+}
+
+Rhyme = collections.namedtuple('Rhyme', ['rhyme', 'syllables'])
+RhymingWord = collections.namedtuple('RhymingWord', ['title', 'syllables', 'part_of_speech', 'frequency'])
+
+def main():
+	parser = argparse.ArgumentParser(description='Builds or queries a database of rhymes.')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+
+	build_parser = subparsers.add_parser('build', help='Builds a rhyme database from a pages file.')
+	build_parser.add_argument('pages_path', help='Path of the pages file to read entries from.')
+	build_parser.add_argument('db_path', help='Path of the SQLite database to write. Any existing tables in it are replaced.')
+	build_parser.add_argument('-l', '--language', default='English', help='The name of the language as it appears in the heading of each entry. Defaults to English.')
+	build_parser.add_argument('-f', '--frequencies-path', help='Path of the JSON file of word frequencies produced by find_frequencies. If not given, frequencies are left empty.')
+	build_parser.add_argument('-j', '--jobs', default=1, type=int, help='The number of processes to use to parse entries. Defaults to 1.')
+	build_parser.add_argument('--extract-cache-path', help='Path of an SQLite file in which to cache the parts of speech and rhymes found in each page, keyed by page ID and revision SHA-1. (It will be created if it does not exist.)')
+	build_parser.add_argument('-v', '--verbose', action='store_true')
+
+	rhymes_parser = subparsers.add_parser('rhymes', help='Prints the rhymes of a word, with their syllable counts.')
+	rhymes_parser.add_argument('db_path')
+	rhymes_parser.add_argument('title')
+
+	words_parser = subparsers.add_parser('words', help='Prints the words with a rhyme, most frequent first.')
+	words_parser.add_argument('db_path')
+	words_parser.add_argument('rhyme')
+	words_parser.add_argument('-s', '--syllables', type=int, help='Only print words with this many syllables.')
+	words_parser.add_argument('-p', '--part-of-speech', help='Only print words with this predominant part of speech.')
+	words_parser.add_argument('-n', '--limit', type=int, help='Print at most this many words.')
+	args = parser.parse_args()
+
+	if args.command == 'build':
+		build(args.pages_path, args.db_path, args.language, args.frequencies_path, args.jobs, args.extract_cache_path, args.verbose)
+	elif args.command == 'rhymes':
+		with RhymeDB(args.db_path) as rhyme_db:
+			for rhyme in rhyme_db.rhymes(args.title):
+				print(f'{rhyme.rhyme}\t{"" if rhyme.syllables is None else rhyme.syllables}')
+	else:
+		with RhymeDB(args.db_path) as rhyme_db:
+			for word in rhyme_db.words(args.rhyme, args.syllables, args.part_of_speech, args.limit):
+				print('\t'.join('' if value is None else str(value) for value in word))
+
+def build(
+		pages_path: str,
+		db_path: str,
+		language: str = 'English',
+		frequencies_path: str | None = None,
+		jobs: int = 1,
+		extract_cache_path: str | None = None,
+		verbose: bool = False
+		) -> None:
+	frequencies = None
+	if frequencies_path:
+		if verbose:
+			print('Reading word frequencies...')
+		with open(frequencies_path, encoding='utf-8') as frequencies_file:
+			frequencies = json.load(frequencies_file)
+
+	if verbose:
+		print('Reading entries:')
+	page_func = functools.partial(find_song_rhymes.find_page_rhyme_data, language=language)
+	verbose_factor = VERBOSE_FACTOR if verbose else 0
+	if extract_cache_path:
+		results = parsing.extract_cache.map_cached_pages(pages_path, page_func, extract_cache_path, f'rhyme_db language={language}', EXTRACT_VERSION, jobs=jobs, verbose_factor=verbose_factor, fields=PAGE_FIELDS)
+	else:
+		results = parsing.page_pool.map_pages(pages_path, page_func, jobs=jobs, verbose_factor=verbose_factor, fields=PAGE_FIELDS)
+
+	# Rhymes are collected while the words are loaded, since far fewer entries have rhymes than not
+	rhyme_rows = []
+
+	def word_rows() -> collections.abc.Iterator[tuple]:
+		for page_id, title, part_of_speech, rhymes in results:
+			frequency = None if frequencies is None else frequencies.get(title, 0)
+			yield page_id, title, part_of_speech, frequency
+			rows = {}
+			for rhyme, syllable_counts in rhymes:
+				for syllable_count in syllable_counts or [None]:
+					syllables = int(syllable_count) if syllable_count and syllable_count.strip().isdigit() else None
+					rows[(rhyme, page_id, syllables)] = None
+			rhyme_rows.extend(rows)
+
+	with contextlib.closing(parsing.build_db.connect_for_loading(db_path)) as connection:
+		parsing.build_db.load_table(connection, 'words', word_rows(), verbose, TABLES)
+		if verbose:
+			print('Loading rhymes:')
+		parsing.build_db.load_table(connection, 'rhymes', rhyme_rows, verbose, TABLES)
+		parsing.build_db.load_table(connection, 'info', [('language', language)], tables=TABLES)
+
+class RhymeDB:
+	'''Answers questions about rhymes from a database built by this module, reading only the rows needed.'''
+
+	def __init__(self, db_path: str):
+		self.connection = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+		self.language = self.connection.execute("SELECT value FROM info WHERE key = 'language'").fetchone()[0]
+
+	def __enter__(self) -> 'RhymeDB':
+		return self
+
+	def __exit__(self, *exc_info) -> None:
+		self.close()
+
+	def close(self) -> None:
+		self.connection.close()
+
+	def rhymes(self, title: str) -> list[Rhyme]:
+		'''Returns the rhymes of the entry with the given title, with their syllable counts (None where none is given).'''
+		rows = self.connection.execute('SELECT rhyme, syllables FROM rhymes JOIN words ON word_id = id WHERE title = ? ORDER BY rhymes.rowid', (title,))
+		return [Rhyme(*row) for row in rows]
+
+	def words(self, rhyme: str, syllables: int | None = None, part_of_speech: str | None = None, limit: int | None = None) -> list[RhymingWord]:
+		'''Returns the words with a rhyme (optionally only those with the given syllable count and part of speech), most frequent first.'''
+		query = 'SELECT title, syllables, part_of_speech, frequency FROM rhymes JOIN words ON word_id = id WHERE rhyme = ?'
+		params = [rhyme]
+		if syllables is not None:
+			query += ' AND syllables = ?'
+			params.append(syllables)
+		if part_of_speech is not None:
+			query += ' AND part_of_speech = ?'
+			params.append(part_of_speech)
+		query += ' ORDER BY frequency IS NULL, frequency DESC, title'
+		if limit is not None:
+			query += ' LIMIT ?'
+			params.append(limit)
+		return [RhymingWord(*row) for row in self.connection.execute(query, params)]
+
+	def rhyming_words(self, title: str, limit: int | None = None) -> dict[Rhyme, list[RhymingWord]]:
+		'''Returns the other words that share each rhyme (and syllable count) of the entry with the given title.'''
+		rhyming = {}
+		for rhyme in self.rhymes(title):
+			rhyming[rhyme] = [word for word in self.words(rhyme.rhyme, rhyme.syllables, limit=None if limit is None else limit + 1) if word.title != title][:limit]
+		return rhyming
+
+	def words_missing_syllables(self) -> collections.abc.Iterator[str]:
+		'''Yields the titles of the entries that give rhymes but no syllable count (as a number) for any of them, in order of ID.'''
+		rows = self.connection.execute('SELECT id, title FROM rhymes JOIN words ON word_id = id GROUP BY id HAVING COUNT(syllables) = 0 ORDER BY id')
+		for _, title in rows:
+			yield title
+
+if __name__ == '__main__':
+	main()
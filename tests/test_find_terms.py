@@ -0,0 +1,42 @@
+import find_terms
+import parsing.parse_redirects
+import parsing.parse_stubs
+
+def make_term_filter(tmp_path, form_of_temps: set[str], senses: dict[int, list[find_terms.Sense]], bad_terms: set[int]) -> find_terms.TermFilter:
+	'''Returns a TermFilter with the given senses already loaded, rather than read from a pages file.'''
+	stubs_path = tmp_path / 'stubs.csv'
+	stubs_path.write_text('1|0|mouse\n2|0|mice\n3|0|cat\n', encoding='utf-8')
+	redirects_path = tmp_path / 'redirects.csv'
+	redirects_path.write_text('10|Template:pl of|11|Template:plural of\n', encoding='utf-8')
+	redirect_master = parsing.parse_redirects.RedirectMaster(str(redirects_path))
+	term_filter = find_terms.TermFilter.__new__(find_terms.TermFilter)
+	term_filter.stub_master = parsing.parse_stubs.StubMaster(str(stubs_path))
+	term_filter.redirect_master = redirect_master
+	term_filter.form_of_temps = find_terms.template_aliases(redirect_master, form_of_temps)
+	term_filter.senses = senses
+	term_filter.label_lang = 'English'
+	term_filter.exclude_labels = set()
+	term_filter.exclude_temps = set()
+	term_filter.bad_terms = bad_terms
+	term_filter.accepted = None
+	return term_filter
+
+def test_template_aliases(tmp_path):
+	redirect_master = make_term_filter(tmp_path, set(), {}, set()).redirect_master
+	assert find_terms.template_aliases(redirect_master, {'plural of'}) == {'plural of', 'pl of'}
+	assert find_terms.template_aliases(redirect_master, {'Template:plural of', 'en-noun'}) == {'plural of', 'pl of', 'en-noun'}
+
+def test_redirected_form_of_template(tmp_path):
+	# "mice" is only defined through a redirect to a form-of template, so it is only accepted if "mouse" is
+	senses = {
+		1: [find_terms.Sense(temps=(), labels=())],
+		2: [find_terms.Sense(temps=(('pl of', 'mouse'),), labels=())],
+		3: [find_terms.Sense(temps=(), labels=())],
+	}
+	term_filter = make_term_filter(tmp_path, {'plural of'}, senses, bad_terms={1})
+	assert term_filter.form_of_target(senses[2][0]) == 'mouse'
+	assert not term_filter.check_entry('mouse')
+	assert not term_filter.check_entry('mice')
+	assert term_filter.check_entry('cat')
+	term_filter = make_term_filter(tmp_path, {'plural of'}, senses, bad_terms=set())
+	assert term_filter.check_entry('mice')
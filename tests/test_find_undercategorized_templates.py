@@ -0,0 +1,51 @@
+import contextlib
+
+import find_undercategorized_templates
+import parsing.build_db
+import parsing.parse_cats
+import parsing.parse_redirects
+import parsing.parse_stubs
+
+def write_fixture(tmp_path) -> tuple[str, str, str]:
+	'''Writes stubs, categories and redirects files, and returns their paths.'''
+	stubs_path = tmp_path / 'stubs.csv'
+	stubs_path.write_text(''.join(f'{line}\n' for line in [
+		'1|10|en-noun',
+		'2|10|plural of',
+		'3|10|pl of',
+		'4|10|documented',
+		'5|10|undoc',
+		'6|10|en-noun/documentation',
+		'7|0|plural of',
+		'8|0|undoc',
+		'9|14|Form-of templates',
+		'20|14|Templates and modules needing documentation',
+	]), encoding='utf-8')
+	cats_path = tmp_path / 'cats.csv'
+	cats_path.write_text(''.join(f'{line}\n' for line in [
+		'9|Form-of templates|2|10|plural of',
+		'20|Templates and modules needing documentation|5|10|undoc',
+		'20|Templates and modules needing documentation|1|10|en-noun',
+		'9|Form-of templates|4|10|documented',
+		# A page in another namespace with the same title as a template does not categorize it
+		'9|Form-of templates|8|0|undoc',
+	]), encoding='utf-8')
+	redirects_path = tmp_path / 'redirects.csv'
+	redirects_path.write_text(''.join(f'{line}\n' for line in [
+		'3|Template:pl of|2|Template:plural of',
+		# A redirect in another namespace with the same title as a template does not make it a redirect
+		'8|undoc|7|plural of',
+	]), encoding='utf-8')
+	return str(stubs_path), str(cats_path), str(redirects_path)
+
+def test_csv_and_db_agree(tmp_path):
+	stubs_path, cats_path, redirects_path = write_fixture(tmp_path)
+	db_path = str(tmp_path / 'wiktionary.db')
+	with contextlib.closing(parsing.build_db.connect_for_loading(db_path)) as connection:
+		parsing.build_db.load_table(connection, 'stubs', parsing.parse_stubs.stubs_gen(stubs_path))
+		parsing.build_db.load_table(connection, 'cats', parsing.parse_cats.cats_gen(cats_path))
+		parsing.build_db.load_table(connection, 'redirects', parsing.parse_redirects.redirects_gen(redirects_path))
+
+	from_csv = find_undercategorized_templates.find_undercategorized(stubs_path, cats_path, redirects_path)
+	from_db = find_undercategorized_templates.find_undercategorized_from_db(db_path)
+	assert from_csv == from_db == {'en-noun', 'undoc'}
@@ -0,0 +1,43 @@
+import pytest
+
+import parsing.plain_text
+
+def test_strip_blocks_templates():
+	assert parsing.plain_text.strip_blocks('a {{t|x|{{u|y}}}} b') == 'a  b'
+	assert parsing.plain_text.strip_blocks('a {{{1|{{t}}}}} b') == 'a  b'
+	assert parsing.plain_text.strip_blocks('a {{#if:{{{1|}}}|x|y}} b') == 'a  b'
+
+def test_strip_blocks_unmatched_braces():
+	assert parsing.plain_text.strip_blocks('a }} b') == 'a }} b'
+	# An unclosed template runs to the end of the text
+	assert parsing.plain_text.strip_blocks('a {{t|b') == 'a '
+
+def test_strip_blocks_comments_and_refs():
+	assert parsing.plain_text.strip_blocks('a<!-- {{t}} -->b') == 'ab'
+	assert parsing.plain_text.strip_blocks('a<ref name="x">{{cite}} c</ref>b<ref name="y" />c') == 'abc'
+	assert parsing.plain_text.strip_blocks('a<!-- unclosed') == 'a'
+
+def test_strip_blocks_nowiki():
+	assert parsing.plain_text.strip_blocks('a <nowiki>{{t}}</nowiki> b') == 'a {{t}} b'
+	assert parsing.plain_text.strip_blocks('{{t|<nowiki>}}</nowiki>}} b') == ' b'
+
+def test_strip_blocks_tables():
+	text = 'a\n{| class="wikitable"\n| cell {{t}}\n|-\n|\n{|\n| inner\n|}\n|}\nb'
+	assert parsing.plain_text.strip_blocks(text) == 'a\n\nb'
+	# Closing a table also closes any templates left open inside it
+	assert parsing.plain_text.strip_blocks('a\n{|\n| {{t|\n|}\nb') == 'a\n\nb'
+	assert parsing.plain_text.strip_blocks('a\n|}\nb') == 'a\n|}\nb'
+
+def test_plain_text_links():
+	text = '[[cat]]s and [[dog|hound]] [[:Category:Nouns]] [[Category:Nouns|sortkey]] [[File:x.png|thumb|caption]]'
+	assert parsing.plain_text.plain_text(text, 'markup') == 'cats and hound Category:Nouns  '
+	assert parsing.plain_text.plain_text(text, 'text') == 'cats and hound Category:Nouns  '
+
+def test_plain_text_text_fidelity():
+	text = "== Heading ==\n'''bold''' ''italic'' <span class=\"x\">in</span> [https://example.org label] [https://example.org] &amp; &#233;"
+	assert parsing.plain_text.plain_text(text, 'text') == 'Heading\nbold italic in label  & é'
+	assert parsing.plain_text.plain_text(text, 'markup') == text
+
+def test_plain_text_unknown_fidelity():
+	with pytest.raises(ValueError):
+		parsing.plain_text.plain_text('a', 'html')
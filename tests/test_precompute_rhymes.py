@@ -0,0 +1,44 @@
+import random
+import re
+
+import precompute_rhymes
+
+def old_siblings(lines: list[str], rhyme: str) -> list[str]:
+	'''The lines that the grep pattern replaced by RhymeIndex matched.'''
+	pattern = re.compile(f'(ˈ|/[ˈ{precompute_rhymes.CONSONANTS}]*){rhyme}/')
+	return [line for line in lines if pattern.search(line)]
+
+def write_index(tmp_path, lines: list[str]) -> precompute_rhymes.RhymeIndex:
+	prons_path = tmp_path / 'prons.txt'
+	prons_path.write_text(''.join(line + '\n' for line in lines), encoding='utf-8')
+	return precompute_rhymes.RhymeIndex(str(prons_path))
+
+def test_siblings(tmp_path):
+	lines = [
+		'cat: /kæt/',
+		'bat: /bæt/',
+		'combat: /ˈkɒmbæt/',
+		'acrobat: /ˈækɹəbæt/',
+		'splat: /splæt/',
+		'that: /ðæt/, /ðət/',
+		'at: /æt/',
+		'sat: /ˈsæt/',
+		'fur: /fɜː(ɹ)/',
+		'stir: /stɜːɹ/',
+	]
+	index = write_index(tmp_path, lines)
+	for rhyme in ['æt', 'ət', 'ɜːɹ', 'ɜː(ɹ)', 't', 'kæt', 'ɒmbæt']:
+		assert index.siblings(rhyme) == old_siblings(lines, rhyme), rhyme
+	assert index.siblings('æt') == ['cat: /kæt/', 'bat: /bæt/', 'splat: /splæt/', 'that: /ðæt/, /ðət/', 'at: /æt/', 'sat: /ˈsæt/']
+	assert index.siblings('ɪŋ') == []
+
+def test_siblings_random(tmp_path):
+	rng = random.Random(0)
+	chars = precompute_rhymes.CONSONANTS[:8] + precompute_rhymes.VOWELS[:6] + 'ˈː'
+	lines = [f'w{i}: ' + ', '.join('/' + ''.join(rng.choice(chars) for _ in range(rng.randint(1, 6))) + '/' for _ in range(rng.randint(1, 2))) for i in range(2000)]
+	index = write_index(tmp_path, lines)
+	rhyme_chars = chars.replace('ˈ', '')
+	rhymes = {''.join(rng.choice(rhyme_chars) for _ in range(rng.randint(1, 3))) for _ in range(300)}
+	for rhyme in rhymes:
+		assert index.siblings(rhyme) == old_siblings(lines, rhyme), rhyme
+	assert index.find_siblings(rhymes) == {rhyme: old_siblings(lines, rhyme) for rhyme in rhymes}
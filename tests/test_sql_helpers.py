@@ -0,0 +1,54 @@
+import time
+
+import parsing.sql_helpers
+
+def test_parse_insert_values():
+	line = b"INSERT INTO `page` VALUES (1,0,'Foo',-2,3.5,NULL,''),(2,14,'English nouns',0,-0.25,NULL,'x');\n"
+	assert list(parsing.sql_helpers.parse_insert(line)) == [
+		(1, 0, 'Foo', -2, 3.5, None, ''),
+		(2, 14, 'English nouns', 0, -0.25, None, 'x'),
+	]
+
+def test_parse_insert_quoted_punctuation():
+	# Parentheses, commas and escaped quotes inside strings must not end a value or a row
+	line = b"INSERT INTO `page` VALUES (1,'a (b), c','it\\'s','\\\\'),(2,')','(','a\\\"b');\n"
+	assert list(parsing.sql_helpers.parse_insert(line)) == [
+		(1, 'a (b), c', "it's", '\\'),
+		(2, ')', '(', 'a"b'),
+	]
+
+def test_parse_insert_escapes():
+	line = b"INSERT INTO `t` VALUES (1,'a\\nb\\tc\\0d\\Ze\\rf\\bg');\n"
+	assert list(parsing.sql_helpers.parse_insert(line)) == [(1, 'a\nb\tc\0d\x1ae\rf\bg')]
+
+def test_parse_insert_utf8():
+	line = "INSERT INTO `t` VALUES (1,'ɡʊd'),(2,'日本');\n".encode('utf-8')
+	assert list(parsing.sql_helpers.parse_insert(line)) == [(1, 'ɡʊd'), (2, '日本')]
+
+def test_parse_insert_columns():
+	line = b"INSERT INTO `categorylinks` VALUES (10,'Nouns','SORT\\'KEY','2020-01-01 00:00:00','','uppercase','page'),(11,'Verbs','B','2020-01-01 00:00:00','','uppercase','subcat');\n"
+	assert list(parsing.sql_helpers.parse_insert(line, columns=(6, 0, 1))) == [('page', 10, 'Nouns'), ('subcat', 11, 'Verbs')]
+	assert list(parsing.sql_helpers.parse_insert(line, columns=(2,), binary_columns={2})) == [(b"SORT'KEY",), (b'B',)]
+
+def test_parse_insert_not_insert():
+	assert list(parsing.sql_helpers.parse_insert(b'CREATE TABLE `page` (\n')) == []
+
+def test_parse_sql(tmp_path):
+	sql_path = tmp_path / 'dump.sql'
+	sql_path.write_bytes(
+		b"-- MySQL dump\n"
+		b"CREATE TABLE `t` (`id` int);\n"
+		b"INSERT INTO `t` VALUES (1,'a'),(2,'b');\n"
+		b"INSERT INTO `t` VALUES (3,'c');\n"
+		b"UNLOCK TABLES;\n"
+	)
+	assert list(parsing.sql_helpers.parse_sql(str(sql_path))) == [(1, 'a'), (2, 'b'), (3, 'c')]
+	chunks = parsing.sql_helpers.split_sql(str(sql_path), 4)
+	assert [row for start, end in chunks for row in parsing.sql_helpers.parse_sql_range(str(sql_path), start, end)] == [(1, 'a'), (2, 'b'), (3, 'c')]
+
+def test_parse_insert_unterminated_row():
+	# A row without a closing parenthesis used to make the row pattern backtrack exponentially
+	line = b"INSERT INTO `t` VALUES (1,'a'),(" + b"1," * 10 ** 4 + b"'b\\'c"
+	start = time.perf_counter()
+	assert list(parsing.sql_helpers.parse_insert(line)) == [(1, 'a')]
+	assert time.perf_counter() - start < 1